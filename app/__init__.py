@@ -1,48 +1,85 @@
 from __future__ import annotations
 
+from pathlib import Path
+
 from flask import Flask
 from .config import Config
-from .extensions import db, login_manager
+from .extensions import assets, db, events, login_manager, page_cache, storage, user_cache
 
-def create_app() -> Flask:
+def create_app(config: dict | None = None) -> Flask:
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_object(Config())
+    if config:
+        app.config.update(config)
+
+    proxies = int(app.config.get("OLDTUBE_PROXY_FIX", 0))
+    if proxies > 0:
+        # request.remote_addr is the client, not the proxy in front of us
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+
+    if app.config.get("OLDTUBE_JINJA_CACHE_DIR"):
+        # must be in place before anything touches app.jinja_env
+        from jinja2 import FileSystemBytecodeCache
+        cache_dir = Path(app.config["OLDTUBE_JINJA_CACHE_DIR"])
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache(str(cache_dir))}
 
     # ensure folders
     app.config["UPLOADS_DIR"].mkdir(parents=True, exist_ok=True)
     app.config["VIDEOS_DIR"].mkdir(parents=True, exist_ok=True)
     app.config["THUMBS_DIR"].mkdir(parents=True, exist_ok=True)
-    (Config.SQLALCHEMY_DATABASE_URI.split("///",1)[1])
 
+    from .database import engine_options, init_database
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app)
     db.init_app(app)
+    init_database(app, db)
     login_manager.init_app(app)
+    page_cache.init_app(app)
+    user_cache.init_app(app)
+    storage.init_app(app)
+    assets.init_app(app)
+    events.init_app(app)
+
+    from .passwords import init_auth
+    init_auth(app)
+
+    from .instrumentation import init_instrumentation
+    init_instrumentation(app)
+
+    from .rankings import activity
+    activity.init_app(app)
 
     from .blueprints.auth.routes import bp as auth_bp
     from .blueprints.videos.routes import bp as videos_bp
     from .blueprints.profile.routes import bp as profile_bp
     from .blueprints.admin.routes import bp as admin_bp
     from .blueprints.extras.routes import bp as extras_bp
+    from .blueprints.uploads.routes import bp as uploads_bp
+    from .blueprints.api.routes import bp as api_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(videos_bp)
     app.register_blueprint(profile_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(extras_bp)
+    app.register_blueprint(uploads_bp)
+    app.register_blueprint(api_bp)
+
+    from .commands import register_commands
+    register_commands(app)
+
+    from .utils import format_ts
+    app.add_template_filter(format_ts, "ts")
 
     with app.app_context():
-        db.create_all()
-        _seed_admin()
+        from .schema import migrate, schema_is_current, seed_admin
+        # one pragma read when the schema is current; DDL and seeding only otherwise
+        if not schema_is_current():
+            if not app.config.get("OLDTUBE_AUTO_MIGRATE", True):
+                # not fatal: `flask init-db` itself has to be able to load the app
+                app.logger.warning("database schema is out of date; run `flask --app run init-db`")
+            elif migrate():
+                seed_admin()
 
     return app
-
-def _seed_admin():
-    import os
-    from werkzeug.security import generate_password_hash
-    from .models import User
-    from .extensions import db
-
-    admin_user = os.environ.get("OLDTUBE_ADMIN_USER", "admin")
-    admin_pass = os.environ.get("OLDTUBE_ADMIN_PASS", "admin")
-    if User.query.filter_by(username=admin_user).first() is None:
-        db.session.add(User(username=admin_user, password_hash=generate_password_hash(admin_pass), is_admin=True))
-        db.session.commit()
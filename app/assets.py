@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+from pathlib import Path
+from typing import Optional
+
+from flask import Flask, Response, current_app, request, send_from_directory
+
+MANIFEST = "manifest.json"
+IMMUTABLE = "public, max-age=31536000, immutable"
+# worth compressing; images and fonts already are
+COMPRESSIBLE = {".css", ".js", ".svg", ".txt", ".json", ".html", ".xml", ".ico", ".map"}
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")?#]+)([^'")]*)\1\s*\)""")
+
+
+def hashed_name(name: str, data: bytes) -> str:
+    """"css/old.css" -> "css/old.3fa2c1d0e9ab.css" """
+    stem, ext = posixpath.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def _rewrite_css(name: str, data: bytes, manifest: dict[str, str]) -> bytes:
+    # point url(...) references at the fingerprinted copies
+    base = posixpath.dirname(name)
+
+    def sub(m: re.Match) -> str:
+        ref = m.group(2)
+        if ref.startswith(("/", "data:", "http:", "https:")):
+            return m.group(0)
+        target = posixpath.normpath(posixpath.join(base, ref))
+        if target not in manifest:
+            return m.group(0)
+        new = posixpath.relpath(manifest[target], base or ".")
+        return f"url({m.group(1)}{new}{m.group(3)}{m.group(1)})"
+
+    return _CSS_URL.sub(sub, data.decode("utf-8")).encode("utf-8")
+
+
+def _compress(path: Path, data: bytes) -> list[str]:
+    written = []
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        path.with_name(path.name + ".gz").write_bytes(gz)
+        written.append("gzip")
+    try:
+        import brotli
+    except ImportError:
+        return written
+    br = brotli.compress(data, quality=11)
+    if len(br) < len(data):
+        path.with_name(path.name + ".br").write_bytes(br)
+        written.append("br")
+    return written
+
+
+def collect_static(src: Path, dest: Path, clean: bool = False) -> dict[str, str]:
+    """Copy every file in `src` to `dest` under a content-hashed name, with
+    .gz and .br (when the brotli package is installed) variants of text
+    files, then write the name -> hashed name manifest. Returns the manifest.
+
+    Earlier builds' files are kept unless `clean` is set: pages rendered by
+    workers still running the old manifest (or cached) keep pointing at them.
+    Stylesheets go last so their url() references can be rewritten first.
+    """
+    names = sorted(p.relative_to(src).as_posix() for p in src.rglob("*")
+                   if p.is_file() and not p.name.startswith("."))
+    names.sort(key=lambda n: n.endswith(".css"))
+    manifest: dict[str, str] = {}
+    for name in names:
+        data = (src / name).read_bytes()
+        if name.endswith(".css"):
+            data = _rewrite_css(name, data, manifest)
+        out = hashed_name(name, data)
+        path = dest / out
+        if not path.is_file():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_bytes(data)
+            if path.suffix.lower() in COMPRESSIBLE:
+                _compress(path, data)
+            # the plain file last: its presence marks the variants as complete
+            os.replace(tmp, path)
+        manifest[name] = out
+    tmp = dest / (MANIFEST + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    os.replace(tmp, dest / MANIFEST)
+    if clean:
+        keep = {MANIFEST} | {f"{n}{v}" for n in manifest.values() for v in ("", ".gz", ".br")}
+        for p in dest.rglob("*"):
+            if p.is_file() and p.relative_to(dest).as_posix() not in keep:
+                p.unlink()
+    return manifest
+
+
+class StaticAssets:
+    """Fingerprinted static files built by `flask collect-static`.
+
+    With a build present, `url_for('static', filename='css/old.css')` yields
+    the hashed name, and those names are served from the build directory
+    with `immutable` caching, as brotli or gzip when the client accepts it.
+    Without a build (or for names not in it) the plain files in app/static
+    are served as before.
+    """
+
+    def __init__(self) -> None:
+        self.manifest: dict[str, str] = {}
+        self.build_dir: Optional[Path] = None
+
+    def init_app(self, app: Flask) -> None:
+        self.build_dir = Path(app.config["OLDTUBE_STATIC_BUILD_DIR"])
+        if app.config.get("OLDTUBE_STATIC_FINGERPRINT", True):
+            self.load()
+        app.url_defaults(self._url_defaults)
+        app.view_functions["static"] = self.serve
+        app.extensions["oldtube_assets"] = self
+
+    def load(self) -> None:
+        try:
+            self.manifest = json.loads((self.build_dir / MANIFEST).read_text())
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def _url_defaults(self, endpoint: str, values: dict) -> None:
+        if endpoint == "static" and values.get("filename") in self.manifest:
+            values["filename"] = self.manifest[values["filename"]]
+
+    def serve(self, filename: str) -> Response:
+        # any build's file, not just this manifest's: during a rolling restart
+        # pages from workers on the new build arrive here too
+        if filename == MANIFEST or not (self.build_dir / filename).is_file():
+            return current_app.send_static_file(filename)
+        accepted = request.accept_encodings
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if accepted[encoding] and (self.build_dir / (filename + suffix)).is_file():
+                break
+        else:
+            encoding, suffix = None, ""
+        mimetype, _ = mimetypes.guess_type(filename)
+        rv = send_from_directory(self.build_dir, filename + suffix, conditional=True,
+                                 mimetype=mimetype or "application/octet-stream")
+        if encoding:
+            rv.headers["Content-Encoding"] = encoding
+        rv.headers["Cache-Control"] = IMMUTABLE
+        rv.vary.add("Accept-Encoding")
+        return rv
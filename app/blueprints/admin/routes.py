@@ -1,7 +1,13 @@
 from __future__ import annotations
-from flask import Blueprint, render_template, redirect, url_for, flash
+import hmac
+from flask import Blueprint, Response, abort, current_app, render_template, redirect, request, url_for, flash
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
+from ...extensions import page_cache, user_cache
+from ...instrumentation import metrics
+from ...passwords import account_limiter, ip_limiter, username_limiter
 from ...models import User, Video
+from ...pagination import paginate_keyset
 
 bp = Blueprint("admin", __name__, url_prefix="/admin")
 
@@ -14,6 +20,24 @@ def dashboard():
     if not _is_admin():
         flash("Admins only.", "err")
         return redirect(url_for("videos.home"))
-    videos = Video.query.order_by(Video.id.desc()).limit(200).all()
-    users = User.query.order_by(User.id.desc()).limit(200).all()
-    return render_template("admin.html", videos=videos, users=users, user=current_user)
+    vpage = paginate_keyset(Video.query.options(joinedload(Video.uploader)), Video.id, prefix="v_")
+    upage = paginate_keyset(User.query, User.id, prefix="u_")
+    return render_template("admin.html", videos=vpage.items, vpage=vpage, users=upage.items, upage=upage,
+                           cache_stats=page_cache.stats(), user_cache_stats=user_cache.stats(), endpoint_stats=metrics.endpoint_summary(),
+                           user=current_user)
+
+@bp.get("/metrics")
+def metrics_text():
+    token = current_app.config.get("OLDTUBE_METRICS_TOKEN")
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not (_is_admin() or (token and hmac.compare_digest(supplied.encode(), token.encode()))):
+        abort(403)
+    for key, value in page_cache.stats().items():
+        if isinstance(value, (int, float)):
+            metrics.set(f"oldtube_page_cache_{key}", value)
+    for key, value in user_cache.stats().items():
+        metrics.set(f"oldtube_user_cache_{key}", value)
+    metrics.set("oldtube_auth_throttled", ip_limiter.rejected, bucket="ip")
+    metrics.set("oldtube_auth_throttled", username_limiter.rejected, bucket="username")
+    metrics.set("oldtube_auth_throttled", account_limiter.rejected, bucket="account")
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,85 @@
+from __future__ import annotations
+from flask import Blueprint, request, jsonify
+from flask_login import current_user
+
+from ...interactions import InteractionError, apply_actions, parse_action
+
+bp = Blueprint("api", __name__, url_prefix="/api")
+
+# one request applies at most this many actions
+MAX_BATCH = 100
+
+
+@bp.before_request
+def _require_login():
+    # a JSON 401 rather than login_required's redirect to the home page
+    if not current_user.is_authenticated:
+        return jsonify(error="login required"), 401
+
+
+@bp.errorhandler(InteractionError)
+def _interaction_error(e: InteractionError):
+    if e.index is None:
+        return jsonify(error=str(e)), e.status
+    return jsonify(error=str(e), index=e.index), e.status
+
+
+def _json_object() -> dict:
+    # an empty or unparsable body counts as {}, but a list or scalar is a 400
+    body = request.get_json(silent=True)
+    if body is None:
+        return {}
+    if not isinstance(body, dict):
+        raise InteractionError("request body must be a JSON object")
+    return body
+
+
+def _apply(video_id: int, action: str, *fields: str, status: int = 200):
+    body = _json_object()
+    data = {k: body.get(k) for k in fields}
+    data.update(action=action, video_id=video_id)
+    result = apply_actions(current_user, [parse_action(data)])
+    out = result["results"][0]
+    out["counts"] = result["videos"][str(video_id)]
+    return jsonify(out), status
+
+
+@bp.put("/videos/<int:video_id>/like")
+def like(video_id: int):
+    return _apply(video_id, "like")
+
+
+@bp.delete("/videos/<int:video_id>/like")
+def unlike(video_id: int):
+    return _apply(video_id, "unlike")
+
+
+@bp.put("/videos/<int:video_id>/favorite")
+def favorite(video_id: int):
+    return _apply(video_id, "favorite")
+
+
+@bp.delete("/videos/<int:video_id>/favorite")
+def unfavorite(video_id: int):
+    return _apply(video_id, "unfavorite")
+
+
+@bp.put("/videos/<int:video_id>/rating")
+def rate(video_id: int):
+    return _apply(video_id, "rate", "stars")
+
+
+@bp.post("/videos/<int:video_id>/comments")
+def comment(video_id: int):
+    return _apply(video_id, "comment", "body", status=201)
+
+
+@bp.post("/interactions")
+def batch():
+    """{"actions": [{"action": "like", "video_id": 1}, ...]}, all or nothing."""
+    actions = _json_object().get("actions")
+    if not isinstance(actions, list) or not actions:
+        raise InteractionError("actions must be a non-empty list")
+    if len(actions) > MAX_BATCH:
+        raise InteractionError(f"at most {MAX_BATCH} actions per request", 413)
+    return jsonify(apply_actions(current_user, [parse_action(a, i) for i, a in enumerate(actions)]))
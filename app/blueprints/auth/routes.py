@@ -2,21 +2,36 @@ from __future__ import annotations
 import re
 from flask import Blueprint, redirect, url_for, request, flash, render_template
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import TooManyRequests
 
 from ...extensions import db
 from ...models import User
+from ...passwords import account_limiter, hasher, ip_limiter, username_limiter
 
 bp = Blueprint("auth", __name__, url_prefix="/auth")
 
+def _throttle(*keys: str) -> None:
+    # checked before any hashing, so a flood costs a dict lookup, not a CPU core
+    wait = max(limiter.hit(key) for limiter, key in zip((ip_limiter, username_limiter, account_limiter), keys))
+    if wait:
+        raise TooManyRequests("Too many attempts; try again in a minute.", retry_after=int(wait) + 1)
+
 @bp.post("/login")
 def login():
     username = (request.form.get("username") or "").strip().lower()
     password = (request.form.get("password") or "").strip()
+    ip = request.remote_addr
+    # the tight username bucket is per client, so guessing at an account from
+    # elsewhere can't lock its owner out; the looser account bucket still caps
+    # guesses spread over many addresses, and the IP bucket caps each client
+    _throttle(f"ip:{ip}", f"user:{username}|{ip}", f"account:{username}")
     u = User.query.filter_by(username=username).first()
-    if not u or not check_password_hash(u.password_hash, password):
+    if not hasher.verify(u.password_hash if u else None, password):
         flash("Invalid username or password.", "err")
         return redirect(url_for("videos.home"))
+    if hasher.needs_rehash(u.password_hash):
+        u.password_hash = hasher.hash_async(password)
+        db.session.commit()
     login_user(u)
     flash("Logged in.", "ok")
     return redirect(url_for("videos.home"))
@@ -31,6 +46,7 @@ def register_page():
 def register():
     username = (request.form.get("username") or "").strip().lower()
     password = (request.form.get("password") or "").strip()
+    _throttle(f"ip:{request.remote_addr}")
 
     if not re.match(r"^[a-z0-9_]{3,20}$", username or ""):
         flash("Username: 3-20 (a-z, 0-9, _).", "err")
@@ -42,7 +58,7 @@ def register():
         flash("Username already taken.", "err")
         return redirect(url_for("videos.home"))
 
-    u = User(username=username, password_hash=generate_password_hash(password), is_admin=False)
+    u = User(username=username, password_hash=hasher.hash_async(password), is_admin=False)
     db.session.add(u)
     db.session.commit()
     login_user(u)
@@ -1,12 +1,26 @@
 from __future__ import annotations
-from flask import Blueprint, render_template, redirect, url_for, request, flash, abort
+from flask import Blueprint, Response, current_app, render_template, redirect, url_for, request, flash, abort
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
 
-from ...extensions import db
+from ...events import SSE_HEADERS, sse_frame
+from ...extensions import db, events, page_cache
+from ...interactions import set_favorite
 from ...models import Video, Favorite, Message, User
+from ...pagination import paginate_keyset
+from ...rankings import activity
 
 bp = Blueprint("extras", __name__)
 
+# watch pages a single /events stream may follow
+MAX_EVENT_VIDEOS = 4
+
+def _unread_count(user_id: int) -> int:
+    # answered from the partial index over unread rows
+    return (db.session.query(db.func.count(Message.id))
+            .filter(Message.recipient_id == user_id, ~Message.is_read)
+            .scalar())
+
 @bp.get("/help")
 def help_page():
     return render_template("help.html", user=current_user)
@@ -14,52 +28,46 @@ def help_page():
 @bp.get("/favorites")
 @login_required
 def favorites():
-    favs = (Favorite.query
-            .filter_by(user_id=current_user.id)
-            .order_by(Favorite.id.desc())
-            .limit(200)
-            .all())
-    video_ids = [f.video_id for f in favs]
-    videos = []
-    if video_ids:
-        vids = {v.id: v for v in Video.query.filter(Video.id.in_(video_ids)).all()}
-        videos = [vids.get(i) for i in video_ids if i in vids]
-    return render_template("favorites.html", videos=videos, user=current_user)
+    query = (db.session.query(Video, Favorite.id.label("fav_id"))
+             .join(Favorite, Favorite.video_id == Video.id)
+             .options(joinedload(Video.uploader))
+             .filter(Favorite.user_id == current_user.id))
+    page = paginate_keyset(query, Favorite.id, key_of=lambda row: row.fav_id)
+    videos = [v for v, _fav_id in page.items]
+    return render_template("favorites.html", videos=videos, page=page, user=current_user)
 
 @bp.post("/favorite/<int:video_id>")
 @login_required
 def toggle_favorite(video_id: int):
     v = Video.query.get_or_404(video_id)
-    existing = Favorite.query.filter_by(video_id=v.id, user_id=current_user.id).first()
-    if existing:
-        db.session.delete(existing)
-        db.session.commit()
-        flash("Removed from favorites.", "ok")
-    else:
-        db.session.add(Favorite(video_id=v.id, user_id=current_user.id))
-        db.session.commit()
+    # delete first: no row removed means it wasn't a favorite yet
+    added = not set_favorite(current_user.id, v.id, False)
+    if added:
+        set_favorite(current_user.id, v.id, True)
+    db.session.commit()
+    if added:
+        activity.record(v.id, "favorite")
         flash("Added to favorites.", "ok")
+    else:
+        flash("Removed from favorites.", "ok")
+    page_cache.invalidate(f"video:{v.id}")
     return redirect(url_for("videos.watch", video_id=v.id))
 
 @bp.get("/messages")
 @login_required
 def inbox():
-    msgs = (Message.query
-            .filter_by(recipient_id=current_user.id)
-            .order_by(Message.id.desc())
-            .limit(200)
-            .all())
-    return render_template("messages_inbox.html", messages=msgs, user=current_user)
+    page = paginate_keyset(Message.query
+                           .options(joinedload(Message.sender))
+                           .filter_by(recipient_id=current_user.id), Message.id)
+    return render_template("messages_inbox.html", messages=page.items, page=page, user=current_user)
 
 @bp.get("/messages/sent")
 @login_required
 def sent():
-    msgs = (Message.query
-            .filter_by(sender_id=current_user.id)
-            .order_by(Message.id.desc())
-            .limit(200)
-            .all())
-    return render_template("messages_sent.html", messages=msgs, user=current_user)
+    page = paginate_keyset(Message.query
+                           .options(joinedload(Message.recipient))
+                           .filter_by(sender_id=current_user.id), Message.id)
+    return render_template("messages_sent.html", messages=page.items, page=page, user=current_user)
 
 @bp.get("/messages/compose")
 @login_required
@@ -93,16 +101,65 @@ def send_message():
     m = Message(sender_id=current_user.id, recipient_id=recipient.id, subject=subject, body=body, is_read=False)
     db.session.add(m)
     db.session.commit()
+    events.publish(f"user:{recipient.id}", "message", {
+        "id": m.id,
+        "from": current_user.username,
+        "subject": subject,
+        "created_at": m.created_at,
+        "unread": _unread_count(recipient.id),
+    })
     flash("Message sent.", "ok")
     return redirect(url_for("extras.sent"))
 
 @bp.get("/messages/read/<int:msg_id>")
 @login_required
 def read_message(msg_id: int):
-    m = Message.query.get_or_404(msg_id)
+    m = Message.query.options(joinedload(Message.sender), joinedload(Message.recipient)).get_or_404(msg_id)
     if m.recipient_id != current_user.id and m.sender_id != current_user.id:
         abort(403)
+    html = render_template("messages_read.html", m=m, user=current_user)
     if m.recipient_id == current_user.id and not m.is_read:
+        # render first: committing expires `m` and would reload it plus both users
         m.is_read = True
         db.session.commit()
-    return render_template("messages_read.html", m=m, user=current_user)
+        # the badge in the reader's other tabs
+        events.publish(f"user:{current_user.id}", "unread", {"count": _unread_count(current_user.id)})
+    return html
+
+def open_event_stream(threaded: bool = True):
+    """This request's EventStream, or the Response turning it away.
+
+    Shared by the view below and the ASGI app (app/media_asgi.py), which
+    iterates the stream on its event loop (`threaded=False`).
+    """
+    channels = []
+    if current_user.is_authenticated or current_app.config.get("OLDTUBE_EVENTS_ANONYMOUS"):
+        channels = [f"video:{vid}" for vid in request.args.getlist("video", type=int)[:MAX_EVENT_VIDEOS]]
+    if current_user.is_authenticated:
+        channels.append(f"user:{current_user.id}")
+    if not channels:
+        # 204 tells EventSource not to reconnect
+        return Response("", 204)
+    sub = events.subscribe(channels, threaded=threaded)
+    if sub is None:
+        return Response("too many live connections", 503, headers={"Retry-After": "60"})
+    try:
+        # counted after subscribing, so no message can fall between the two
+        first = [sse_frame("unread", {"count": _unread_count(current_user.id)})] if current_user.is_authenticated else []
+    except Exception:
+        events.unsubscribe(sub)
+        raise
+    # the stream outlives the request; give its connection back now
+    db.session.remove()
+    return events.stream(sub, first)
+
+@bp.get("/events")
+def event_stream():
+    """Server-Sent Events: `message` and `unread` for the logged-in user, and
+    `comment` for each `?video=<id>` page being watched (anonymous viewers
+    only with OLDTUBE_EVENTS_ANONYMOUS). Each open stream holds a server
+    thread here, so at most OLDTUBE_EVENTS_WSGI_CLIENTS are let in."""
+    rv = open_event_stream()
+    if isinstance(rv, Response):
+        return rv
+    return Response(rv, mimetype="text/event-stream", headers=SSE_HEADERS)
@@ -1,7 +1,8 @@
 from __future__ import annotations
 from flask import Blueprint, render_template, redirect, url_for
 from flask_login import current_user
-from ...models import User, Video, Like, Comment
+from ...models import User, Video
+from ...pagination import paginate_keyset
 
 bp = Blueprint("profile", __name__)
 
@@ -14,7 +15,6 @@ def me():
 @bp.get("/u/<username>")
 def user_profile(username: str):
     u = User.query.filter_by(username=username).first_or_404()
-    vids = Video.query.filter_by(uploader_id=u.id).order_by(Video.id.desc()).limit(100).all()
-    likes = Like.query.filter_by(user_id=u.id).count()
-    comments = Comment.query.filter_by(user_id=u.id).count()
-    return render_template("profile.html", profile=u, videos=vids, likes=likes, comments=comments, user=current_user)
+    page = paginate_keyset(Video.query.filter_by(uploader_id=u.id), Video.id)
+    return render_template("profile.html", profile=u, videos=page.items, page=page,
+                           likes=u.like_count, comments=u.comment_count, user=current_user)
@@ -0,0 +1,112 @@
+from __future__ import annotations
+import re
+import secrets
+import time
+from flask import Blueprint, request, jsonify, current_app, url_for, abort
+from flask_login import login_required, current_user
+
+from ...extensions import db
+from ...models import UploadSession
+from ...uploads import UploadError, append_chunk, finalize, discard, gc_upload_sessions
+from ...utils import allowed_video, unique_name
+
+bp = Blueprint("uploads", __name__, url_prefix="/upload/sessions")
+
+@bp.errorhandler(UploadError)
+def _upload_error(e: UploadError):
+    return jsonify(error=str(e)), e.status
+
+def _session_or_404(session_id: str) -> UploadSession:
+    s = db.session.get(UploadSession, session_id)
+    if s is None or s.user_id != current_user.id:
+        abort(404)
+    return s
+
+def _state(s: UploadSession) -> dict:
+    return {
+        "id": s.id,
+        "offset": s.received,
+        "size": s.size,
+        "chunk_size": int(current_app.config["OLDTUBE_UPLOAD_CHUNK_BYTES"]),
+        "url": url_for("uploads.put_chunk", session_id=s.id),
+    }
+
+@bp.post("")
+@login_required
+def init():
+    data = request.get_json(silent=True)
+    if data is None:
+        data = request.form
+    elif not isinstance(data, dict):
+        raise UploadError("request body must be a JSON object")
+    title = str(data.get("title") or "").strip()[:120]
+    filename = str(data.get("filename") or "").strip()
+    checksum = str(data.get("sha256") or "").strip().lower() or None
+    try:
+        size = int(data.get("size") or 0)
+    except (TypeError, ValueError):
+        size = 0
+
+    if not title:
+        raise UploadError("Title is required.")
+    if not filename or not allowed_video(filename):
+        raise UploadError("Allowed: mp4, webm, ogg, mov, mkv")
+    if size <= 0:
+        raise UploadError("size must be a positive byte count")
+    if size > current_app.config["OLDTUBE_MAX_UPLOAD_BYTES"]:
+        raise UploadError("File too large.", 413)
+    if checksum and not re.match(r"^[0-9a-f]{64}$", checksum):
+        raise UploadError("sha256 must be 64 hex characters")
+
+    # cheap enough to do here, and keeps abandoned .part files from piling up
+    gc_upload_sessions()
+
+    base, ext = filename.rsplit(".", 1)
+    s = UploadSession(
+        id=secrets.token_hex(16),
+        user_id=current_user.id,
+        title=title,
+        original_name=filename[:200],
+        temp_name=unique_name(base, ext.lower()),
+        size=size,
+        received=0,
+        checksum=checksum,
+        updated_at=time.time(),
+    )
+    db.session.add(s)
+    db.session.commit()
+    return jsonify(_state(s)), 201
+
+@bp.get("/<session_id>")
+@login_required
+def status(session_id: str):
+    return jsonify(_state(_session_or_404(session_id)))
+
+@bp.put("/<session_id>")
+@login_required
+def put_chunk(session_id: str):
+    s = _session_or_404(session_id)
+    offset = request.args.get("offset", "")
+    if not offset.isdigit():
+        raise UploadError("offset query parameter is required")
+    if request.content_length is not None and request.content_length > current_app.config["OLDTUBE_UPLOAD_CHUNK_BYTES"]:
+        raise UploadError("Chunk too large.", 413)
+    received = append_chunk(s, int(offset), request.stream, request.content_length)
+    return jsonify(offset=received, size=s.size)
+
+@bp.post("/<session_id>/finalize")
+@login_required
+def finish(session_id: str):
+    v = finalize(_session_or_404(session_id))
+    return jsonify(
+        video_id=v.id,
+        status=v.status,
+        watch_url=url_for("videos.watch", video_id=v.id),
+        status_url=url_for("videos.video_status", video_id=v.id),
+    )
+
+@bp.delete("/<session_id>")
+@login_required
+def cancel(session_id: str):
+    discard(_session_or_404(session_id))
+    return jsonify(ok=True)
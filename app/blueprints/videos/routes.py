@@ -1,50 +1,97 @@
 from __future__ import annotations
 from pathlib import Path
-from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app, send_from_directory
+from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app, send_from_directory, jsonify, g
 from flask_login import current_user, login_required
-
-from ...extensions import db
-from ...models import Video, Comment, Rating
-from ...utils import allowed_video, allowed_image, unique_name, convert_to_mp4_if_needed, generate_thumbnail, send_file_range, ffmpeg_available
+from sqlalchemy.orm import joinedload
+
+from ... import interactions
+from ...extensions import db, page_cache, storage
+from ...models import Video, Comment, Rating, Job, Like, Favorite
+from ...login import skip_user_load
+from ...pagination import paginate_keyset
+from ...rankings import RANKING_KINDS, activity, count_view, is_direct_play, ranked_videos
+from ...search import search_video_ids
+from ...storage import CONTENT_KEY, content_key, save_stream
+from ...uploads import create_video
+from ...utils import allowed_video, allowed_image, unique_name, ffmpeg_available
 
 bp = Blueprint("videos", __name__)
 
+HLS_MIMETYPES = {".m3u8": "application/vnd.apple.mpegurl", ".ts": "video/mp2t"}
+
 @bp.get("/")
+@page_cache.cached("videos", "rankings")
 def home():
-    latest = Video.query.order_by(Video.id.desc()).limit(12).all()
-    return render_template("home.html", videos=latest, user=current_user, ffmpeg=ffmpeg_available())
+    latest = Video.query.options(joinedload(Video.uploader)).order_by(Video.id.desc()).limit(12).all()
+    return render_template("home.html", videos=latest, trending=ranked_videos("trending", 8),
+                           most_viewed=ranked_videos("most_viewed", 8), user=current_user, ffmpeg=ffmpeg_available())
+
+@bp.get("/trending")
+@page_cache.cached("rankings")
+def trending():
+    kind = request.args.get("by", "trending")
+    if kind not in RANKING_KINDS:
+        kind = "trending"
+    return render_template("trending.html", videos=ranked_videos(kind), kind=kind, user=current_user)
 
 @bp.get("/videos")
+@page_cache.cached("videos")
 def list_videos():
-    rows = Video.query.order_by(Video.id.desc()).all()
-    return render_template("videos.html", videos=rows, user=current_user)
+    page = paginate_keyset(Video.query.options(joinedload(Video.uploader)), Video.id)
+    return render_template("videos.html", videos=page.items, page=page, user=current_user)
+
+@bp.get("/search")
+def search():
+    q = (request.args.get("q") or "").strip()[:100]
+    page_no = request.args.get("page", "1")
+    page_no = min(int(page_no), 50) if page_no.isdigit() and int(page_no) > 0 else 1
+    size = int(current_app.config.get("OLDTUBE_PAGE_SIZE", 24))
+
+    videos = []
+    has_next = False
+    if q:
+        ids = search_video_ids(q, limit=size + 1, offset=(page_no - 1) * size)
+        has_next = len(ids) > size
+        ids = ids[:size]
+        if ids:
+            by_id = {v.id: v for v in Video.query.options(joinedload(Video.uploader)).filter(Video.id.in_(ids)).all()}
+            videos = [by_id[i] for i in ids if i in by_id]
+    return render_template("search.html", q=q, videos=videos, page_no=page_no, has_next=has_next, user=current_user)
 
 @bp.get("/watch/<int:video_id>")
+@count_view
+@page_cache.cached("video:{video_id}")
 def watch(video_id: int):
-    v = Video.query.get_or_404(video_id)
-
-    # rating summary (classic stars)
-    ratings = Rating.query.filter_by(video_id=v.id).all()
-    rating_count = len(ratings)
-    rating_avg = 0.0
-    if rating_count:
-        rating_avg = sum(r.stars for r in ratings) / float(rating_count)
+    v = Video.query.options(joinedload(Video.uploader)).get_or_404(video_id)
+    if v.status == "processing":
+        # finished by a worker process, which can't reach an in-memory cache
+        g.page_cache_skip = True
 
     user_rating = 0
+    liked = favorited = False
     if getattr(current_user, "is_authenticated", False):
         ur = Rating.query.filter_by(video_id=v.id, user_id=current_user.id).first()
         user_rating = ur.stars if ur else 0
+        liked = Like.query.filter_by(video_id=v.id, user_id=current_user.id).first() is not None
+        favorited = Favorite.query.filter_by(video_id=v.id, user_id=current_user.id).first() is not None
 
-    comments = Comment.query.filter_by(video_id=v.id).order_by(Comment.id.desc()).limit(200).all()
+    comments = (Comment.query
+                .options(joinedload(Comment.user))
+                .filter_by(video_id=v.id)
+                .order_by(Comment.id.desc())
+                .limit(200)
+                .all())
 
     return render_template(
         "watch.html",
         v=v,
         comments=comments,
         user=current_user,
-        rating_avg=rating_avg,
-        rating_count=rating_count,
+        rating_avg=v.rating_avg,
+        rating_count=v.rating_count,
         user_rating=user_rating,
+        liked=liked,
+        favorited=favorited,
     )
 
 
@@ -52,7 +99,8 @@ def watch(video_id: int):
 @login_required
 def upload_page():
     max_mb = int(current_app.config.get("MAX_CONTENT_LENGTH", 0) / (1024*1024))
-    return render_template("upload.html", user=current_user, max_mb=max_mb, ffmpeg=ffmpeg_available())
+    max_upload_mb = int(current_app.config.get("OLDTUBE_MAX_UPLOAD_BYTES", 0) / (1024*1024))
+    return render_template("upload.html", user=current_user, max_mb=max_mb, max_upload_mb=max_upload_mb, ffmpeg=ffmpeg_available())
 
 @bp.post("/upload")
 @login_required
@@ -78,41 +126,38 @@ def upload_post():
     in_ext = original.rsplit(".", 1)[1].lower()
     base = original.rsplit(".", 1)[0]
 
-    temp_name = unique_name(base, in_ext)
-    temp_path = videos_dir / temp_name
-    file.save(temp_path)
+    if thumb and thumb.filename and not allowed_image(thumb.filename):
+        flash("Thumbnail: png/jpg/jpeg/webp", "err")
+        return redirect(url_for("videos.upload_page"))
 
-    final_path, final_ext, conv_err = convert_to_mp4_if_needed(temp_path)
-    if conv_err:
-        flash(conv_err, "err")
+    # staged in VIDEOS_DIR for processing; hashed while saving for the dedupe check
+    temp_name = unique_name(base, in_ext)
+    digest = save_stream(file.stream, videos_dir / temp_name)
 
     thumb_name = None
     if thumb and thumb.filename:
-        if not allowed_image(thumb.filename):
-            flash("Thumbnail: png/jpg/jpeg/webp", "err")
-            return redirect(url_for("videos.upload_page"))
         t_ext = thumb.filename.rsplit(".", 1)[1].lower()
-        thumb_name = unique_name(f"{base}-thumb", t_ext)
-        thumb.save(thumbs_dir / thumb_name)
+        t_path = thumbs_dir / unique_name(f"{base}-thumb", t_ext)
+        thumb_name = content_key(save_stream(thumb.stream, t_path), t_ext)
+        storage.thumbs.put(t_path, thumb_name)
+
+    v = create_video(current_user.id, title, original, temp_name, thumb_name, content_hash=digest)
+    if v.status == "processing":
+        flash("Uploaded. Your video is being processed.", "ok")
+    elif v.status == "failed":
+        flash("Uploaded, but processing failed.", "err")
     else:
-        tname, terr = generate_thumbnail(final_path, base)
-        if terr:
-            flash(terr, "err")
-        thumb_name = tname
-
-    v = Video(
-        title=title,
-        filename=final_path.name,
-        ext=final_ext,
-        original_name=original,
-        thumb_filename=thumb_name,
-        uploader_id=current_user.id,
-    )
-    db.session.add(v)
-    db.session.commit()
-    flash("Uploaded.", "ok")
+        flash("Uploaded.", "ok")
     return redirect(url_for("videos.watch", video_id=v.id))
 
+@bp.get("/watch/<int:video_id>/status")
+def video_status(video_id: int):
+    v = Video.query.get_or_404(video_id)
+    job = Job.query.filter_by(video_id=v.id).order_by(Job.id.desc()).first()
+    return jsonify(
+        status=v.status,
+        job=None if job is None else {"status": job.status, "attempts": job.attempts, "error": job.error and job.error.splitlines()[0]},
+    )
 
 @bp.post("/rate/<int:video_id>")
 @login_required
@@ -126,23 +171,25 @@ def rate(video_id: int):
         flash("Choose 1 to 5 stars.", "err")
         return redirect(url_for("videos.watch", video_id=v.id))
 
-    existing = Rating.query.filter_by(video_id=v.id, user_id=current_user.id).first()
-    if existing:
-        existing.stars = stars
-    else:
-        db.session.add(Rating(video_id=v.id, user_id=current_user.id, stars=stars))
+    interactions.rate(current_user.id, v.id, stars)
     db.session.commit()
+    activity.record(v.id, "rating")
+    page_cache.invalidate(f"video:{v.id}")
     flash("Thanks for rating!", "ok")
     return redirect(url_for("videos.watch", video_id=v.id))
+
+@bp.post("/like/<int:video_id>")
+@login_required
 def toggle_like(video_id: int):
     v = Video.query.get_or_404(video_id)
-    existing = Like.query.filter_by(video_id=v.id, user_id=current_user.id).first()
-    if existing:
-        db.session.delete(existing)
-        db.session.commit()
-    else:
-        db.session.add(Like(video_id=v.id, user_id=current_user.id))
-        db.session.commit()
+    # delete first: no row removed means it wasn't liked yet
+    liked = not interactions.set_like(current_user.id, v.id, False)
+    if liked:
+        interactions.set_like(current_user.id, v.id, True)
+    db.session.commit()
+    if liked:
+        activity.record(v.id, "like")
+    page_cache.invalidate(f"video:{v.id}")
     return redirect(url_for("videos.watch", video_id=v.id))
 
 @bp.post("/comment/<int:video_id>")
@@ -153,19 +200,47 @@ def add_comment(video_id: int):
     if not body:
         flash("Comment can't be empty.", "err")
         return redirect(url_for("videos.watch", video_id=v.id))
-    if len(body) > 500:
-        flash("Max 500 characters.", "err")
+    if len(body) > interactions.MAX_COMMENT:
+        flash(f"Max {interactions.MAX_COMMENT} characters.", "err")
         return redirect(url_for("videos.watch", video_id=v.id))
-    db.session.add(Comment(video_id=v.id, user_id=current_user.id, body=body))
+    comment = interactions.add_comment(current_user.id, v.id, body)
     db.session.commit()
+    activity.record(v.id, "comment")
+    page_cache.invalidate(f"video:{v.id}")
+    interactions.publish_comment(v.id, comment, current_user.username)
     return redirect(url_for("videos.watch", video_id=v.id))
 
 @bp.get("/media/video/<path:filename>")
+@skip_user_load
 def media_video(filename: str):
-    videos_dir: Path = current_app.config["VIDEOS_DIR"]
-    return send_file_range(videos_dir, filename)
+    rv = storage.videos.serve(filename)
+    # 302: the client is sent to the bucket (app/storage.py S3Storage)
+    if rv.status_code in (200, 206, 302) and is_direct_play():
+        # re-uploads share a file; the first upload gets the view
+        vid = db.session.query(Video.id).filter_by(filename=filename).order_by(Video.id).limit(1).scalar()
+        if vid is not None:
+            activity.record(vid)
+    return rv
+
+@bp.get("/media/hls/<path:filename>")
+@skip_user_load
+def media_hls(filename: str):
+    from ...hls import HLS_SUBDIR  # lazy: keeps the ffmpeg modules out of worker boot
+
+    hls_dir: Path = current_app.config["VIDEOS_DIR"] / HLS_SUBDIR
+    mimetype = HLS_MIMETYPES.get(Path(filename).suffix.lower())
+    rv = send_from_directory(hls_dir, filename, conditional=True, mimetype=mimetype)
+    # every packaging run writes a fresh directory, so its files never change
+    rv.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return rv
 
 @bp.get("/media/thumb/<path:filename>")
+@skip_user_load
 def media_thumb(filename: str):
-    thumbs_dir: Path = current_app.config["THUMBS_DIR"]
-    return send_from_directory(thumbs_dir, filename, conditional=True)
+    from ...thumbs import DERIVED_SUBDIR
+
+    rv = storage.thumbs.serve(filename)
+    # derivatives and uploaded/classic thumbnails are both content-addressed
+    if rv.status_code == 200 and (filename.startswith(DERIVED_SUBDIR + "/") or CONTENT_KEY.match(filename)):
+        rv.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return rv
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Optional
+
+from flask import Flask, Response, g, make_response, request, session
+from flask_login import UserMixin, current_user
+
+
+class MemoryBackend:
+    """Thread-safe LRU bounded by total value bytes, with per-entry TTL.
+
+    A namespace generation is forgotten once it is older than the longest TTL
+    any entry was stored with: by then every entry keyed by the namespace's
+    original generation ("0") has expired, so going back to it is safe, and
+    the table holds only namespaces invalidated within that window.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        # ns -> (set at, generation), oldest first
+        self._gens: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._max_ttl = 0.0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                self._drop(key)
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._max_ttl = max(self._max_ttl, ttl)
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.time() + ttl, value)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        _exp, value = self._data.pop(key)
+        self._bytes -= len(value)
+
+    def get_gen(self, ns: str) -> str:
+        with self._lock:
+            item = self._gens.get(ns)
+        return item[1] if item is not None else "0"
+
+    def set_gen(self, ns: str, gen: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._gens.pop(ns, None)
+            self._gens[ns] = (now, gen)
+            while self._gens:
+                oldest = next(iter(self._gens))
+                if self._gens[oldest][0] >= now - self._max_ttl:
+                    break
+                del self._gens[oldest]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._gens.clear()
+            self._bytes = 0
+
+
+class FileBackend:
+    """Entries as files in a directory shared by every worker process.
+
+    Each file is an 8-byte expiry timestamp followed by the value; writes go
+    through a temp file + os.replace so readers never see a partial entry.
+    """
+
+    _HEADER = struct.Struct("<d")
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.dir = Path(directory)
+        self.gen_dir = self.dir / "gens"
+        self.gen_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._sets = 0
+
+    def _path(self, key: str) -> Path:
+        h = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return self.dir / h[:2] / h
+
+    def _write(self, path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            data = self._path(key).read_bytes()
+        except OSError:
+            return None
+        if len(data) < self._HEADER.size or self._HEADER.unpack_from(data)[0] < time.time():
+            return None
+        return data[self._HEADER.size:]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        self._write(self._path(key), self._HEADER.pack(time.time() + ttl) + value)
+        self._sets += 1
+        if self._sets % 100 == 0:
+            self.prune()
+
+    def prune(self) -> None:
+        now = time.time()
+        files = []
+        for p in self.dir.glob("??/*"):
+            try:
+                st = p.stat()
+                with open(p, "rb") as f:
+                    expired = self._HEADER.unpack(f.read(self._HEADER.size))[0] < now
+            except (OSError, struct.error):
+                continue
+            if expired:
+                p.unlink(missing_ok=True)
+                self.evictions += 1
+            else:
+                files.append((st.st_atime, st.st_size, p))
+        total = sum(size for _a, size, _p in files)
+        for _atime, size, p in sorted(files):
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
+
+    def _gen_path(self, ns: str) -> Path:
+        return self.gen_dir / hashlib.sha1(ns.encode("utf-8")).hexdigest()
+
+    def get_gen(self, ns: str) -> str:
+        try:
+            return self._gen_path(ns).read_text()
+        except OSError:
+            return "0"
+
+    def set_gen(self, ns: str, gen: str) -> None:
+        self._write(self._gen_path(ns), gen.encode("ascii"))
+
+    def clear(self) -> None:
+        for p in self.dir.glob("??/*"):
+            p.unlink(missing_ok=True)
+
+
+class PageCache:
+    """Rendered-page cache keyed by endpoint, arguments and auth state.
+
+    Invalidation is by namespace generation: `invalidate("video:3")` stores a
+    new generation for that namespace, and every key built from it changes, so
+    no backend ever has to enumerate keys.
+    """
+
+    def __init__(self) -> None:
+        self.backend = None
+        self.ttl = 30.0
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.invalidations = 0
+
+    def init_app(self, app: Flask) -> None:
+        kind = app.config.get("OLDTUBE_CACHE", "memory")
+        max_bytes = int(app.config.get("OLDTUBE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+        self.ttl = float(app.config.get("OLDTUBE_CACHE_TTL", 30))
+        if kind == "file":
+            self.backend = FileBackend(app.config["OLDTUBE_CACHE_DIR"], max_bytes)
+        elif kind == "memory":
+            self.backend = MemoryBackend(max_bytes)
+        else:
+            self.backend = None
+        app.extensions["oldtube_cache"] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def invalidate(self, *namespaces: str) -> None:
+        if not self.enabled:
+            return
+        gen = str(time.time_ns())
+        for ns in namespaces:
+            self.backend.set_gen(ns, gen)
+        self.invalidations += len(namespaces)
+
+    def _key(self, namespaces: list[str]) -> str:
+        gens = ",".join(f"{ns}={self.backend.get_gen(ns)}" for ns in namespaces)
+        auth = current_user.get_id() if getattr(current_user, "is_authenticated", False) else "anon"
+        return f"{request.endpoint}|{request.full_path}|{auth}|{gens}"
+
+    def cached(self, *namespaces: str):
+        """Cache a view's 200 HTML response. Namespaces may use the view's
+        URL arguments, e.g. `@cache.cached("video:{video_id}")`."""
+        def deco(fn):
+            @wraps(fn)
+            def wrapper(**kwargs):
+                # pages carrying flashed messages are per-visit; never store or serve them
+                if not self.enabled or session.get("_flashes"):
+                    self.bypasses += 1
+                    return fn(**kwargs)
+                key = self._key([ns.format(**kwargs) for ns in namespaces])
+                body = self.backend.get(key)
+                if body is not None:
+                    self.hits += 1
+                    rv = Response(body, mimetype="text/html")
+                    rv.headers["X-Cache"] = "HIT"
+                    return rv
+                self.misses += 1
+                rv = make_response(fn(**kwargs))
+                if rv.status_code == 200 and not rv.direct_passthrough and not g.get("page_cache_skip"):
+                    self.backend.set(key, rv.get_data(), self.ttl)
+                rv.headers["X-Cache"] = "MISS"
+                return rv
+            return wrapper
+        return deco
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__ if self.backend else "disabled",
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": getattr(self.backend, "evictions", 0),
+        }
+
+
+class UserIdentity(UserMixin):
+    """The parts of a User a request needs, detached from any DB session."""
+
+    def __init__(self, id: int, username: str, is_admin: bool):
+        self.id = id
+        self.username = username
+        self.is_admin = is_admin
+
+    def __repr__(self) -> str:
+        return f"<UserIdentity {self.id} {self.username}>"
+
+
+class UserCache:
+    """Per-process LRU of user identities with a TTL, so the session's user id
+    doesn't cost a SELECT on every request.
+
+    Entries are dropped when a User's name, password or admin flag changes
+    (see app/login.py); other worker processes pick such changes up when the
+    TTL runs out.
+    """
+
+    def __init__(self) -> None:
+        self.max_entries = 1024
+        self.ttl = 60.0
+        self._data: OrderedDict[int, tuple[float, UserIdentity]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def init_app(self, app: Flask) -> None:
+        self.max_entries = int(app.config.get("OLDTUBE_USER_CACHE_SIZE", 1024))
+        self.ttl = float(app.config.get("OLDTUBE_USER_CACHE_TTL", 60))
+        self.clear()
+        app.extensions["oldtube_user_cache"] = self
+
+    def get(self, user_id: int, load: Callable[[int], Optional[UserIdentity]]) -> Optional[UserIdentity]:
+        if self.max_entries <= 0:
+            return load(user_id)
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(user_id)
+            if item is not None and item[0] > now:
+                self._data.move_to_end(user_id)
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+        ident = load(user_id)
+        if ident is not None:
+            with self._lock:
+                self._data[user_id] = (now + self.ttl, ident)
+                self._data.move_to_end(user_id)
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+        return ident
+
+    def invalidate(self, *user_ids: int) -> None:
+        with self._lock:
+            for uid in user_ids:
+                if self._data.pop(uid, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "invalidations": self.invalidations,
+        }
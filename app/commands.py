@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import click
+from flask import Flask
+
+
+def register_commands(app: Flask) -> None:
+    @app.cli.command("init-db")
+    @click.option("--no-seed", is_flag=True, help="Don't create the admin account.")
+    def init_db(no_seed):
+        """Create or upgrade the database schema (and seed the admin account)."""
+        from .schema import migrate, seed_admin
+
+        result = migrate()
+        click.echo({None: "schema already current", True: "database created", False: "schema upgraded"}[result])
+        if not no_seed and seed_admin():
+            click.echo("admin account created")
+
+    @app.cli.command("collect-static")
+    @click.option("--clean", is_flag=True, help="Also delete files from earlier builds.")
+    def collect_static_cmd(clean):
+        """Write content-hashed, gzip/brotli-compressed copies of the static files."""
+        from .assets import collect_static
+
+        dest = Path(app.config["OLDTUBE_STATIC_BUILD_DIR"])
+        manifest = collect_static(Path(app.static_folder), dest, clean=clean)
+        for name, hashed in sorted(manifest.items()):
+            variants = [ext for ext in (".gz", ".br") if (dest / (hashed + ext)).is_file()]
+            click.echo(f"{name} -> {hashed} {' '.join(variants)}".rstrip())
+        click.echo("restart the app servers to pick up the new names")
+
+    @app.cli.command("storage-check")
+    def storage_check():
+        """Write, read back, link and delete a probe file in each storage backend."""
+        import tempfile
+        from pathlib import Path
+        from .extensions import storage
+
+        for name in ("videos", "thumbs"):
+            backend = getattr(storage, name)
+            key = "_probe/oldtube-storage-check.txt"
+            with tempfile.TemporaryDirectory() as tmp:
+                src = Path(tmp) / "probe.txt"
+                src.write_bytes(b"oldtube")
+                backend.put(src, key)
+            with backend.fetch(key) as path:
+                ok = path.read_bytes() == b"oldtube"
+            with app.test_request_context():
+                status = backend.serve(key).status_code
+            backend.delete(key)
+            click.echo(f"{name}: {backend.kind} read {'ok' if ok else 'MISMATCH'}, serve -> {status}")
+
+    @app.cli.command("worker")
+    @click.option("--concurrency", "-c", type=int, default=None, help="Worker processes (default: OLDTUBE_JOB_WORKERS).")
+    def worker(concurrency):
+        """Run the background transcode/thumbnail job workers."""
+        from .jobs import WorkerPool
+
+        pool = WorkerPool(app, concurrency).start()
+        click.echo(f"started {len(pool.procs)} worker(s)")
+        pool.supervise()
+
+    @app.cli.command("upload-gc")
+    @click.option("--max-age", type=float, default=None, help="Idle seconds (default: OLDTUBE_UPLOAD_SESSION_TTL).")
+    def upload_gc(max_age):
+        """Delete abandoned resumable-upload sessions and their partial files."""
+        from .uploads import gc_upload_sessions
+
+        click.echo(f"removed {gc_upload_sessions(max_age)} session(s)")
+
+    @app.cli.command("thumbs-regenerate")
+    @click.option("--processes", "-p", type=int, default=None, help="Pool size (default: CPU count).")
+    @click.option("--missing-only", is_flag=True, help="Skip videos that already have derivatives.")
+    def thumbs_regenerate(processes, missing_only):
+        """Regenerate thumbnail derivatives for the whole catalog in parallel."""
+        import os
+        from .extensions import db, page_cache
+        from .models import Video
+        from .thumbs import regenerate_all
+
+        query = db.session.query(Video.id).filter(Video.status == "ready")
+        if missing_only:
+            query = query.filter(Video.thumb_derivatives.is_(None))
+        ids = [vid for (vid,) in query.order_by(Video.id)]
+        done = failed = 0
+
+        def on_result(video_id, manifest, err):
+            nonlocal done, failed
+            if manifest:
+                db.session.execute(db.update(Video).where(Video.id == video_id).values(thumb_derivatives=manifest))
+                done += 1
+                if done % 50 == 0:
+                    db.session.commit()
+            else:
+                failed += 1
+                click.echo(f"video {video_id}: {err}", err=True)
+
+        regenerate_all(ids, processes or os.cpu_count() or 1, on_result)
+        db.session.commit()
+        page_cache.invalidate("videos")
+        click.echo(f"{done} regenerated, {failed} failed, {len(ids)} total")
+
+    @app.cli.command("import-videos")
+    @click.argument("directory", type=click.Path(exists=True, file_okay=False, path_type=Path))
+    @click.option("--user", "username", default=None, help="Owner of the imported videos (default: OLDTUBE_ADMIN_USER).")
+    @click.option("--processes", "-p", type=int, default=None, help="Pool size (default: CPU count).")
+    @click.option("--batch", type=int, default=50, show_default=True, help="Rows per INSERT transaction.")
+    def import_videos(directory, username, processes, batch):
+        """Import every video file below DIRECTORY (re-run to resume)."""
+        import os
+        import time
+        from .importer import import_directory
+        from .models import User
+
+        username = username or os.environ.get("OLDTUBE_ADMIN_USER", "admin")
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f"no such user: {username}")
+        last = 0.0
+
+        def progress(stats):
+            nonlocal last
+            if time.monotonic() - last < 2 and stats.done < stats.found:
+                return
+            last = time.monotonic()
+            rate = stats.done / stats.elapsed if stats.elapsed else 0.0
+            eta = (stats.found - stats.done) / rate if rate else 0.0
+            click.echo(f"[{stats.done}/{stats.found}] {stats.imported} imported, {stats.skipped} skipped, "
+                       f"{stats.failed} failed  {rate:.1f} files/s  eta {eta:.0f}s")
+
+        stats = import_directory(directory, user.id, processes or os.cpu_count() or 1, batch, progress)
+        for path, err in stats.errors:
+            click.echo(f"{path}: {err}", err=True)
+        elapsed = max(stats.elapsed, 0.001)
+        click.echo(f"{stats.imported} imported, {stats.skipped} skipped, {stats.failed} failed, "
+                   f"{stats.found} found in {elapsed:.1f}s: {stats.done / elapsed:.2f} files/s, "
+                   f"{stats.bytes / elapsed / 1e6:.1f} MB/s, "
+                   f"{stats.work_seconds / elapsed:.1f}x parallel")
+
+    @app.cli.command("media-probe")
+    @click.option("--all", "probe_all", is_flag=True, help="Also re-probe videos that already have metadata.")
+    def media_probe(probe_all):
+        """Record duration, dimensions, codecs and bitrate for the catalog."""
+        from .extensions import db, page_cache, storage
+        from .models import Video
+        from .utils import MEDIA_FIELDS, probe_media
+
+        query = Video.query.filter(Video.status == "ready")
+        if not probe_all:
+            query = query.filter(Video.duration.is_(None))
+        done = failed = 0
+        for v in query.order_by(Video.id).all():
+            with storage.videos.fetch(v.filename) as path:
+                meta = probe_media(path)
+            if meta is None:
+                failed += 1
+                click.echo(f"video {v.id}: could not probe {v.filename}", err=True)
+                continue
+            for name in MEDIA_FIELDS:
+                setattr(v, name, meta.get(name))
+            done += 1
+            if done % 50 == 0:
+                db.session.commit()
+        db.session.commit()
+        page_cache.invalidate("videos")
+        click.echo(f"{done} probed, {failed} failed")
+
+    @app.cli.command("search-reindex")
+    def search_reindex():
+        """Rebuild the full-text video search index from the video table."""
+        from .search import rebuild_search_index
+
+        click.echo(f"indexed {rebuild_search_index()} video(s)")
+
+    @app.cli.command("reconcile-counters")
+    def reconcile_counters_cmd():
+        """Rebuild the denormalized like/comment/rating/favorite counters."""
+        from .counters import reconcile_counters
+
+        reconcile_counters()
+        click.echo("counters rebuilt")
+
+    @app.cli.command("rankings-refresh")
+    def rankings_refresh():
+        """Flush buffered views and rebuild the trending/most-viewed tables."""
+        from .rankings import activity, refresh_rankings
+
+        activity.flush()
+        counts = refresh_rankings()
+        click.echo(", ".join(f"{kind}: {n}" for kind, n in counts.items()))
@@ -6,16 +6,143 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev-change-me")
-    db_path = (BASE_DIR / "instance" / "oldtube.db")
-    db_path.parent.mkdir(parents=True, exist_ok=True)
+    # the directory is created by the first migration (app/schema.py), not at import
+    db_path = Path(os.environ.get("OLDTUBE_DB") or (BASE_DIR / "instance" / "oldtube.db"))
     SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(db_path)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # create/upgrade the schema at boot when it's out of date; turn off in
+    # production and run `flask --app run init-db` once per deploy instead
+    OLDTUBE_AUTO_MIGRATE = os.environ.get("OLDTUBE_AUTO_MIGRATE", "1") == "1"
+
+    # SQLite engine tuning (see app/database.py)
+    OLDTUBE_SQLITE_TUNING = os.environ.get("OLDTUBE_SQLITE_TUNING", "1") == "1"
+    OLDTUBE_SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("OLDTUBE_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    OLDTUBE_SQLITE_CACHE_KB = int(os.environ.get("OLDTUBE_SQLITE_CACHE_KB", "65536"))
+    OLDTUBE_SQLITE_MMAP_MB = int(os.environ.get("OLDTUBE_SQLITE_MMAP_MB", "256"))
+    OLDTUBE_DB_POOL_SIZE = int(os.environ.get("OLDTUBE_DB_POOL_SIZE", "10"))
+    OLDTUBE_DB_MAX_OVERFLOW = int(os.environ.get("OLDTUBE_DB_MAX_OVERFLOW", "20"))
     MAX_CONTENT_LENGTH = int(os.environ.get("OLDTUBE_MAX_MB", "250")) * 1024 * 1024
+    # resumable uploads (/upload/sessions): each PUT carries one chunk, so files can
+    # exceed MAX_CONTENT_LENGTH; idle sessions are garbage-collected after the TTL
+    OLDTUBE_MAX_UPLOAD_BYTES = int(os.environ.get("OLDTUBE_MAX_UPLOAD_MB", "4096")) * 1024 * 1024
+    OLDTUBE_UPLOAD_CHUNK_BYTES = int(os.environ.get("OLDTUBE_UPLOAD_CHUNK_MB", "8")) * 1024 * 1024
+    OLDTUBE_UPLOAD_SESSION_TTL = int(os.environ.get("OLDTUBE_UPLOAD_SESSION_TTL", "86400"))
 
     UPLOADS_DIR = BASE_DIR / "uploads"
     VIDEOS_DIR = UPLOADS_DIR / "videos"
     THUMBS_DIR = UPLOADS_DIR / "thumbs"
 
+    # where finished videos and thumbnails live (app/storage.py): "local" keeps them
+    # under VIDEOS_DIR/THUMBS_DIR, "s3" in a bucket (needs boto3); uploads are
+    # always staged and transcoded in VIDEOS_DIR first
+    OLDTUBE_STORAGE = os.environ.get("OLDTUBE_STORAGE", "local")
+    OLDTUBE_S3_BUCKET = os.environ.get("OLDTUBE_S3_BUCKET", "oldtube")
+    OLDTUBE_S3_PREFIX = os.environ.get("OLDTUBE_S3_PREFIX", "")
+    # e.g. http://127.0.0.1:9000 for a local MinIO; empty means AWS
+    OLDTUBE_S3_ENDPOINT = os.environ.get("OLDTUBE_S3_ENDPOINT", "")
+    OLDTUBE_S3_REGION = os.environ.get("OLDTUBE_S3_REGION", "")
+    # media URLs redirect here (a CDN or public bucket) instead of to presigned URLs
+    OLDTUBE_S3_PUBLIC_URL = os.environ.get("OLDTUBE_S3_PUBLIC_URL", "")
+    OLDTUBE_S3_PRESIGN_SECONDS = int(os.environ.get("OLDTUBE_S3_PRESIGN_SECONDS", "3600"))
+
+    # async media server for /media/* (app/media_asgi.py, run via asgi.py): each
+    # connection gets BURST KB at full speed, then at most RATE_KBPS (0 = no cap)
+    OLDTUBE_MEDIA_RATE_KBPS = int(os.environ.get("OLDTUBE_MEDIA_RATE_KBPS", "0"))
+    OLDTUBE_MEDIA_BURST_KB = int(os.environ.get("OLDTUBE_MEDIA_BURST_KB", "2048"))
+    OLDTUBE_MEDIA_CHUNK_KB = int(os.environ.get("OLDTUBE_MEDIA_CHUNK_KB", "256"))
+    OLDTUBE_MEDIA_IO_THREADS = int(os.environ.get("OLDTUBE_MEDIA_IO_THREADS", "8"))
+    # threads a2wsgi runs the Flask pages on under asgi:application
+    OLDTUBE_ASGI_WSGI_THREADS = int(os.environ.get("OLDTUBE_ASGI_WSGI_THREADS", "16"))
+
+    # rendered page cache: "memory" (per process), "file" (shared by all workers) or "none"
+    OLDTUBE_CACHE = os.environ.get("OLDTUBE_CACHE", "memory")
+    OLDTUBE_CACHE_TTL = float(os.environ.get("OLDTUBE_CACHE_TTL", "30"))
+    OLDTUBE_CACHE_MAX_BYTES = int(os.environ.get("OLDTUBE_CACHE_MAX_MB", "32")) * 1024 * 1024
+    OLDTUBE_CACHE_DIR = Path(os.environ.get("OLDTUBE_CACHE_DIR") or (BASE_DIR / "instance" / "cache"))
+
+    # `flask collect-static` writes content-hashed, precompressed copies of app/static
+    # here; url_for('static') links to them once a build exists (restart to pick up
+    # a new one)
+    OLDTUBE_STATIC_BUILD_DIR = Path(os.environ.get("OLDTUBE_STATIC_BUILD_DIR") or (BASE_DIR / "instance" / "static"))
+    OLDTUBE_STATIC_FINGERPRINT = os.environ.get("OLDTUBE_STATIC_FINGERPRINT", "1") == "1"
+    # compiled templates shared by every worker boot ("" disables)
+    OLDTUBE_JINJA_CACHE_DIR = os.environ.get("OLDTUBE_JINJA_CACHE_DIR", str(BASE_DIR / "instance" / "jinja-cache"))
+
+    # live updates over Server-Sent Events (/events): each open stream holds a WSGI
+    # thread for up to STREAM_SECONDS, at most MAX_CLIENTS per process; with several
+    # worker processes, events cross between them via "socket" (Unix datagram
+    # sockets) or "file" (a shared append-only log) in OLDTUBE_EVENTS_DIR
+    OLDTUBE_EVENTS_BRIDGE = os.environ.get("OLDTUBE_EVENTS_BRIDGE", "none")
+    OLDTUBE_EVENTS_DIR = Path(os.environ.get("OLDTUBE_EVENTS_DIR") or (BASE_DIR / "instance" / "events"))
+    # open streams per process; under plain WSGI each one holds a server thread,
+    # so only EVENTS_WSGI_CLIENTS of them are let in there (keep it well below
+    # the server's thread count). asgi:application serves them as coroutines.
+    OLDTUBE_EVENTS_MAX_CLIENTS = int(os.environ.get("OLDTUBE_EVENTS_MAX_CLIENTS", "1000"))
+    OLDTUBE_EVENTS_WSGI_CLIENTS = int(os.environ.get("OLDTUBE_EVENTS_WSGI_CLIENTS", "4"))
+    # live comments on watch pages for viewers who aren't logged in
+    OLDTUBE_EVENTS_ANONYMOUS = os.environ.get("OLDTUBE_EVENTS_ANONYMOUS", "0") == "1"
+    OLDTUBE_EVENTS_QUEUE = int(os.environ.get("OLDTUBE_EVENTS_QUEUE", "64"))
+    OLDTUBE_EVENTS_HEARTBEAT = float(os.environ.get("OLDTUBE_EVENTS_HEARTBEAT", "15"))
+    OLDTUBE_EVENTS_STREAM_SECONDS = float(os.environ.get("OLDTUBE_EVENTS_STREAM_SECONDS", "300"))
+
+    OLDTUBE_PAGE_SIZE = int(os.environ.get("OLDTUBE_PAGE_SIZE", "24"))
+
     OLDTUBE_CONVERT = os.environ.get("OLDTUBE_CONVERT", "1") == "1"
     OLDTUBE_THUMBNAIL = os.environ.get("OLDTUBE_THUMBNAIL", "1") == "1"
     FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "")
+    # media inspection (duration, size, codecs); found next to ffmpeg or on PATH when empty
+    FFPROBE_BIN = os.environ.get("FFPROBE_BIN", "")
+
+    # thumbnail derivatives served under content-hashed, immutable URLs
+    OLDTUBE_THUMB_SIZES = os.environ.get("OLDTUBE_THUMB_SIZES", "120x90,240x180,480x360")
+    OLDTUBE_THUMB_FORMATS = os.environ.get("OLDTUBE_THUMB_FORMATS", "jpg,webp")
+    OLDTUBE_THUMB_PREVIEW = os.environ.get("OLDTUBE_THUMB_PREVIEW", "0") == "1"
+
+    # optional HLS packaging after conversion: "<height>:<video bitrate>" renditions
+    OLDTUBE_HLS = os.environ.get("OLDTUBE_HLS", "0") == "1"
+    OLDTUBE_HLS_LADDER = os.environ.get("OLDTUBE_HLS_LADDER", "240:400k,480:1000k,720:2500k")
+    OLDTUBE_HLS_SEGMENT_SECONDS = int(os.environ.get("OLDTUBE_HLS_SEGMENT_SECONDS", "6"))
+
+    # background transcode/thumbnail queue (0 workers = run jobs inline in the request)
+    OLDTUBE_JOB_WORKERS = int(os.environ.get("OLDTUBE_JOB_WORKERS", "2"))
+    OLDTUBE_JOB_MAX_ATTEMPTS = int(os.environ.get("OLDTUBE_JOB_MAX_ATTEMPTS", "3"))
+    OLDTUBE_JOB_POLL = float(os.environ.get("OLDTUBE_JOB_POLL", "1.0"))
+    OLDTUBE_JOB_BACKOFF = float(os.environ.get("OLDTUBE_JOB_BACKOFF", "5.0"))
+    OLDTUBE_JOB_TIMEOUT = float(os.environ.get("OLDTUBE_JOB_TIMEOUT", "1800"))
+
+    # views and trend points are buffered per process and written in batches;
+    # the trending/most-viewed tables are rebuilt at most every REFRESH seconds
+    OLDTUBE_VIEW_FLUSH_SECONDS = float(os.environ.get("OLDTUBE_VIEW_FLUSH_SECONDS", "10"))
+    OLDTUBE_VIEW_FLUSH_EVENTS = int(os.environ.get("OLDTUBE_VIEW_FLUSH_EVENTS", "500"))
+    OLDTUBE_TREND_HALF_LIFE_HOURS = float(os.environ.get("OLDTUBE_TREND_HALF_LIFE_HOURS", "24"))
+    OLDTUBE_RANKING_SIZE = int(os.environ.get("OLDTUBE_RANKING_SIZE", "50"))
+    OLDTUBE_RANKING_REFRESH_SECONDS = float(os.environ.get("OLDTUBE_RANKING_REFRESH_SECONDS", "300"))
+
+    # password hashing: any werkzeug method string; stored hashes made with other
+    # parameters are upgraded on the user's next successful login
+    OLDTUBE_PASSWORD_METHOD = os.environ.get("OLDTUBE_PASSWORD_METHOD", "scrypt:32768:8:1")
+    OLDTUBE_AUTH_WORKERS = int(os.environ.get("OLDTUBE_AUTH_WORKERS", "2"))
+    OLDTUBE_AUTH_QUEUE = int(os.environ.get("OLDTUBE_AUTH_QUEUE", "16"))
+    OLDTUBE_AUTH_TIMEOUT = float(os.environ.get("OLDTUBE_AUTH_TIMEOUT", "10"))
+    # token buckets for /auth/login and /auth/register (per client IP and per username)
+    OLDTUBE_AUTH_IP_PER_MINUTE = float(os.environ.get("OLDTUBE_AUTH_IP_PER_MINUTE", "10"))
+    OLDTUBE_AUTH_IP_BURST = int(os.environ.get("OLDTUBE_AUTH_IP_BURST", "20"))
+    OLDTUBE_AUTH_USER_PER_MINUTE = float(os.environ.get("OLDTUBE_AUTH_USER_PER_MINUTE", "5"))
+    OLDTUBE_AUTH_USER_BURST = int(os.environ.get("OLDTUBE_AUTH_USER_BURST", "5"))
+    # ...and per username across all IPs, looser so a distributed guesser is
+    # capped without one noisy address locking the owner out
+    OLDTUBE_AUTH_ACCOUNT_PER_MINUTE = float(os.environ.get("OLDTUBE_AUTH_ACCOUNT_PER_MINUTE", "30"))
+    OLDTUBE_AUTH_ACCOUNT_BURST = int(os.environ.get("OLDTUBE_AUTH_ACCOUNT_BURST", "50"))
+    # reverse proxies in front of the app whose X-Forwarded-For/-Proto to trust;
+    # with 0 every client behind a proxy shares the proxy's address (and buckets)
+    OLDTUBE_PROXY_FIX = int(os.environ.get("OLDTUBE_PROXY_FIX", "0"))
+
+    # logged-in identities cached per process (app/cache.py UserCache); 0 disables
+    OLDTUBE_USER_CACHE_SIZE = int(os.environ.get("OLDTUBE_USER_CACHE_SIZE", "1024"))
+    OLDTUBE_USER_CACHE_TTL = float(os.environ.get("OLDTUBE_USER_CACHE_TTL", "60"))
+
+    # expose the per-request SQL statement count as an X-Query-Count header
+    OLDTUBE_QUERY_COUNT_HEADER = os.environ.get("OLDTUBE_QUERY_COUNT_HEADER", "0") == "1"
+
+    # /admin/metrics is open to admins, or to a scraper presenting this bearer token
+    OLDTUBE_METRICS_TOKEN = os.environ.get("OLDTUBE_METRICS_TOKEN", "")
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from sqlalchemy import func, select
+
+from .extensions import db
+from .models import Comment, Favorite, Like, Rating, User, Video
+
+
+def bump(model, row_id: int, **deltas: int) -> None:
+    """Add `deltas` to counter columns in the current transaction.
+
+    Emits `SET col = col + :n` so concurrent writers never lose an update.
+    """
+    values = {name: getattr(model, name) + n for name, n in deltas.items() if n}
+    if values:
+        db.session.execute(db.update(model).where(model.id == row_id).values(**values))
+
+
+def _count(model, fk, owner):
+    return select(func.count(model.id)).where(fk == owner.id).scalar_subquery()
+
+
+def reconcile_counters() -> None:
+    """Rebuild every counter from the base tables in one bulk UPDATE per table."""
+    db.session.execute(db.update(Video).values(
+        rating_sum=select(func.coalesce(func.sum(Rating.stars), 0)).where(Rating.video_id == Video.id).scalar_subquery(),
+        rating_count=_count(Rating, Rating.video_id, Video),
+        like_count=_count(Like, Like.video_id, Video),
+        comment_count=_count(Comment, Comment.video_id, Video),
+        favorite_count=_count(Favorite, Favorite.video_id, Video),
+    ))
+    db.session.execute(db.update(User).values(
+        like_count=_count(Like, Like.user_id, User),
+        comment_count=_count(Comment, Comment.user_id, User),
+        video_count=_count(Video, Video.uploader_id, User),
+    ))
+    db.session.commit()
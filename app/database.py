@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import math
+
+from flask import Flask
+from sqlalchemy import event
+
+
+def logaddexp2(a, b):
+    """log2(2**a + 2**b) without overflow; NULL counts as "nothing yet"."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    hi, lo = (a, b) if a >= b else (b, a)
+    return hi + math.log2(1.0 + 2.0 ** (lo - hi))
+
+
+def engine_options(app: Flask) -> dict:
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database.
+
+    File-backed SQLite gets a thread-shareable QueuePool sized for a threaded
+    server, and a driver-level busy timeout so writers wait for the lock
+    instead of failing with "database is locked".
+    """
+    cfg = app.config
+    opts = dict(cfg.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    uri = cfg["SQLALCHEMY_DATABASE_URI"]
+    if not uri.startswith("sqlite") or ":memory:" in uri or not cfg.get("OLDTUBE_SQLITE_TUNING", True):
+        return opts
+    connect_args = dict(opts.get("connect_args") or {})
+    connect_args.setdefault("timeout", cfg["OLDTUBE_SQLITE_BUSY_TIMEOUT_MS"] / 1000.0)
+    connect_args.setdefault("check_same_thread", False)
+    opts["connect_args"] = connect_args
+    opts.setdefault("pool_size", cfg["OLDTUBE_DB_POOL_SIZE"])
+    opts.setdefault("max_overflow", cfg["OLDTUBE_DB_MAX_OVERFLOW"])
+    opts.setdefault("pool_timeout", 30)
+    return opts
+
+
+def sqlite_pragmas(app: Flask) -> list[str]:
+    cfg = app.config
+    return [
+        "PRAGMA journal_mode=WAL",  # readers no longer block the writer (and vice versa)
+        "PRAGMA synchronous=NORMAL",  # durable at checkpoints; safe with WAL
+        f"PRAGMA busy_timeout={int(cfg['OLDTUBE_SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA cache_size=-{int(cfg['OLDTUBE_SQLITE_CACHE_KB'])}",
+        f"PRAGMA mmap_size={int(cfg['OLDTUBE_SQLITE_MMAP_MB']) * 1024 * 1024}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+def init_database(app: Flask, db) -> None:
+    """Call after `db.init_app(app)`: installs the per-connection pragmas and
+    the SQL functions the app relies on (see app/rankings.py)."""
+    uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    if not uri.startswith("sqlite"):
+        return
+    pragmas = sqlite_pragmas(app) if app.config.get("OLDTUBE_SQLITE_TUNING", True) else []
+
+    def _on_connect(dbapi_conn, _record):
+        dbapi_conn.create_function("logaddexp2", 2, logaddexp2, deterministic=True)
+        cur = dbapi_conn.cursor()
+        for p in pragmas:
+            cur.execute(p)
+        cur.close()
+
+    with app.app_context():
+        event.listen(db.engine, "connect", _on_connect)
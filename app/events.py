@@ -0,0 +1,390 @@
+from __future__ import annotations
+
+import asyncio
+import atexit
+import json
+import os
+import queue
+import secrets
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Callable, Iterable, Iterator, Optional
+
+from flask import Flask
+
+from .instrumentation import metrics
+
+Deliver = Callable[[str, str, dict], None]
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_frame(kind: str, data: dict) -> bytes:
+    """One Server-Sent Events message (`event:` + one-line JSON `data:`)."""
+    return f"event: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+class LocalBridge:
+    """Single process: nothing to forward."""
+
+    def start(self, deliver: Deliver) -> None:
+        pass
+
+    def send(self, channel: str, kind: str, data: dict) -> None:
+        pass
+
+
+class _Bridge(ABC):
+    """Carries events between the worker processes of one deployment.
+
+    Each process publishes to its own subscribers directly and forwards the
+    event through the bridge; the receiving side (a thread, started with the
+    first subscription, so job workers and CLI commands never run it) hands
+    other processes' events to `deliver`.
+    """
+
+    def __init__(self, directory: Path):
+        self.dir = Path(directory)
+        self.origin = ""
+        self._pid = 0
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _check_pid(self) -> None:
+        # a forked child must not pass for its parent, nor reuse its sockets
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.origin = f"{self._pid}-{secrets.token_hex(4)}"
+            self._started = False
+            self._reset()
+
+    def _reset(self) -> None:
+        pass
+
+    def _encode(self, channel: str, kind: str, data: dict) -> bytes:
+        self._check_pid()
+        return json.dumps({"o": self.origin, "c": channel, "k": kind, "d": data},
+                          separators=(",", ":")).encode("utf-8")
+
+    def _decode(self, raw: bytes, deliver: Deliver) -> None:
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            return
+        if msg.get("o") != self.origin:
+            deliver(msg["c"], msg["k"], msg["d"])
+
+    def start(self, deliver: Deliver) -> None:
+        with self._lock:
+            self._check_pid()
+            if self._started:
+                return
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self._listen(deliver)
+            self._started = True
+
+    @abstractmethod
+    def _listen(self, deliver: Deliver) -> None:
+        """Start receiving other processes' events (called once per process)."""
+
+    @abstractmethod
+    def send(self, channel: str, kind: str, data: dict) -> None:
+        """Forward one event to the other processes."""
+
+
+class SocketBridge(_Bridge):
+    """A Unix datagram socket per listening process in a shared directory;
+    publishing sends one datagram to every socket there.
+
+    Sends never block: a peer whose receive buffer is full misses the event,
+    and sockets nobody is bound to any more (a worker that died) are removed.
+    """
+
+    def _reset(self) -> None:
+        self._out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._out.setblocking(False)
+        self._path: Optional[Path] = None
+
+    def _listen(self, deliver: Deliver) -> None:
+        self._path = self.dir / f"{self.origin}.sock"
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(str(self._path))
+        atexit.register(self._path.unlink, missing_ok=True)
+
+        def run() -> None:
+            while True:
+                self._decode(sock.recv(256 * 1024), deliver)
+
+        threading.Thread(target=run, name="oldtube-events-socket", daemon=True).start()
+
+    def send(self, channel: str, kind: str, data: dict) -> None:
+        payload = self._encode(channel, kind, data)
+        for name in os.listdir(self.dir) if self.dir.is_dir() else ():
+            if not name.endswith(".sock") or name == f"{self.origin}.sock":
+                continue
+            path = self.dir / name
+            try:
+                self._out.sendto(payload, str(path))
+            except (ConnectionRefusedError, FileNotFoundError):
+                path.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+
+class FileBridge(_Bridge):
+    """An append-only log in a shared directory that every listening process
+    tails (checked every `poll` seconds).
+
+    Each event is one line written with a single O_APPEND write, so lines
+    from different processes never interleave. The log is renamed aside once
+    it passes `max_bytes`; tailers finish the old file before reopening (one
+    that falls a whole rotation behind misses the file in between).
+    """
+
+    def __init__(self, directory: Path, poll: float = 0.25, max_bytes: int = 4 * 1024 * 1024):
+        super().__init__(directory)
+        self.path = self.dir / "events.log"
+        self.poll = poll
+        self.max_bytes = max_bytes
+
+    def _listen(self, deliver: Deliver) -> None:
+        # opened here, not in the thread, so nothing sent after start() is missed
+        f = open(self.path, "ab+")
+        f.seek(0, os.SEEK_END)
+
+        def run() -> None:
+            nonlocal f
+            pending = b""
+            while True:
+                chunk = f.read()
+                if chunk:
+                    *lines, pending = (pending + chunk).split(b"\n")
+                    for line in lines:
+                        self._decode(line, deliver)
+                    continue
+                try:
+                    rotated = os.stat(self.path).st_ino != os.fstat(f.fileno()).st_ino
+                except FileNotFoundError:
+                    rotated = False
+                if rotated:
+                    # whatever was appended just before the rename
+                    for line in (pending + f.read()).split(b"\n"):
+                        if line:
+                            self._decode(line, deliver)
+                    f.close()
+                    f = open(self.path, "ab+")
+                    f.seek(0)
+                    pending = b""
+                else:
+                    time.sleep(self.poll)
+
+        threading.Thread(target=run, name="oldtube-events-file", daemon=True).start()
+
+    def send(self, channel: str, kind: str, data: dict) -> None:
+        payload = self._encode(channel, kind, data) + b"\n"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, payload)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > self.max_bytes:
+            try:
+                os.replace(self.path, self.path.with_name("events.log.1"))
+            except FileNotFoundError:
+                pass  # another process rotated it first
+
+
+class Subscription:
+    """One client's channels and its bounded queue of encoded frames.
+
+    `wake`, when set, is called after every put (an asyncio reader's way of
+    hearing about frames from publishing threads).
+    """
+
+    def __init__(self, channels: tuple[str, ...], max_queue: int, threaded: bool = True):
+        self.channels = channels
+        self.threaded = threaded
+        self.queue: queue.Queue[bytes] = queue.Queue(max_queue)
+        self.overflowed = False
+        self.active = True
+        self.wake: Optional[Callable[[], None]] = None
+
+    def put(self, frame: bytes) -> bool:
+        try:
+            self.queue.put_nowait(frame)
+            ok = True
+        except queue.Full:
+            # a client this far behind is cut off; EventSource reconnects and
+            # the page starts again from fresh counts
+            self.overflowed = True
+            ok = False
+        wake = self.wake
+        if wake is not None:
+            try:
+                wake()
+            except RuntimeError:
+                pass  # the reader's event loop closed under us
+        return ok
+
+
+class EventStream:
+    """WSGI response body for one subscription: `first`, then frames as they
+    are published, with a comment line every `heartbeat` seconds of silence
+    (which keeps proxies from timing out and finds dead clients), for at most
+    `lifetime` seconds. The server calls close() however the response ends,
+    which unsubscribes. `frames()` is the same stream for an ASGI server."""
+
+    def __init__(self, hub: "EventHub", sub: Subscription, first: Iterable[bytes]):
+        self.hub = hub
+        self.sub = sub
+        self.first = list(first)
+
+    def __iter__(self) -> Iterator[bytes]:
+        # reconnect after 5s when the stream ends or the connection drops
+        yield b"retry: 5000\n\n" + b"".join(self.first)
+        deadline = time.monotonic() + self.hub.lifetime
+        while not self.sub.overflowed:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return
+            try:
+                frame = self.sub.queue.get(timeout=min(self.hub.heartbeat, left))
+            except queue.Empty:
+                frame = b": keep-alive\n\n"
+            if self.sub.overflowed:
+                return
+            yield frame
+
+    async def frames(self) -> AsyncIterator[bytes]:
+        """Iterate on the event loop: waiting costs a coroutine, not a thread."""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        self.sub.wake = lambda: loop.call_soon_threadsafe(ready.set)
+        try:
+            yield b"retry: 5000\n\n" + b"".join(self.first)
+            deadline = time.monotonic() + self.hub.lifetime
+            while not self.sub.overflowed:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return
+                # cleared before looking, so a put in between still wakes us
+                ready.clear()
+                try:
+                    frame = self.sub.queue.get_nowait()
+                except queue.Empty:
+                    try:
+                        await asyncio.wait_for(ready.wait(), timeout=min(self.hub.heartbeat, left))
+                        continue
+                    except asyncio.TimeoutError:
+                        frame = b": keep-alive\n\n"
+                if self.sub.overflowed:
+                    return
+                yield frame
+        finally:
+            # publishers must not call into a loop that may be gone
+            self.sub.wake = None
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self.sub)
+
+
+class EventHub:
+    """In-process publish/subscribe for Server-Sent Events.
+
+    `publish("user:3", "message", {...})` reaches every open /events stream
+    subscribed to that channel in this process, and through the configured
+    bridge (OLDTUBE_EVENTS_BRIDGE: "none", "socket" or "file") those in the
+    other worker processes. Delivery is best effort: pages reconcile on
+    reconnect, when the stream starts with fresh state.
+    """
+
+    def __init__(self) -> None:
+        self.bridge = LocalBridge()
+        self.max_queue = 64
+        self.max_clients = 1000
+        self.max_threaded = 4
+        self.heartbeat = 15.0
+        self.lifetime = 300.0
+        self._subs: dict[str, set[Subscription]] = {}
+        self._clients = 0
+        self._threaded = 0
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def init_app(self, app: Flask) -> None:
+        kind = app.config.get("OLDTUBE_EVENTS_BRIDGE", "none")
+        directory = Path(app.config["OLDTUBE_EVENTS_DIR"])
+        if kind == "socket":
+            self.bridge = SocketBridge(directory)
+        elif kind == "file":
+            self.bridge = FileBridge(directory)
+        elif kind == "none":
+            self.bridge = LocalBridge()
+        else:
+            raise ValueError(f"OLDTUBE_EVENTS_BRIDGE must be none, socket or file, not {kind!r}")
+        self.max_queue = int(app.config.get("OLDTUBE_EVENTS_QUEUE", 64))
+        self.max_clients = int(app.config.get("OLDTUBE_EVENTS_MAX_CLIENTS", 1000))
+        self.max_threaded = int(app.config.get("OLDTUBE_EVENTS_WSGI_CLIENTS", 4))
+        self.heartbeat = float(app.config.get("OLDTUBE_EVENTS_HEARTBEAT", 15))
+        self.lifetime = float(app.config.get("OLDTUBE_EVENTS_STREAM_SECONDS", 300))
+        app.extensions["oldtube_events"] = self
+
+    @property
+    def clients(self) -> int:
+        return self._clients
+
+    def publish(self, channel: str, kind: str, data: dict) -> None:
+        self.published += 1
+        self._deliver(channel, kind, data)
+        try:
+            self.bridge.send(channel, kind, data)
+        except OSError:
+            pass  # other workers miss this one; never fail the request over it
+
+    def _deliver(self, channel: str, kind: str, data: dict) -> None:
+        with self._lock:
+            subs = list(self._subs.get(channel, ()))
+        if not subs:
+            return
+        frame = sse_frame(kind, data)
+        for sub in subs:
+            if not sub.put(frame):
+                self.dropped += 1
+
+    def subscribe(self, channels: Iterable[str], threaded: bool = True) -> Optional[Subscription]:
+        """A new subscription, or None when this process is at max_clients
+        (or, for one that will hold a server thread, at max_threaded)."""
+        self.bridge.start(self._deliver)
+        sub = Subscription(tuple(channels), self.max_queue, threaded)
+        with self._lock:
+            if self._clients >= self.max_clients or (threaded and self._threaded >= self.max_threaded):
+                return None
+            self._clients += 1
+            self._threaded += threaded
+            for ch in sub.channels:
+                self._subs.setdefault(ch, set()).add(sub)
+        metrics.set("oldtube_event_clients", self._clients)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            if not sub.active:
+                return
+            sub.active = False
+            for ch in sub.channels:
+                subs = self._subs.get(ch)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subs[ch]
+            self._clients -= 1
+            self._threaded -= sub.threaded
+        metrics.set("oldtube_event_clients", self._clients)
+
+    def stream(self, sub: Subscription, first: Iterable[bytes] = ()) -> EventStream:
+        return EventStream(self, sub, first)
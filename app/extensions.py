@@ -2,7 +2,17 @@ from __future__ import annotations
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 
+from .assets import StaticAssets
+from .cache import PageCache, UserCache
+from .events import EventHub
+from .storage import MediaStorage
+
 db = SQLAlchemy()
 login_manager = LoginManager()
 login_manager.login_view = "videos.home"
 login_manager.login_message_category = "err"
+page_cache = PageCache()
+user_cache = UserCache()
+storage = MediaStorage()
+assets = StaticAssets()
+events = EventHub()
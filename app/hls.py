@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+from typing import Optional, Tuple
+
+from flask import current_app
+
+from .utils import ffmpeg_available, probe_media, run_ffmpeg
+
+HLS_SUBDIR = "hls"
+
+
+def parse_ladder(spec: str) -> list[tuple[int, int]]:
+    """"240:400k,480:1000k" -> [(240, 400000), (480, 1000000)]"""
+    out = []
+    for item in spec.split(","):
+        if ":" not in item:
+            continue
+        height, rate = item.strip().split(":", 1)
+        rate = rate.strip().lower()
+        mult = 1000 if rate.endswith("k") else 1000000 if rate.endswith("m") else 1
+        out.append((int(height), int(float(rate.rstrip("km")) * mult)))
+    return sorted(out)
+
+
+def package_hls(video_path: Path, out_dir: Path,
+                source_size: Optional[Tuple[int, int]] = None) -> Tuple[bool, Optional[str]]:
+    """Encode an HLS ladder (one VOD playlist per rendition) plus master.m3u8.
+
+    Rungs taller than the source (`source_size`, probed when not given) are
+    left out; a source below the lowest rung gets one rendition at its own
+    height. Errors ending in "(HLS skipped)" won't go away on a retry.
+    """
+    if not ffmpeg_available():
+        return False, "ffmpeg not found (HLS skipped)"
+    ladder = parse_ladder(current_app.config.get("OLDTUBE_HLS_LADDER", ""))
+    if not ladder:
+        return False, "empty OLDTUBE_HLS_LADDER (HLS skipped)"
+    if not source_size or not all(source_size):
+        meta = probe_media(video_path) or {}
+        source_size = (meta.get("width"), meta.get("height"))
+    src_w, src_h = source_size
+    if not src_w or not src_h:
+        return False, "no video stream (HLS skipped)"
+    ladder = [r for r in ladder if r[0] <= src_h] or [(src_h, ladder[0][1])]
+    seg = str(int(current_app.config.get("OLDTUBE_HLS_SEGMENT_SECONDS", 6)))
+
+    tmp_dir = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    master = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for height, bitrate in ladder:
+        name = f"{height}p"
+        (tmp_dir / name).mkdir()
+        ok, msg = run_ffmpeg([
+            "-y", "-i", str(video_path),
+            # never upscale, even if the probed size was off
+            "-vf", f"scale=-2:'min({height},ih)'",
+            "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main",
+            "-b:v", str(bitrate), "-maxrate", str(int(bitrate * 1.07)), "-bufsize", str(bitrate * 2),
+            # keyframe at every segment boundary so renditions switch cleanly
+            "-force_key_frames", f"expr:gte(t,n_forced*{seg})",
+            "-c:a", "aac", "-b:a", "96k" if height < 480 else "128k", "-ac", "2",
+            "-f", "hls", "-hls_time", seg, "-hls_playlist_type", "vod",
+            "-hls_segment_filename", str(tmp_dir / name / "seg_%04d.ts"),
+            str(tmp_dir / name / "index.m3u8"),
+        ])
+        if not ok:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False, f"HLS {name} failed: {msg}"
+        # players choose renditions by RESOLUTION: the size actually encoded
+        out = probe_media(tmp_dir / name / "seg_0000.ts") or {}
+        width, out_h = out.get("width"), out.get("height")
+        if not width or not out_h:
+            out_h = min(height, src_h)
+            width = round(src_w * out_h / src_h / 2) * 2
+        master.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bitrate + 128000},RESOLUTION={width}x{out_h},NAME=\"{name}\"")
+        master.append(f"{name}/index.m3u8")
+    (tmp_dir / "master.m3u8").write_text("\n".join(master) + "\n")
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    tmp_dir.rename(out_dir)
+    return True, None
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from flask import current_app
+
+from .utils import allowed_video
+
+
+def find_videos(root: Path) -> Iterator[Path]:
+    """Every importable file below `root`, in a stable order (hidden entries skipped)."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if not name.startswith(".") and allowed_video(name):
+                yield Path(dirpath) / name
+
+
+def title_for(path: Path) -> str:
+    return " ".join(path.stem.replace("_", " ").replace("-", " ").split())[:120] or "video"
+
+
+def import_file(path: Path) -> dict:
+    """Hash, stage, convert, thumbnail and store one file; the archive copy is
+    left untouched. Returns the columns for its Video row, or a "skipped"
+    result when those bytes are already in the catalog (which is what makes a
+    re-run pick up where an interrupted one stopped)."""
+    from .extensions import db, storage
+    from .models import Video
+    from .storage import content_key, file_sha256
+    from .utils import MEDIA_FIELDS, convert_to_mp4_if_needed, generate_thumbnail, probe_media, unique_name
+
+    started = time.perf_counter()
+    size = path.stat().st_size
+    digest = file_sha256(path)
+    if db.session.query(Video.id).filter_by(content_hash=digest).first() is not None:
+        return {"path": str(path), "status": "skipped", "bytes": size, "seconds": time.perf_counter() - started}
+
+    in_ext = path.suffix.lower().lstrip(".")
+    staged = current_app.config["VIDEOS_DIR"] / unique_name(f"{path.stem}-{digest[:8]}", in_ext)
+    shutil.copyfile(path, staged)
+    meta = probe_media(staged)
+    final_path, final_ext, err = convert_to_mp4_if_needed(staged, meta)
+    if err and err.startswith("Convert failed"):
+        final_path.unlink(missing_ok=True)
+        return {"path": str(path), "status": "failed", "error": err.splitlines()[0],
+                "bytes": size, "seconds": time.perf_counter() - started}
+    if final_path != staged:
+        meta = probe_media(final_path)
+    thumb_name, _terr = generate_thumbnail(final_path, path.stem)
+    key = content_key(digest, final_ext)
+    storage.videos.put(final_path, key)
+    return {
+        "path": str(path),
+        "status": "imported",
+        "bytes": size,
+        "seconds": time.perf_counter() - started,
+        "row": {
+            "title": title_for(path),
+            "filename": key,
+            "content_hash": digest,
+            "ext": final_ext,
+            "original_name": path.name[:200],
+            "thumb_filename": thumb_name,
+            "status": "ready",
+            **{name: (meta or {}).get(name) for name in MEDIA_FIELDS},
+        },
+    }
+
+
+_pool_app = None
+
+
+def _pool_init() -> None:
+    global _pool_app
+    from . import create_app
+
+    _pool_app = create_app()
+
+
+def _pool_import(path: str) -> dict:
+    from .extensions import db
+
+    with _pool_app.app_context():
+        try:
+            return import_file(Path(path))
+        except Exception as e:
+            return {"path": path, "status": "failed", "error": str(e) or e.__class__.__name__,
+                    "bytes": 0, "seconds": 0.0}
+        finally:
+            db.session.remove()
+
+
+def _pool_thumbs(video_id: int):
+    from .extensions import db
+    from .thumbs import render_for_video
+
+    with _pool_app.app_context():
+        try:
+            return render_for_video(video_id)
+        finally:
+            db.session.remove()
+
+
+@dataclass
+class ImportStats:
+    found: int = 0
+    imported: int = 0
+    skipped: int = 0
+    failed: int = 0
+    bytes: int = 0
+    work_seconds: float = 0.0
+    started: float = field(default_factory=time.perf_counter)
+    errors: list = field(default_factory=list)
+
+    @property
+    def done(self) -> int:
+        return self.imported + self.skipped + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+def import_directory(root: Path, user_id: int, processes: int, batch_size: int = 50,
+                     on_progress: Optional[Callable[[ImportStats], None]] = None) -> ImportStats:
+    """Import every video below `root` for `user_id`.
+
+    Files are processed on a pool of `processes` app workers (spawned, each
+    with its own app and DB connections); the parent inserts the finished rows
+    `batch_size` at a time and, once every file is in, hands the new ids back
+    to the pool for thumbnail derivatives. Rows finished before an
+    interruption are kept, and files whose bytes are already in the catalog
+    are skipped, so re-running the same command resumes the import; that
+    run also renders the derivatives (and queues the HLS packaging) the
+    interrupted one never got to.
+    """
+    from .counters import bump
+    from .extensions import db, page_cache
+    from .jobs import enqueue
+    from .models import Job, User, Video
+
+    paths = [str(p) for p in find_videos(root)]
+    stats = ImportStats(found=len(paths))
+    render_thumbs = bool(current_app.config.get("OLDTUBE_THUMBNAIL", True))
+    pending: list[dict] = []
+    seen: set[str] = set()
+    new_ids: list[int] = []
+
+    # this user's rows from an earlier, interrupted run that stopped before
+    # (or during) the derivative phase
+    earlier = db.session.query(Video.id).filter(Video.uploader_id == user_id, Video.status == "ready")
+    thumb_ids = [vid for (vid,) in earlier.filter(Video.thumb_derivatives.is_(None))] if render_thumbs else []
+    hls_ids = []
+    if current_app.config.get("OLDTUBE_HLS"):
+        # not the ones whose packaging is still waiting in the job queue
+        queued = db.exists().where(Job.video_id == Video.id, Job.kind == "package_hls",
+                                   Job.status.in_(("queued", "running")))
+        hls_ids = [vid for (vid,) in earlier.filter(Video.hls_dir.is_(None), ~queued)]
+
+    def flush() -> None:
+        if not pending:
+            return
+        rows = [dict(r, uploader_id=user_id) for r in pending]
+        db.session.execute(db.insert(Video), rows)
+        bump(User, user_id, video_count=len(rows))
+        db.session.commit()
+        new_ids.extend(vid for (vid,) in db.session.query(Video.id).filter(
+            Video.uploader_id == user_id, Video.content_hash.in_([r["content_hash"] for r in rows])))
+        pending.clear()
+
+    def collect(r: dict) -> None:
+        stats.bytes += r["bytes"]
+        stats.work_seconds += r["seconds"]
+        row = r.get("row")
+        if r["status"] == "imported" and row["content_hash"] in seen:
+            r["status"] = "skipped"  # the same file twice in this run
+        if r["status"] == "imported":
+            seen.add(row["content_hash"])
+            pending.append(row)
+            stats.imported += 1
+        elif r["status"] == "skipped":
+            stats.skipped += 1
+        else:
+            stats.failed += 1
+            stats.errors.append((r["path"], r.get("error")))
+
+    ctx = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(max_workers=processes, mp_context=ctx, initializer=_pool_init)
+    todo = iter(paths)
+    # a short queue: results stream back as files finish, and an interruption
+    # loses at most this many files' work
+    window = processes * 2
+    running: set = set()
+    try:
+        while True:
+            while len(running) < window:
+                path = next(todo, None)
+                if path is None:
+                    break
+                running.add(pool.submit(_pool_import, path))
+            if not running:
+                break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                collect(fut.result())
+            if len(pending) >= batch_size:
+                flush()
+            if on_progress:
+                on_progress(stats)
+        flush()
+    except BaseException:
+        # keep every row that finished; a re-run skips them by content hash
+        pool.shutdown(wait=False, cancel_futures=True)
+        flush()
+        page_cache.invalidate("videos")
+        raise
+
+    with pool:
+        if render_thumbs:
+            done = 0
+            for fut in as_completed([pool.submit(_pool_thumbs, vid) for vid in thumb_ids + new_ids]):
+                vid, manifest, _err = fut.result()
+                if manifest:
+                    db.session.execute(db.update(Video).where(Video.id == vid).values(thumb_derivatives=manifest))
+                    done += 1
+                    if done % batch_size == 0:
+                        db.session.commit()
+            db.session.commit()
+    page_cache.invalidate("videos")
+    if current_app.config.get("OLDTUBE_HLS"):
+        for vid in hls_ids + new_ids:
+            enqueue("package_hls", video_id=vid)
+    return stats
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from flask import Flask, before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_local = threading.local()
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 120.0, 600.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = self.buckets[i - 1] if i > 0 else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lo + (hi - lo) * ((rank - seen) / n)
+            seen += n
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Process-local counters and histograms, rendered in Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counters: dict[tuple[str, tuple], float] = {}
+        self.histograms: dict[tuple[str, tuple], Histogram] = {}
+        self.gauges: dict[tuple[str, tuple], float] = {}
+        self.help: dict[str, str] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = Histogram(buckets)
+            h.observe(value)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            scalars = [(k, v, "counter") for k, v in sorted(self.counters.items())]
+            scalars += [(k, v, "gauge") for k, v in sorted(self.gauges.items())]
+            histograms = sorted(self.histograms.items(), key=lambda kv: kv[0])
+            typed = set()
+            for (name, labels), value, kind in scalars:
+                if name not in typed:
+                    typed.add(name)
+                    if name in self.help:
+                        lines.append(f"# HELP {name} {self.help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_num(value)}")
+            for (name, labels), h in histograms:
+                if name not in typed:
+                    typed.add(name)
+                    if name in self.help:
+                        lines.append(f"# HELP {name} {self.help[name]}")
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += n
+                    le = bound if bound == "+Inf" else _fmt_num(bound)
+                    lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_num(h.sum)}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def endpoint_summary(self) -> list[dict]:
+        rows = []
+        with self._lock:
+            for (name, labels), h in self.histograms.items():
+                if name != "oldtube_request_seconds":
+                    continue
+                lab = dict(labels)
+                queries = self.histograms.get(("oldtube_request_queries", (("endpoint", lab["endpoint"]),)))
+                rows.append({
+                    "endpoint": lab["endpoint"],
+                    "method": lab["method"],
+                    "count": h.count,
+                    "avg_ms": 1000 * h.sum / h.count if h.count else 0.0,
+                    "p50_ms": 1000 * h.quantile(0.5),
+                    "p95_ms": 1000 * h.quantile(0.95),
+                    "p99_ms": 1000 * h.quantile(0.99),
+                    "avg_queries": queries.sum / queries.count if queries and queries.count else 0.0,
+                })
+        return sorted(rows, key=lambda r: -r["count"] * r["avg_ms"])
+
+
+def _fmt_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+    return "{" + body + "}"
+
+
+def _fmt_num(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) and not float(v).is_integer() else str(int(v))
+
+
+metrics = Metrics()
+metrics.help.update({
+    "oldtube_request_seconds": "Request latency by endpoint.",
+    "oldtube_requests_total": "Requests by endpoint and status.",
+    "oldtube_request_queries": "SQL statements per request.",
+    "oldtube_sql_seconds": "SQL statement latency.",
+    "oldtube_template_seconds": "Template render time.",
+    "oldtube_ffmpeg_seconds": "ffmpeg run time.",
+    "oldtube_stream_bytes_total": "Bytes sent by media streaming responses.",
+    "oldtube_stream_seconds_total": "Wall time spent streaming media responses.",
+    "oldtube_media_streams": "Responses the async media server is streaming.",
+    "oldtube_event_clients": "Open /events (Server-Sent Events) streams.",
+})
+
+
+class QueryCounter:
+    def __init__(self) -> None:
+        self.count = 0
+        self.statements: list[str] = []
+
+
+def _on_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("oldtube_query_start", []).append(time.perf_counter())
+    if has_request_context():
+        g.query_count = g.get("query_count", 0) + 1
+    for qc in getattr(_local, "counters", ()):
+        qc.count += 1
+        qc.statements.append(statement)
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    starts = conn.info.get("oldtube_query_start")
+    if starts:
+        metrics.observe("oldtube_sql_seconds", time.perf_counter() - starts.pop())
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """Count SQL statements run on this thread, e.g. around a test-client call:
+
+        with count_queries() as qc:
+            client.get("/videos")
+        assert qc.count <= 3
+    """
+    qc = QueryCounter()
+    stack = _local.__dict__.setdefault("counters", [])
+    stack.append(qc)
+    try:
+        yield qc
+    finally:
+        stack.remove(qc)
+
+
+def query_count() -> int:
+    return g.get("query_count", 0) if has_request_context() else 0
+
+
+def record_ffmpeg(seconds: float, ok: bool) -> None:
+    metrics.observe("oldtube_ffmpeg_seconds", seconds, ok=str(ok).lower())
+
+
+def record_stream(nbytes: int, started: float, kind: str) -> None:
+    metrics.inc("oldtube_stream_bytes_total", nbytes, kind=kind)
+    metrics.inc("oldtube_stream_seconds_total", time.perf_counter() - started, kind=kind)
+
+
+def _before_render(sender, template, context, **extra) -> None:
+    if has_request_context():
+        g.setdefault("template_starts", []).append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra) -> None:
+    starts = g.get("template_starts") if has_request_context() else None
+    if starts:
+        metrics.observe("oldtube_template_seconds", time.perf_counter() - starts.pop(),
+                        template=template.name or "?")
+
+
+def init_instrumentation(app: Flask) -> None:
+    if not event.contains(Engine, "before_cursor_execute", _on_execute):
+        event.listen(Engine, "before_cursor_execute", _on_execute)
+        event.listen(Engine, "after_cursor_execute", _after_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.get("request_started")
+        if started is not None:
+            endpoint = request.endpoint or "unmatched"
+            metrics.observe("oldtube_request_seconds", time.perf_counter() - started,
+                            endpoint=endpoint, method=request.method)
+            metrics.observe("oldtube_request_queries", query_count(), buckets=COUNT_BUCKETS, endpoint=endpoint)
+            metrics.inc("oldtube_requests_total", endpoint=endpoint, status=str(response.status_code))
+        if app.config.get("OLDTUBE_QUERY_COUNT_HEADER"):
+            response.headers["X-Query-Count"] = str(query_count())
+        return response
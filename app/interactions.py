@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from .counters import bump
+from .extensions import db, events, page_cache
+from .models import Comment, Favorite, Like, Rating, User, Video
+from .rankings import activity
+
+ACTIONS = ("like", "unlike", "favorite", "unfavorite", "rate", "comment")
+MAX_COMMENT = 500
+
+
+class InteractionError(Exception):
+    def __init__(self, message: str, status: int = 400, index: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.index = index
+
+
+@dataclass
+class Action:
+    kind: str
+    video_id: int
+    stars: int = 0
+    body: str = ""
+
+
+def parse_action(data, index: Optional[int] = None) -> Action:
+    """{"action": "rate", "video_id": 3, "stars": 4} -> Action, or InteractionError."""
+    if not isinstance(data, dict):
+        raise InteractionError("each action must be an object", index=index)
+    kind = data.get("action")
+    if kind not in ACTIONS:
+        raise InteractionError(f"action must be one of: {', '.join(ACTIONS)}", index=index)
+    video_id = data.get("video_id")
+    if not isinstance(video_id, int) or isinstance(video_id, bool) or video_id <= 0:
+        raise InteractionError("video_id must be a positive integer", index=index)
+    action = Action(kind, video_id)
+    if kind == "rate":
+        action.stars = data.get("stars")
+        if not isinstance(action.stars, int) or isinstance(action.stars, bool) or not 1 <= action.stars <= 5:
+            raise InteractionError("Choose 1 to 5 stars.", index=index)
+    elif kind == "comment":
+        action.body = (data.get("body") or "").strip() if isinstance(data.get("body"), str) else ""
+        if not action.body:
+            raise InteractionError("Comment can't be empty.", index=index)
+        if len(action.body) > MAX_COMMENT:
+            raise InteractionError(f"Max {MAX_COMMENT} characters.", index=index)
+    return action
+
+
+def set_like(user_id: int, video_id: int, on: bool) -> bool:
+    """Make the like exist (or not); True when that changed anything."""
+    if on:
+        changed = db.session.execute(
+            insert(Like).values(video_id=video_id, user_id=user_id)
+            .on_conflict_do_nothing(index_elements=[Like.video_id, Like.user_id])
+            .returning(Like.id)
+        ).first() is not None
+    else:
+        changed = db.session.execute(
+            db.delete(Like).where(Like.video_id == video_id, Like.user_id == user_id)
+        ).rowcount > 0
+    if changed:
+        bump(Video, video_id, like_count=1 if on else -1)
+        bump(User, user_id, like_count=1 if on else -1)
+    return changed
+
+
+def set_favorite(user_id: int, video_id: int, on: bool) -> bool:
+    if on:
+        changed = db.session.execute(
+            insert(Favorite).values(video_id=video_id, user_id=user_id)
+            .on_conflict_do_nothing(index_elements=[Favorite.video_id, Favorite.user_id])
+            .returning(Favorite.id)
+        ).first() is not None
+    else:
+        changed = db.session.execute(
+            db.delete(Favorite).where(Favorite.video_id == video_id, Favorite.user_id == user_id)
+        ).rowcount > 0
+    if changed:
+        bump(Video, video_id, favorite_count=1 if on else -1)
+    return changed
+
+
+def rate(user_id: int, video_id: int, stars: int) -> None:
+    # the counters first, while the subquery still sees the previous rating
+    # (if any); both statements run in the caller's write transaction
+    old = (select(Rating.stars)
+           .where(Rating.video_id == video_id, Rating.user_id == user_id)
+           .scalar_subquery())
+    db.session.execute(db.update(Video).where(Video.id == video_id).values(
+        rating_sum=Video.rating_sum + stars - func.coalesce(old, 0),
+        rating_count=Video.rating_count + case((old.is_(None), 1), else_=0),
+    ))
+    stmt = insert(Rating).values(video_id=video_id, user_id=user_id, stars=stars)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[Rating.video_id, Rating.user_id], set_={"stars": stmt.excluded.stars},
+    ))
+
+
+def add_comment(user_id: int, video_id: int, body: str) -> dict:
+    row = db.session.execute(
+        insert(Comment).values(video_id=video_id, user_id=user_id, body=body)
+        .returning(Comment.id, Comment.created_at)
+    ).one()
+    bump(Video, video_id, comment_count=1)
+    bump(User, user_id, comment_count=1)
+    return {"id": row.id, "body": body, "created_at": row.created_at}
+
+
+def publish_comment(video_id: int, comment: dict, username: str) -> None:
+    """Push a committed comment to the video's open watch pages."""
+    events.publish(f"video:{video_id}", "comment", {**comment, "video_id": video_id, "user": username})
+
+
+def video_counts(video_ids) -> dict[int, dict]:
+    rows = db.session.execute(
+        select(Video.id, Video.like_count, Video.favorite_count, Video.comment_count,
+               Video.rating_sum, Video.rating_count, Video.view_count)
+        .where(Video.id.in_(video_ids))
+    )
+    return {r.id: {
+        "likes": r.like_count,
+        "favorites": r.favorite_count,
+        "comments": r.comment_count,
+        "ratings": r.rating_count,
+        "rating_avg": round(r.rating_sum / r.rating_count, 2) if r.rating_count else 0.0,
+        "views": r.view_count,
+    } for r in rows}
+
+
+def apply_actions(user, actions: list[Action]) -> dict:
+    """Apply `actions` for `user` (the logged-in identity) in one transaction.
+
+    Likes and favorites are set, not toggled, so retrying a request is
+    harmless; ratings replace the user's previous one. Returns a result per
+    action plus the touched videos' updated counters.
+    """
+    user_id = user.id
+    video_ids = {a.video_id for a in actions}
+    found = set(db.session.scalars(select(Video.id).where(Video.id.in_(video_ids))))
+    for i, a in enumerate(actions):
+        if a.video_id not in found:
+            raise InteractionError(f"no such video: {a.video_id}", 404, index=i)
+
+    results = []
+    recorded = []
+    comments = []
+    try:
+        for a in actions:
+            result = {"action": a.kind, "video_id": a.video_id}
+            if a.kind in ("like", "unlike"):
+                result["liked"] = a.kind == "like"
+                result["changed"] = set_like(user_id, a.video_id, result["liked"])
+                if result["changed"] and result["liked"]:
+                    recorded.append((a.video_id, "like"))
+            elif a.kind in ("favorite", "unfavorite"):
+                result["favorited"] = a.kind == "favorite"
+                result["changed"] = set_favorite(user_id, a.video_id, result["favorited"])
+                if result["changed"] and result["favorited"]:
+                    recorded.append((a.video_id, "favorite"))
+            elif a.kind == "rate":
+                rate(user_id, a.video_id, a.stars)
+                result["stars"] = a.stars
+                recorded.append((a.video_id, "rating"))
+            else:
+                result["comment"] = add_comment(user_id, a.video_id, a.body)
+                recorded.append((a.video_id, "comment"))
+                comments.append((a.video_id, result["comment"]))
+            results.append(result)
+        counts = video_counts(video_ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for video_id, kind in recorded:
+        activity.record(video_id, kind)
+    for video_id in video_ids:
+        page_cache.invalidate(f"video:{video_id}")
+    for video_id, comment in comments:
+        publish_comment(video_id, comment, user.username)
+    return {"results": results, "videos": {str(vid): c for vid, c in counts.items()}}
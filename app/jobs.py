@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import shutil
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, Optional
+
+from flask import current_app
+
+from .extensions import db, page_cache, storage
+from .models import Job, Video
+
+HANDLERS: dict[str, Callable[[Job, dict], None]] = {}
+# kinds whose final failure leaves the video unplayable (status "failed")
+CRITICAL_KINDS: set[str] = set()
+
+
+class JobError(Exception):
+    """Raised by a handler to fail the current attempt (it will be retried)."""
+
+
+def job_handler(kind: str, critical: bool = False):
+    def deco(fn):
+        HANDLERS[kind] = fn
+        if critical:
+            CRITICAL_KINDS.add(kind)
+        return fn
+    return deco
+
+
+def _now() -> int:
+    return int(time.time())
+
+
+def enqueue(kind: str, video_id: Optional[int] = None, **payload) -> Job:
+    job = Job(
+        kind=kind,
+        video_id=video_id,
+        payload=json.dumps(payload),
+        max_attempts=int(current_app.config.get("OLDTUBE_JOB_MAX_ATTEMPTS", 3)),
+        run_after=time.time(),
+    )
+    db.session.add(job)
+    db.session.commit()
+    # no worker pool configured: keep the old synchronous behaviour, one
+    # attempt per job; a failed one waits out its backoff and is retried by a
+    # later enqueue (or `flask worker`), not in a loop inside this request
+    if int(current_app.config.get("OLDTUBE_JOB_WORKERS", 0)) <= 0:
+        if _claim(job.id):
+            run_job(job)
+        while (retry := claim_next()) is not None:
+            run_job(retry)
+    return job
+
+
+def _claim(job_id: int) -> bool:
+    res = db.session.execute(
+        db.update(Job)
+        .where(Job.id == job_id, Job.status == "queued")
+        .values(status="running", locked_by=os.getpid(), locked_at=time.time(),
+                attempts=Job.attempts + 1, updated_at=_now())
+    )
+    db.session.commit()
+    if res.rowcount != 1:
+        return False
+    db.session.expire_all()
+    return True
+
+
+def claim_next() -> Optional[Job]:
+    while True:
+        job_id = db.session.execute(
+            db.select(Job.id)
+            .where(Job.status == "queued", Job.run_after <= time.time())
+            .order_by(Job.id)
+            .limit(1)
+        ).scalar()
+        if job_id is None:
+            return None
+        # another worker may win the race for this row; just try the next one
+        if _claim(job_id):
+            return db.session.get(Job, job_id)
+
+
+def run_job(job: Job) -> None:
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise JobError(f"unknown job kind: {job.kind}")
+        handler(job, json.loads(job.payload or "{}"))
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job.id)
+        job.error = (str(e) or e.__class__.__name__)[:2000]
+        if not isinstance(e, JobError):
+            job.error += "\n" + traceback.format_exc()[-2000:]
+        if job.attempts < job.max_attempts:
+            backoff = float(current_app.config.get("OLDTUBE_JOB_BACKOFF", 5.0))
+            job.status = "queued"
+            job.run_after = time.time() + backoff * (2 ** (job.attempts - 1))
+        else:
+            job.status = "failed"
+            if job.video_id and job.kind in CRITICAL_KINDS:
+                v = db.session.get(Video, job.video_id)
+                if v is not None:
+                    v.status = "failed"
+    else:
+        job.status = "done"
+        job.error = None
+    job.locked_by = None
+    job.locked_at = None
+    job.updated_at = _now()
+    db.session.commit()
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def recover_stale_jobs() -> int:
+    """Put `running` jobs back on the queue when their worker is gone or has
+    held them past OLDTUBE_JOB_TIMEOUT.
+
+    Other pools may share the database (run.py's plus `flask worker`), so a
+    starting pool reclaims only these, never every running job.
+    """
+    timeout = float(current_app.config.get("OLDTUBE_JOB_TIMEOUT", 1800))
+    n = 0
+    for job in Job.query.filter_by(status="running").all():
+        if not _pid_alive(job.locked_by) or (job.locked_at or 0) < time.time() - timeout:
+            job.status = "queued"
+            job.locked_by = None
+            job.locked_at = None
+            job.run_after = time.time()
+            job.updated_at = _now()
+            n += 1
+    if n:
+        db.session.commit()
+    return n
+
+
+def _worker_main(poll: float) -> None:
+    from . import create_app
+
+    app = create_app()
+    with app.app_context():
+        while True:
+            job = claim_next()
+            if job is None:
+                db.session.remove()
+                time.sleep(poll)
+                continue
+            run_job(job)
+            db.session.remove()
+
+
+class WorkerPool:
+    def __init__(self, app, concurrency: Optional[int] = None):
+        self.app = app
+        self.concurrency = concurrency or int(app.config.get("OLDTUBE_JOB_WORKERS", 1)) or 1
+        self.poll = float(app.config.get("OLDTUBE_JOB_POLL", 1.0))
+        self.procs: list[multiprocessing.Process] = []
+        # spawn, not fork: workers must not share the parent's SQLite connections
+        self._ctx = multiprocessing.get_context("spawn")
+
+    def _spawn(self) -> multiprocessing.Process:
+        p = self._ctx.Process(target=_worker_main, args=(self.poll,), name="oldtube-worker", daemon=True)
+        p.start()
+        return p
+
+    def start(self) -> "WorkerPool":
+        with self.app.app_context():
+            recover_stale_jobs()
+        self.procs = [self._spawn() for _ in range(self.concurrency)]
+        return self
+
+    def supervise(self) -> None:
+        """Block forever, restarting dead workers and reclaiming their jobs."""
+        try:
+            while True:
+                time.sleep(self.poll * 5)
+                dead = [p for p in self.procs if not p.is_alive()]
+                if not dead:
+                    continue
+                with self.app.app_context():
+                    recover_stale_jobs()
+                self.procs = [p for p in self.procs if p.is_alive()]
+                self.procs += [self._spawn() for _ in dead]
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        for p in self.procs:
+            if p.is_alive():
+                p.terminate()
+        for p in self.procs:
+            p.join(timeout=5)
+        self.procs = []
+
+
+@job_handler("process_video", critical=True)
+def _process_video(job: Job, payload: dict) -> None:
+    from .uploads import publish_video
+    from .utils import convert_to_mp4_if_needed, generate_thumbnail, probe_media
+
+    v = db.session.get(Video, job.video_id)
+    if v is None:
+        return
+    videos_dir = current_app.config["VIDEOS_DIR"]
+    # the staged file is local until it's published
+    meta = probe_media(videos_dir / v.filename) if payload.get("publish") else None
+
+    if payload.get("convert"):
+        in_path = videos_dir / v.filename
+        # H.264/AAC sources are remuxed rather than re-encoded
+        final_path, final_ext, conv_err = convert_to_mp4_if_needed(in_path, meta)
+        if conv_err and conv_err.startswith("Convert failed"):
+            raise JobError(conv_err)
+        if final_path != in_path:
+            meta = probe_media(final_path)
+        v.filename = final_path.name
+        v.ext = final_ext
+        db.session.commit()
+    if meta:
+        _apply_media(v, meta)
+
+    if payload.get("thumbnail") and not v.thumb_filename:
+        tname, _terr = generate_thumbnail(videos_dir / v.filename, payload.get("base") or "video")
+        v.thumb_filename = tname
+
+    if payload.get("publish"):
+        publish_video(v, videos_dir / v.filename)
+    v.status = "ready"
+    db.session.commit()
+    page_cache.invalidate("videos", f"video:{v.id}")
+
+    if current_app.config.get("OLDTUBE_THUMBNAIL", True):
+        enqueue("thumbnails", video_id=v.id)
+    if current_app.config.get("OLDTUBE_HLS"):
+        enqueue("package_hls", video_id=v.id)
+
+
+def _apply_media(v: Video, meta: dict) -> None:
+    from .utils import MEDIA_FIELDS
+
+    for name in MEDIA_FIELDS:
+        setattr(v, name, meta.get(name))
+
+
+@job_handler("probe_media")
+def _probe_media(job: Job, payload: dict) -> None:
+    from .utils import probe_media
+
+    v = db.session.get(Video, job.video_id)
+    if v is None:
+        return
+    with storage.videos.fetch(v.filename) as path:
+        meta = probe_media(path)
+    if meta is None:
+        # no ffprobe/ffmpeg here, or not a media file: nothing worth retrying
+        return
+    _apply_media(v, meta)
+    db.session.commit()
+    page_cache.invalidate("videos", f"video:{v.id}")
+
+
+@job_handler("thumbnails")
+def _thumbnails(job: Job, payload: dict) -> None:
+    from .thumbs import render_for_video
+
+    _vid, manifest, err = render_for_video(job.video_id)
+    if err == "missing":
+        return
+    if manifest is None:
+        if err and "ffmpeg not found" in err:
+            return
+        raise JobError(err or "no thumbnails produced")
+    db.session.get(Video, job.video_id).thumb_derivatives = manifest
+    db.session.commit()
+    page_cache.invalidate("videos", f"video:{job.video_id}")
+
+
+@job_handler("package_hls")
+def _package_hls(job: Job, payload: dict) -> None:
+    from .hls import HLS_SUBDIR, package_hls
+    from .utils import unique_name
+
+    v = db.session.get(Video, job.video_id)
+    if v is None:
+        return
+    videos_dir = current_app.config["VIDEOS_DIR"]
+    # a fresh directory per run lets playlists/segments be served as immutable
+    name = unique_name(Path(v.filename).stem, "hls")
+    with storage.videos.fetch(v.filename) as path:
+        ok, err = package_hls(path, videos_dir / HLS_SUBDIR / name, (v.width, v.height))
+    if not ok:
+        if err and "(HLS skipped)" in err:
+            # no ffmpeg, no ladder or no video stream: retrying won't change that
+            return
+        raise JobError(err)
+    old = v.hls_dir
+    v.hls_dir = name
+    db.session.commit()
+    # re-uploads of the same file share their ladder
+    if old and not db.session.query(Video.id).filter_by(hls_dir=old).first():
+        shutil.rmtree(videos_dir / HLS_SUBDIR / old, ignore_errors=True)
+    page_cache.invalidate(f"video:{v.id}")
+
+
+@job_handler("refresh_rankings")
+def _refresh_rankings(job: Job, payload: dict) -> None:
+    from .rankings import refresh_rankings
+
+    refresh_rankings()
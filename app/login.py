@@ -1,9 +1,68 @@
 from __future__ import annotations
-from .extensions import login_manager
+from functools import wraps
+from typing import Optional
+
+from flask import current_app, g
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .cache import UserIdentity
+from .extensions import db, login_manager, user_cache
 from .models import User
 
+# a cached identity goes stale when one of these changes
+_IDENTITY_ATTRS = ("username", "password_hash", "is_admin")
+
+
+def _load_identity(user_id: int) -> Optional[UserIdentity]:
+    row = db.session.execute(
+        db.select(User.id, User.username, User.is_admin).where(User.id == user_id)
+    ).first()
+    return UserIdentity(row.id, row.username, bool(row.is_admin)) if row else None
+
+
 @login_manager.user_loader
 def load_user(user_id: str):
     if not user_id or not user_id.isdigit():
         return None
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id), _load_identity)
+
+
+def skip_user_load(fn):
+    """For public views that never look at the user (media, thumbnails): the
+    request runs as anonymous without touching the session's user id."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        g._login_user = current_app.login_manager.anonymous_user()
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+@event.listens_for(User, "after_update")
+def _user_changed(mapper, connection, target) -> None:
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in _IDENTITY_ATTRS):
+        _pending(state.session).add(target.id)
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target) -> None:
+    _pending(inspect(target).session).add(target.id)
+
+
+def _pending(session: Optional[Session]) -> set:
+    return session.info.setdefault("oldtube_stale_users", set()) if session is not None else set()
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_stale(session: Session) -> None:
+    # only after commit: invalidating at flush time would let another request
+    # re-cache the old row before this transaction lands
+    stale = session.info.pop("oldtube_stale_users", None)
+    if stale:
+        user_cache.invalidate(*stale)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_stale(session: Session) -> None:
+    session.info.pop("oldtube_stale_users", None)
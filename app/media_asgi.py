@@ -0,0 +1,372 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import mimetypes
+import os
+import stat
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+
+from flask import Flask, Response
+
+from .instrumentation import metrics, record_stream
+from .rankings import direct_play
+from .storage import CONTENT_KEY
+from .streaming import if_range_ok, make_etag, multipart_layout, parse_ranges
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+MIN_CHUNK = 4096
+
+
+class Throttle:
+    """Per-connection bandwidth cap: the first `burst` bytes go out at full
+    speed (so start-up and seeks stay quick), after which the stream is held
+    to `rate` bytes per second on average."""
+
+    def __init__(self, rate: int, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.sent = 0
+        self.started = time.monotonic()
+
+    def delay(self, n: int) -> float:
+        """Account for `n` more bytes; seconds to wait before sending again."""
+        self.sent += n
+        if not self.rate or self.sent <= self.burst:
+            return 0.0
+        return self.started + (self.sent - self.burst) / self.rate - time.monotonic()
+
+
+class WsgiFallback:
+    """A WSGI app (the Flask site) as an ASGI app, run on `workers` threads by
+    a2wsgi, so pages and media can be served from one ASGI server."""
+
+    def __init__(self, wsgi_app, workers: int = 10):
+        self.wsgi_app = wsgi_app
+        self.workers = workers
+        self._asgi = None
+
+    async def __call__(self, scope, receive, send):
+        if self._asgi is None:
+            try:
+                from a2wsgi import WSGIMiddleware
+            except ImportError as e:
+                raise RuntimeError("serving pages from the ASGI app needs a2wsgi (pip install a2wsgi)") from e
+            self._asgi = WSGIMiddleware(self.wsgi_app, workers=self.workers)
+        await self._asgi(scope, receive, send)
+
+
+class MediaApp:
+    """ASGI app for /media/video, /media/thumb, /media/hls and /events.
+
+    Same URLs, files and caching headers as the Flask views in
+    app/blueprints/videos/routes.py, but a slow client costs a coroutine
+    instead of a WSGI thread. Files are read with os.pread on a small thread
+    pool one chunk at a time, and the next chunk is read only once the server
+    has taken the previous one (ASGI `send` waits while the socket buffer is
+    full), so a stalled client holds at most one chunk of memory.
+
+    /events (Server-Sent Events) is answered the same way: the Flask view's
+    checks run once on the thread pool, then the open stream waits on the
+    event loop, so live pages don't tie up the fallback's threads.
+
+    Any other path goes to `fallback` (an ASGI app, e.g. WsgiFallback around
+    the Flask app), or gets a 404. With OLDTUBE_STORAGE=s3 media requests go
+    to the fallback too: those answers are redirects or small thumbnails.
+    """
+
+    def __init__(self, flask_app: Flask, fallback=None):
+        from .blueprints.videos.routes import HLS_MIMETYPES
+        from .hls import HLS_SUBDIR
+        from .thumbs import DERIVED_SUBDIR
+
+        cfg = flask_app.config
+        self.flask_app = flask_app
+        self.fallback = fallback
+        self.local = cfg.get("OLDTUBE_STORAGE", "local") == "local"
+        self.roots = {
+            "video": Path(cfg["VIDEOS_DIR"]),
+            "thumb": Path(cfg["THUMBS_DIR"]),
+            "hls": Path(cfg["VIDEOS_DIR"]) / HLS_SUBDIR,
+        }
+        self.hls_mimetypes = HLS_MIMETYPES
+        self.derived_prefix = DERIVED_SUBDIR + "/"
+        self.rate = int(cfg.get("OLDTUBE_MEDIA_RATE_KBPS", 0)) * 1024
+        self.burst = int(cfg.get("OLDTUBE_MEDIA_BURST_KB", 2048)) * 1024
+        chunk = int(cfg.get("OLDTUBE_MEDIA_CHUNK_KB", 256)) * 1024
+        # a capped stream is paced in smaller writes, about four a second
+        self.chunk = max(MIN_CHUNK, min(chunk, self.rate // 4)) if self.rate else chunk
+        self.io = ThreadPoolExecutor(max_workers=int(cfg.get("OLDTUBE_MEDIA_IO_THREADS", 8)),
+                                     thread_name_prefix="oldtube-media-io")
+        self.streams = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] == "http" and scope["method"] == "GET" and scope["path"] == "/events":
+            await self._events(scope, receive, send)
+            return
+        if scope["type"] == "http" and self.local and scope["method"] in ("GET", "HEAD"):
+            kind, _, key = scope["path"].removeprefix("/media/").partition("/")
+            if scope["path"].startswith("/media/") and kind in self.roots and key:
+                await self._serve(scope, receive, send, kind, key)
+                return
+        if self.fallback is not None:
+            await self.fallback(scope, receive, send)
+            return
+        await _respond(send, 404, body=b"Not Found")
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # views counted since the last batch would otherwise be lost
+                await asyncio.get_running_loop().run_in_executor(None, self._flush_views)
+                self.io.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _stat(self, root: Path, key: str) -> Optional[os.stat_result]:
+        path = root / key
+        try:
+            path.resolve().relative_to(root.resolve())
+            st = path.stat()
+        except (ValueError, OSError):
+            return None
+        return st if stat.S_ISREG(st.st_mode) else None
+
+    async def _serve(self, scope, receive, send, kind: str, key: str) -> None:
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        root = self.roots[kind]
+        st = await loop.run_in_executor(self.io, self._stat, root, key)
+        if st is None:
+            await _respond(send, 404, body=b"Not Found")
+            return
+
+        size = st.st_size
+        etag = make_etag(st)
+        if kind == "hls":
+            mime = self.hls_mimetypes.get(Path(key).suffix.lower())
+        else:
+            mime, _ = mimetypes.guess_type(key)
+        mime = mime or "application/octet-stream"
+        out = [
+            ("accept-ranges", "bytes"),
+            ("etag", f'"{etag}"'),
+            ("last-modified", formatdate(st.st_mtime, usegmt=True)),
+        ]
+        # every HLS packaging run and every derivative/content-keyed thumbnail
+        # gets a fresh name, so those files never change
+        if kind == "hls" or (kind == "thumb" and (key.startswith(self.derived_prefix) or CONTENT_KEY.match(key))):
+            out.append(("cache-control", IMMUTABLE))
+        else:
+            out.append(("cache-control", "no-cache"))
+
+        if _not_modified(headers, etag, st.st_mtime):
+            await _respond(send, 304, out)
+            return
+
+        range_header = headers.get("range") if kind == "video" else None
+        ranges = parse_ranges(range_header, size) if range_header else None
+        if ranges is not None and not if_range_ok(headers.get("if-range"), etag, st.st_mtime):
+            ranges = None
+        if ranges == []:
+            await _respond(send, 416, [("content-range", f"bytes */{size}"), ("accept-ranges", "bytes")])
+            return
+
+        trailer = b""
+        if ranges is None:
+            status, parts, length = 200, [(b"", 0, size - 1)], size
+            out.append(("content-type", mime))
+        elif len(ranges) == 1:
+            (start, end), = ranges
+            status, parts, length = 206, [(b"", start, end)], end - start + 1
+            out += [("content-type", mime), ("content-range", f"bytes {start}-{end}/{size}")]
+        else:
+            boundary, parts, trailer, length = multipart_layout(ranges, size, mime)
+            status = 206
+            out.append(("content-type", f"multipart/byteranges; boundary={boundary}"))
+        out.append(("content-length", str(length)))
+
+        if kind == "video" and direct_play(range_header, headers.get("referer")):
+            loop.run_in_executor(None, self._count_view, key)
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.start", "status": status, "headers": _encode(out)})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await self._stream(receive, send, root / key, status, out, parts, trailer, started,
+                           "full" if status == 200 else "range" if len(parts) == 1 else "multirange")
+
+    async def _stream(self, receive, send, path: Path, status: int, headers: list, parts: list,
+                      trailer: bytes, started: float, kind: str) -> None:
+        loop = asyncio.get_running_loop()
+        # ASGI servers drop writes after a disconnect instead of failing them,
+        # so watch for it or a gone client would be "sent" the whole file
+        gone = asyncio.ensure_future(_disconnected(receive))
+        throttle = Throttle(self.rate, self.burst)
+        sent = 0
+        try:
+            fd = await loop.run_in_executor(self.io, os.open, path, os.O_RDONLY)
+        except OSError:
+            gone.cancel()
+            await _respond(send, 404, body=b"Not Found")
+            return
+        self.streams += 1
+        metrics.set("oldtube_media_streams", self.streams)
+        try:
+            await send({"type": "http.response.start", "status": status, "headers": _encode(headers)})
+            for head, start, end in parts:
+                if head:
+                    await send({"type": "http.response.body", "body": head, "more_body": True})
+                pos = start
+                while pos <= end:
+                    if gone.done():
+                        return
+                    buf = await loop.run_in_executor(self.io, os.pread, fd, min(self.chunk, end + 1 - pos), pos)
+                    if not buf:
+                        # truncated underneath us: end the response short
+                        return
+                    await send({"type": "http.response.body", "body": buf, "more_body": True})
+                    pos += len(buf)
+                    sent += len(buf)
+                    wait = throttle.delay(len(buf))
+                    if wait > 0:
+                        await asyncio.wait({gone}, timeout=wait)
+            await send({"type": "http.response.body", "body": trailer, "more_body": False})
+        finally:
+            gone.cancel()
+            os.close(fd)
+            self.streams -= 1
+            metrics.set("oldtube_media_streams", self.streams)
+            record_stream(sent, started, kind)
+
+    def _open_events(self, scope):
+        from .blueprints.extras.routes import open_event_stream
+
+        with self.flask_app.request_context(_environ(scope)):
+            return open_event_stream(threaded=False)
+
+    async def _events(self, scope, receive, send) -> None:
+        from .events import SSE_HEADERS
+
+        loop = asyncio.get_running_loop()
+        rv = await loop.run_in_executor(self.io, self._open_events, scope)
+        if isinstance(rv, Response):
+            await _respond(send, rv.status_code, [(k.lower(), v) for k, v in rv.headers.items()], rv.get_data())
+            return
+        gone = asyncio.ensure_future(_disconnected(receive))
+        frames = rv.frames()
+        try:
+            headers = [("content-type", "text/event-stream; charset=utf-8")]
+            headers += [(k.lower(), v) for k, v in SSE_HEADERS.items()]
+            await send({"type": "http.response.start", "status": 200, "headers": _encode(headers)})
+            while True:
+                # waits for the next frame or the client leaving, whichever is first
+                nxt = asyncio.ensure_future(frames.__anext__())
+                await asyncio.wait({nxt, gone}, return_when=asyncio.FIRST_COMPLETED)
+                if gone.done():
+                    nxt.cancel()
+                    await asyncio.wait({nxt})
+                    return
+                try:
+                    frame = nxt.result()
+                except StopAsyncIteration:
+                    break
+                await send({"type": "http.response.body", "body": frame, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            gone.cancel()
+            await frames.aclose()
+            rv.close()
+
+    def _count_view(self, key: str) -> None:
+        from .extensions import db
+        from .models import Video
+        from .rankings import activity
+
+        with self.flask_app.app_context():
+            try:
+                # re-uploads share a file; the first upload gets the view
+                vid = db.session.query(Video.id).filter_by(filename=key).order_by(Video.id).limit(1).scalar()
+                if vid is not None:
+                    activity.record(vid)
+                if activity.due:
+                    activity.flush()
+            except Exception:
+                db.session.rollback()
+                self.flask_app.logger.exception("media view count failed")
+
+    def _flush_views(self) -> None:
+        from .rankings import activity
+
+        with self.flask_app.app_context():
+            activity.flush()
+
+
+def _not_modified(headers: dict, etag: str, mtime: float) -> bool:
+    inm = headers.get("if-none-match")
+    if inm is not None:
+        tags = {t.strip().removeprefix("W/") for t in inm.split(",")}
+        return "*" in tags or f'"{etag}"' in tags
+    ims = headers.get("if-modified-since")
+    if ims:
+        try:
+            return int(parsedate_to_datetime(ims).timestamp()) >= int(mtime)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _environ(scope) -> dict:
+    """Enough of a WSGI environ for Flask to load the session and user."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        key = name.decode("latin-1").upper().replace("-", "_")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = "HTTP_" + key
+        value = value.decode("latin-1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _disconnected(receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def _encode(headers) -> list[tuple[bytes, bytes]]:
+    return [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+
+async def _respond(send, status: int, headers=(), body: bytes = b"") -> None:
+    headers = [h for h in headers if h[0] != "content-length"] + [("content-length", str(len(body)))]
+    await send({"type": "http.response.start", "status": status, "headers": _encode(headers)})
+    await send({"type": "http.response.body", "body": body})
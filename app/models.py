@@ -1,60 +1,143 @@
 from __future__ import annotations
-from datetime import datetime
+import json
+import time
 from .extensions import db
 from flask_login import UserMixin
 
+
+def _now() -> int:
+    return int(time.time())
+
+
+# Timestamps are integer Unix epoch seconds (UTC); templates format them with
+# the `ts` filter. Listing queries filter on a foreign key and page by id, so
+# their indexes are declared as (fk, id).
+
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(32), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     is_admin = db.Column(db.Boolean, default=False, nullable=False)
-    created_at = db.Column(db.String(25), default=lambda: datetime.utcnow().isoformat(timespec="seconds"))
+    created_at = db.Column(db.Integer, default=_now)
+    # denormalized counters, maintained by app/counters.py
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    video_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
 
 class Video(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(120), nullable=False)
-    filename = db.Column(db.String(200), nullable=False, unique=True)
+    # storage key (app/storage.py); re-uploads of the same bytes share one file
+    filename = db.Column(db.String(200), nullable=False, index=True)
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # sha256 of the uploaded bytes
     ext = db.Column(db.String(10), nullable=False)
     original_name = db.Column(db.String(200), nullable=False)
     thumb_filename = db.Column(db.String(200), nullable=True)
-    uploaded_at = db.Column(db.String(25), default=lambda: datetime.utcnow().isoformat(timespec="seconds"))
+    thumb_is_custom = db.Column(db.Boolean, nullable=False, default=False, server_default="0")
+    thumb_derivatives = db.Column(db.Text, nullable=True)  # JSON manifest, see app/thumbs.py
+    uploaded_at = db.Column(db.Integer, default=_now)
     uploader_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    # processing | ready | failed (set by the background job queue, see app/jobs.py)
+    status = db.Column(db.String(16), nullable=False, default="ready", server_default="ready")
+    hls_dir = db.Column(db.String(200), nullable=True)  # under VIDEOS_DIR/hls when an HLS ladder exists
+    # from ffprobe once processed (app/utils.py probe_media); NULL until then
+    duration = db.Column(db.Float, nullable=True)  # seconds
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    video_codec = db.Column(db.String(32), nullable=True)
+    audio_codec = db.Column(db.String(32), nullable=True)
+    bitrate = db.Column(db.Integer, nullable=True)  # bits/s, whole file
+    # denormalized counters, maintained by app/counters.py
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    favorite_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    view_count = db.Column(db.Integer, nullable=False, default=0, server_default="0", index=True)
+    # log2 of the time-decayed engagement score, see app/rankings.py
+    trend_score = db.Column(db.Float, nullable=False, default=0.0, server_default="0", index=True)
     uploader = db.relationship("User", backref="videos")
+    __table_args__ = (db.Index("ix_video_uploader_id_id", "uploader_id", "id"),)
+
+    @property
+    def thumbs(self) -> dict:
+        """Derivatives grouped for srcset: {"jpg": [(120, path), ...], "webp": [...], "preview": path}"""
+        if not self.thumb_derivatives:
+            return {}
+        out: dict = {}
+        for name, path in json.loads(self.thumb_derivatives).items():
+            stem, fmt = name.rsplit(".", 1)
+            if stem == "preview":
+                out["preview"] = path
+            else:
+                out.setdefault(fmt, []).append((int(stem.split("x")[0]), path))
+        for sizes in out.values():
+            if isinstance(sizes, list):
+                sizes.sort()
+        return out
+
+    @property
+    def length(self) -> str:
+        """"3:07" / "1:02:45" for display, "" until the file has been probed."""
+        if self.duration is None:
+            return ""
+        m, sec = divmod(int(round(self.duration)), 60)
+        h, m = divmod(m, 60)
+        return f"{h}:{m:02d}:{sec:02d}" if h else f"{m}:{sec:02d}"
+
+    @property
+    def rating_avg(self) -> float:
+        return self.rating_sum / float(self.rating_count) if self.rating_count else 0.0
+
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    video_id = db.Column(db.Integer, db.ForeignKey("video.id"), nullable=False, index=True)
+    video_id = db.Column(db.Integer, db.ForeignKey("video.id"), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     body = db.Column(db.String(500), nullable=False)
-    created_at = db.Column(db.String(25), default=lambda: datetime.utcnow().isoformat(timespec="seconds"))
+    created_at = db.Column(db.Integer, default=_now)
     user = db.relationship("User")
     video = db.relationship("Video", backref="comments")
+    __table_args__ = (db.Index("ix_comment_video_id_id", "video_id", "id"),)
+
 
 class Like(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     video_id = db.Column(db.Integer, db.ForeignKey("video.id"), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
-    created_at = db.Column(db.String(25), default=lambda: datetime.utcnow().isoformat(timespec="seconds"))
+    created_at = db.Column(db.Integer, default=_now)
     __table_args__ = (db.UniqueConstraint("video_id", "user_id", name="uq_like_video_user"),)
 
+
 class Favorite(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     video_id = db.Column(db.Integer, db.ForeignKey("video.id"), nullable=False, index=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
-    created_at = db.Column(db.String(25), default=lambda: datetime.utcnow().isoformat(timespec="seconds"))
-    __table_args__ = (db.UniqueConstraint("video_id", "user_id", name="uq_fav_video_user"),)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    created_at = db.Column(db.Integer, default=_now)
+    __table_args__ = (
+        db.UniqueConstraint("video_id", "user_id", name="uq_fav_video_user"),
+        db.Index("ix_favorite_user_id_id", "user_id", "id"),
+    )
+
 
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    sender_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
-    recipient_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    sender_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    recipient_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     subject = db.Column(db.String(120), nullable=False)
     body = db.Column(db.String(1200), nullable=False)
-    created_at = db.Column(db.String(25), default=lambda: datetime.utcnow().isoformat(timespec="seconds"))
+    created_at = db.Column(db.Integer, default=_now)
     is_read = db.Column(db.Boolean, default=False, nullable=False)
 
     sender = db.relationship("User", foreign_keys=[sender_id])
     recipient = db.relationship("User", foreign_keys=[recipient_id])
+    __table_args__ = (
+        db.Index("ix_message_recipient_id_id", "recipient_id", "id"),
+        db.Index("ix_message_sender_id_id", "sender_id", "id"),
+        # the unread badge counts only these rows, from the index alone
+        db.Index("ix_message_unread", "recipient_id", "is_read", sqlite_where=db.text("is_read = 0")),
+    )
 
 
 class Rating(db.Model):
@@ -62,8 +145,50 @@ class Rating(db.Model):
     video_id = db.Column(db.Integer, db.ForeignKey("video.id"), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     stars = db.Column(db.Integer, nullable=False)  # 1..5
-    created_at = db.Column(db.String(25), default=lambda: datetime.utcnow().isoformat(timespec="seconds"))
+    created_at = db.Column(db.Integer, default=_now)
     __table_args__ = (db.UniqueConstraint("video_id", "user_id", name="uq_rating_video_user"),)
 
     user = db.relationship("User")
     video = db.relationship("Video", backref="ratings")
+
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey("video.id"), nullable=True, index=True)
+    payload = db.Column(db.Text, nullable=False, default="{}")
+    status = db.Column(db.String(16), nullable=False, default="queued", index=True)  # queued | running | done | failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.Float, nullable=False, default=0.0)
+    locked_by = db.Column(db.Integer, nullable=True)  # worker pid
+    locked_at = db.Column(db.Float, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.Integer, default=_now)
+    updated_at = db.Column(db.Integer, default=_now)
+
+
+class UploadSession(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # random token, used in URLs
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    title = db.Column(db.String(120), nullable=False)
+    original_name = db.Column(db.String(200), nullable=False)
+    temp_name = db.Column(db.String(200), nullable=False, unique=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    checksum = db.Column(db.String(64), nullable=True)  # sha256 hex, verified on finalize
+    created_at = db.Column(db.Integer, default=_now)
+    updated_at = db.Column(db.Float, nullable=False, index=True)
+
+
+class Ranking(db.Model):
+    """Precomputed, ready-sorted video lists (see app/rankings.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # trending | most_viewed
+    position = db.Column(db.Integer, nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey("video.id", ondelete="CASCADE"), nullable=False)
+    score = db.Column(db.Float, nullable=False, default=0.0)
+    refreshed_at = db.Column(db.Float, nullable=False)
+    __table_args__ = (db.UniqueConstraint("kind", "position", name="uq_ranking_kind_position"),)
+
+    video = db.relationship("Video")
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from flask import current_app, request
+
+
+@dataclass
+class Page:
+    items: list = field(default_factory=list)
+    next_cursor: Optional[int] = None  # older items: ?before=<next_cursor>
+    prev_cursor: Optional[int] = None  # newer items: ?after=<prev_cursor>
+    prefix: str = ""
+
+
+def _arg_int(name: str) -> Optional[int]:
+    v = request.args.get(name, "")
+    return int(v) if v.isdigit() else None
+
+
+def paginate_keyset(query, key, key_of: Optional[Callable[[Any], int]] = None,
+                    size: Optional[int] = None, prefix: str = "") -> Page:
+    """Newest-first keyset pagination on an integer key (usually a primary key).
+
+    Reads `?before=<id>` / `?after=<id>` (optionally prefixed, so one page can
+    hold several independent lists) and only ever fetches `size + 1` rows via
+    the key's index, so page 1000 costs the same as page 1.
+    """
+    size = size or int(current_app.config.get("OLDTUBE_PAGE_SIZE", 24))
+    key_of = key_of or (lambda row: getattr(row, key.key))
+    before = _arg_int(prefix + "before")
+    after = _arg_int(prefix + "after")
+
+    if after is not None and before is None:
+        rows = query.filter(key > after).order_by(key.asc()).limit(size + 1).all()
+        more_newer = len(rows) > size
+        rows = rows[:size][::-1]
+        return Page(
+            items=rows,
+            next_cursor=key_of(rows[-1]) if rows else None,
+            prev_cursor=key_of(rows[0]) if rows and more_newer else None,
+            prefix=prefix,
+        )
+
+    if before is not None:
+        query = query.filter(key < before)
+    rows = query.order_by(key.desc()).limit(size + 1).all()
+    more_older = len(rows) > size
+    rows = rows[:size]
+    return Page(
+        items=rows,
+        next_cursor=key_of(rows[-1]) if rows and more_older else None,
+        # coming from a "before" link means there is at least one newer item
+        prev_cursor=key_of(rows[0]) if rows and before is not None else None,
+        prefix=prefix,
+    )
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+from flask import Flask
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method: str) -> str:
+    # "pbkdf2" and "pbkdf2:sha256:600000" hash identically; compare what werkzeug writes
+    return generate_password_hash("x", method=method).split("$", 1)[0]
+
+
+class PasswordHasher:
+    """Password hashing with a configurable cost, run on a small thread pool.
+
+    hashlib's scrypt/pbkdf2 release the GIL, so the pool bounds how many cores
+    password work can take at once no matter how many request threads are
+    waiting; when the pool and its queue are full, callers get a 503 instead
+    of piling up.
+    """
+
+    def __init__(self) -> None:
+        self.method = "scrypt:32768:8:1"
+        self.timeout = 10.0
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(1)
+        self._dummy: Optional[str] = None
+
+    def init_app(self, app: Flask) -> None:
+        self.method = app.config.get("OLDTUBE_PASSWORD_METHOD", "scrypt:32768:8:1")
+        self.timeout = float(app.config.get("OLDTUBE_AUTH_TIMEOUT", 10))
+        workers = max(1, int(app.config.get("OLDTUBE_AUTH_WORKERS", 2)))
+        queue = max(0, int(app.config.get("OLDTUBE_AUTH_QUEUE", 16)))
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="oldtube-auth")
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._dummy = None
+        app.extensions["oldtube_passwords"] = self
+
+    def hash(self, password: str) -> str:
+        return generate_password_hash(password, method=self.method)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        return pwhash.split("$", 1)[0] != _method_prefix(self.method)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise ServiceUnavailable("The server is busy signing people in; try again shortly.")
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash_async(self, password: str) -> str:
+        return self._run(self.hash, password)
+
+    def verify(self, pwhash: Optional[str], password: str) -> bool:
+        """Check on the pool. A missing user still costs one hash, so response
+        time doesn't reveal which usernames exist."""
+        if pwhash is None:
+            if self._dummy is None:
+                self._dummy = self._run(self.hash, "not-a-password")
+            self._run(check_password_hash, self._dummy, password)
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+
+class RateLimiter:
+    """In-memory token buckets keyed by client (IP, username...).
+
+    Each key holds up to `burst` tokens, refilled at `per_minute`; the table is
+    an LRU capped at `max_keys` so a spray of addresses can't grow it forever.
+    """
+
+    def __init__(self, per_minute: float, burst: int, max_keys: int = 10000):
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.configure(per_minute, burst, max_keys)
+
+    def configure(self, per_minute: float, burst: int, max_keys: int = 10000) -> None:
+        with self._lock:
+            self.rate = per_minute / 60.0
+            self.burst = float(burst)
+            self.max_keys = max_keys
+            self._buckets.clear()
+
+    def hit(self, key: str, cost: float = 1.0) -> float:
+        """Take `cost` tokens; returns 0 when allowed, else seconds until it would be."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / self.rate if self.rate else 3600.0
+                self.rejected += 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+hasher = PasswordHasher()
+ip_limiter = RateLimiter(per_minute=10, burst=20)
+username_limiter = RateLimiter(per_minute=5, burst=5)
+account_limiter = RateLimiter(per_minute=30, burst=50)
+
+
+def init_auth(app: Flask) -> None:
+    hasher.init_app(app)
+    cfg = app.config
+    ip_limiter.configure(cfg.get("OLDTUBE_AUTH_IP_PER_MINUTE", 10), cfg.get("OLDTUBE_AUTH_IP_BURST", 20))
+    username_limiter.configure(cfg.get("OLDTUBE_AUTH_USER_PER_MINUTE", 5), cfg.get("OLDTUBE_AUTH_USER_BURST", 5))
+    account_limiter.configure(cfg.get("OLDTUBE_AUTH_ACCOUNT_PER_MINUTE", 30), cfg.get("OLDTUBE_AUTH_ACCOUNT_BURST", 50))
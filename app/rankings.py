@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from functools import wraps
+from typing import Optional
+
+from flask import Flask, current_app, request
+from sqlalchemy.orm import joinedload
+
+from .extensions import db, page_cache
+from .models import Job, Ranking, Video
+
+# trend points per event; a view is the unit
+WEIGHTS = {"view": 1.0, "comment": 2.0, "rating": 2.0, "like": 3.0, "favorite": 3.0, "upload": 5.0}
+RANKING_KINDS = ("trending", "most_viewed")
+
+
+def trend_exponent(now: Optional[float] = None) -> float:
+    """Events are stored as log2(points * 2**(t / half_life)).
+
+    Every stored score would decay by the same factor, so instead newer events
+    count for more; ordering by the stored value is ordering by the decayed
+    score, and no periodic rewrite of old rows is needed.
+    """
+    half_life = float(current_app.config.get("OLDTUBE_TREND_HALF_LIFE_HOURS", 24)) * 3600
+    return (now if now is not None else time.time()) / half_life
+
+
+class ActivityBuffer:
+    """Per-process tally of views and trend points, written out in batches.
+
+    Requests only touch a dict; `flush()` turns everything gathered since the
+    last one into a single executemany UPDATE. Anything still buffered when a
+    process dies is lost, which is fine for popularity counters.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._views: dict[int, int] = {}
+        self._points: dict[int, float] = {}
+        self._events = 0
+        self._last_flush = time.monotonic()
+        self.flush_seconds = 10.0
+        self.flush_events = 500
+        self.flushes = 0
+
+    def init_app(self, app: Flask) -> None:
+        self.flush_seconds = float(app.config.get("OLDTUBE_VIEW_FLUSH_SECONDS", 10))
+        self.flush_events = int(app.config.get("OLDTUBE_VIEW_FLUSH_EVENTS", 500))
+        app.after_request(self._after_request)
+
+    def record(self, video_id: int, kind: str = "view") -> None:
+        with self._lock:
+            if kind == "view":
+                self._views[video_id] = self._views.get(video_id, 0) + 1
+            self._points[video_id] = self._points.get(video_id, 0.0) + WEIGHTS[kind]
+            self._events += 1
+
+    @property
+    def due(self) -> bool:
+        return self._events > 0 and (self._events >= self.flush_events
+                                     or time.monotonic() - self._last_flush >= self.flush_seconds)
+
+    def flush(self) -> int:
+        with self._lock:
+            views, points = self._views, self._points
+            self._views, self._points, self._events = {}, {}, 0
+            self._last_flush = time.monotonic()
+        if not points:
+            return 0
+        x = trend_exponent()
+        rows = [{"vid": vid, "views": views.get(vid, 0), "x": x + math.log2(p)} for vid, p in points.items()]
+        db.session.execute(
+            db.text("UPDATE video SET view_count = view_count + :views, "
+                    "trend_score = logaddexp2(trend_score, :x) WHERE id = :vid"),
+            rows,
+        )
+        db.session.commit()
+        self.flushes += 1
+        _maybe_schedule_refresh()
+        return len(rows)
+
+    def _after_request(self, response):
+        if self.due:
+            try:
+                self.flush()
+            except Exception:
+                # never fail a page over a counter; this batch is dropped
+                db.session.rollback()
+                current_app.logger.exception("view flush failed")
+        return response
+
+
+activity = ActivityBuffer()
+
+
+def count_view(fn):
+    """Count a view for every successful response of a `video_id` view,
+    including page-cache hits (put it above `@page_cache.cached`)."""
+    @wraps(fn)
+    def wrapper(**kwargs):
+        rv = current_app.make_response(fn(**kwargs))
+        if rv.status_code == 200:
+            activity.record(kwargs["video_id"])
+        return rv
+    return wrapper
+
+
+def is_direct_play() -> bool:
+    """A media request that starts a playback outside our watch page (embeds,
+    direct links). Watch-page plays were already counted by `count_view`, and
+    seeks/continuation ranges never count."""
+    return direct_play(request.headers.get("Range"), request.referrer)
+
+
+def direct_play(range_header: Optional[str], referrer: Optional[str]) -> bool:
+    rng = (range_header or "").replace(" ", "")
+    if rng and not rng.startswith("bytes=0-"):
+        return False
+    return "/watch/" not in (referrer or "")
+
+
+_last_refresh_check = 0.0
+
+
+def _maybe_schedule_refresh() -> None:
+    global _last_refresh_check
+    every = float(current_app.config.get("OLDTUBE_RANKING_REFRESH_SECONDS", 300))
+    if time.monotonic() - _last_refresh_check < every:
+        return
+    _last_refresh_check = time.monotonic()
+    last = db.session.query(db.func.max(Ranking.refreshed_at)).scalar() or 0.0
+    if time.time() - last < every:
+        return
+    pending = db.session.query(Job.id).filter(Job.kind == "refresh_rankings",
+                                              Job.status.in_(("queued", "running"))).first()
+    if pending is None:
+        from .jobs import enqueue
+        enqueue("refresh_rankings")
+
+
+def refresh_rankings() -> dict:
+    """Rebuild the ranking tables from the live counters in one transaction."""
+    size = int(current_app.config.get("OLDTUBE_RANKING_SIZE", 50))
+    now = time.time()
+    orders = {
+        "trending": (Video.trend_score, Video.trend_score.desc()),
+        "most_viewed": (Video.view_count, Video.view_count.desc()),
+    }
+    counts = {}
+    for kind, (col, order) in orders.items():
+        top = (db.session.query(Video.id, col).filter(Video.status == "ready")
+               .order_by(order, Video.id.desc()).limit(size).all())
+        db.session.execute(db.delete(Ranking).where(Ranking.kind == kind))
+        if top:
+            db.session.execute(db.insert(Ranking), [
+                {"kind": kind, "position": i, "video_id": vid, "score": float(score or 0), "refreshed_at": now}
+                for i, (vid, score) in enumerate(top)
+            ])
+        counts[kind] = len(top)
+    db.session.commit()
+    page_cache.invalidate("rankings")
+    return counts
+
+
+def ranked_videos(kind: str, limit: Optional[int] = None) -> list[Video]:
+    q = (Video.query.join(Ranking, Ranking.video_id == Video.id)
+         .options(joinedload(Video.uploader))
+         .filter(Ranking.kind == kind)
+         .order_by(Ranking.position))
+    if limit:
+        q = q.limit(limit)
+    return q.all()
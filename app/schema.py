@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from sqlalchemy import Integer, MetaData, inspect, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from .extensions import db
+
+
+def schema_version() -> int:
+    """Fingerprint of the DDL the models (and the search index) declare.
+
+    Stored in SQLite's `PRAGMA user_version` after a migration, so a process
+    can tell with one pragma read whether there is anything to do at boot.
+    """
+    from .search import _DDL
+
+    dialect = db.engine.dialect
+    h = hashlib.sha1()
+    for table in sorted(db.metadata.sorted_tables, key=lambda t: t.name):
+        h.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            h.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    for ddl in _DDL:
+        h.update(ddl.encode())
+    # user_version is a signed 32-bit int; 0 means "never migrated"
+    return int(h.hexdigest()[:7], 16) or 1
+
+
+def _sqlite_path() -> Optional[Path]:
+    url = db.engine.url
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        return None
+    return Path(url.database)
+
+
+def stored_version() -> int:
+    path = _sqlite_path()
+    if path is not None and not path.exists():
+        return 0
+    with db.engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar() or 0
+
+
+def schema_is_current() -> bool:
+    return stored_version() == schema_version()
+
+
+@contextmanager
+def _migration_lock() -> Iterator[None]:
+    # pre-forked workers booting together must not run the same ALTERs twice
+    path = _sqlite_path()
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    if path is None or fcntl is None:
+        yield
+        return
+    with open(str(path) + ".migrate.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def migrate() -> Optional[bool]:
+    """Bring the database up to the models' schema.
+
+    Returns None when it was already current, True when the database was
+    created from scratch, False when an existing one was upgraded.
+    """
+    path = _sqlite_path()
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    with _migration_lock():
+        if schema_is_current():
+            return None
+        fresh = "user" not in inspect(db.engine).get_table_names()
+        db.create_all()
+        rebuilt = rebuild_tables()
+        drop_stale_indexes()
+        added = ensure_columns()
+        if not fresh and (rebuilt or added):
+            # counter columns that are new on an existing database (whether
+            # added in place or by a rebuilt copy of the table) start at 0
+            from .counters import reconcile_counters
+            reconcile_counters()
+        from .search import ensure_search_index
+        ensure_search_index()
+        with db.engine.begin() as conn:
+            conn.execute(text(f"PRAGMA user_version = {schema_version()}"))
+        return fresh
+
+
+def seed_admin() -> bool:
+    """Create the OLDTUBE_ADMIN_USER account if it doesn't exist yet."""
+    from .models import User
+    from .passwords import hasher
+
+    admin_user = os.environ.get("OLDTUBE_ADMIN_USER", "admin")
+    admin_pass = os.environ.get("OLDTUBE_ADMIN_PASS", "admin")
+    if User.query.filter_by(username=admin_user).first() is not None:
+        return False
+    db.session.add(User(username=admin_user, password_hash=hasher.hash(admin_pass), is_admin=True))
+    db.session.commit()
+    return True
+
+
+def ensure_columns() -> list[str]:
+    """Add model columns that are missing from an existing SQLite database.
+
+    `db.create_all()` only creates missing tables, so databases created before a
+    column was added to a model need an `ALTER TABLE ... ADD COLUMN` (and any
+    index declared on it).
+    """
+    added = []
+    insp = inspect(db.engine)
+    existing_tables = set(insp.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        have = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name in have:
+                continue
+            ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{col.name}" {col.type.compile(db.engine.dialect)}'
+            if col.server_default is not None:
+                ddl += f" DEFAULT {_default_sql(col.server_default.arg)}"
+                if not col.nullable:
+                    ddl += " NOT NULL"
+            with db.engine.begin() as conn:
+                conn.execute(text(ddl))
+            added.append(f"{table.name}.{col.name}")
+        # indexes declared on columns added above (or on the model later)
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    return added
+
+
+def _unique_sets(table) -> set[frozenset]:
+    from sqlalchemy import UniqueConstraint
+
+    return {frozenset(c.name for c in uc.columns) for uc in table.constraints if isinstance(uc, UniqueConstraint)}
+
+
+def _convert_sql(name: str, stored_type, col) -> Optional[str]:
+    """SELECT expression that turns a column's stored values into the model's
+    type, or None when they already agree. The one type change the models
+    have made: ISO-8601 text timestamps to integer epoch seconds."""
+    if str(stored_type).upper().startswith(("VARCHAR", "CHAR", "TEXT")) and isinstance(col.type, Integer):
+        # the old strings were UTC (datetime.utcnow()), which is what %s assumes
+        return f"CAST(strftime('%s', \"{name}\") AS INTEGER)"
+    return None
+
+
+def rebuild_tables() -> list[str]:
+    """Recreate tables whose database copy no longer matches the model in a
+    way SQLite can't ALTER: a UNIQUE constraint the model has dropped, or a
+    column whose type changed (its data is converted on the way).
+
+    Follows SQLite's documented procedure: create the new table under a
+    temporary name, copy the rows, drop the old table and rename. Triggers on
+    the old table go with it; the search index puts its own back afterwards.
+    """
+    rebuilt = []
+    insp = inspect(db.engine)
+    existing_tables = set(insp.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        have = {frozenset(uc["column_names"]) for uc in insp.get_unique_constraints(table.name)}
+        stored = [c for c in insp.get_columns(table.name) if c["name"] in table.c]
+        converted = {c["name"]: _convert_sql(c["name"], c["type"], table.c[c["name"]]) for c in stored}
+        if not have - _unique_sets(table) and not any(converted.values()):
+            continue
+        tmp_name = f"_rebuild_{table.name}"
+        # a scratch MetaData holding every table, so foreign keys still resolve
+        scratch = MetaData()
+        for t in db.metadata.sorted_tables:
+            t.to_metadata(scratch)
+        cols = ", ".join(f'"{c["name"]}"' for c in stored)
+        values = ", ".join(converted[c["name"]] or f'"{c["name"]}"' for c in stored)
+        with db.engine.begin() as conn:
+            conn.execute(text(f'DROP TABLE IF EXISTS "{tmp_name}"'))
+            conn.execute(CreateTable(table.to_metadata(scratch, name=tmp_name)))
+            conn.execute(text(f'INSERT INTO "{tmp_name}" ({cols}) SELECT {values} FROM "{table.name}"'))
+            conn.execute(text(f'DROP TABLE "{table.name}"'))
+            # don't let the rename rewrite (or validate) triggers that name the old table
+            conn.execute(text("PRAGMA legacy_alter_table = ON"))
+            conn.execute(text(f'ALTER TABLE "{tmp_name}" RENAME TO "{table.name}"'))
+            conn.execute(text("PRAGMA legacy_alter_table = OFF"))
+            for index in table.indexes:
+                index.create(conn)
+        rebuilt.append(table.name)
+    return rebuilt
+
+
+def drop_stale_indexes() -> list[str]:
+    """Drop `ix_*` indexes the models no longer declare (e.g. a single-column
+    index superseded by a composite one)."""
+    dropped = []
+    insp = inspect(db.engine)
+    existing_tables = set(insp.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        declared = {index.name for index in table.indexes}
+        for index in insp.get_indexes(table.name):
+            if index["name"].startswith("ix_") and index["name"] not in declared:
+                with db.engine.begin() as conn:
+                    conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+                dropped.append(index["name"])
+    return dropped
+
+
+def _default_sql(arg) -> str:
+    if hasattr(arg, "text"):
+        return arg.text
+    return "'" + str(arg).replace("'", "''") + "'"
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import re
+
+from sqlalchemy import text
+
+from .extensions import db
+
+# Triggers keep video_fts in sync with every insert/update/delete on video (and
+# username changes), whichever code path performs them.
+_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS video_fts USING fts5(
+        title, original_name, username,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS video_fts_ai AFTER INSERT ON video BEGIN
+        INSERT INTO video_fts(rowid, title, original_name, username)
+        VALUES (new.id, new.title, new.original_name,
+                (SELECT username FROM user WHERE id = new.uploader_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS video_fts_ad AFTER DELETE ON video BEGIN
+        DELETE FROM video_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS video_fts_au AFTER UPDATE OF title, original_name, uploader_id ON video BEGIN
+        DELETE FROM video_fts WHERE rowid = old.id;
+        INSERT INTO video_fts(rowid, title, original_name, username)
+        VALUES (new.id, new.title, new.original_name,
+                (SELECT username FROM user WHERE id = new.uploader_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS video_fts_user_au AFTER UPDATE OF username ON user BEGIN
+        UPDATE video_fts SET username = new.username
+        WHERE rowid IN (SELECT id FROM video WHERE uploader_id = new.id);
+    END""",
+]
+
+# bm25 column weights: title, original_name, username
+_RANK = "bm25(video_fts, 10.0, 2.0, 1.0)"
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def ensure_search_index() -> None:
+    with db.engine.begin() as conn:
+        created = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'video_fts'"
+        )).first() is None
+        for ddl in _DDL:
+            conn.execute(text(ddl))
+    if created:
+        rebuild_search_index()
+
+
+def rebuild_search_index() -> int:
+    with db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM video_fts"))
+        conn.execute(text(
+            "INSERT INTO video_fts(rowid, title, original_name, username) "
+            "SELECT v.id, v.title, v.original_name, u.username FROM video v JOIN user u ON u.id = v.uploader_id"
+        ))
+        conn.execute(text("INSERT INTO video_fts(video_fts) VALUES ('optimize')"))
+        return conn.execute(text("SELECT count(*) FROM video_fts")).scalar()
+
+
+def fts_query(q: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, as a prefix."""
+    terms = _TOKEN.findall(q.lower())[:8]
+    return " AND ".join(f'"{t}"*' for t in terms)
+
+
+def search_video_ids(q: str, limit: int, offset: int = 0) -> list[int]:
+    match = fts_query(q)
+    if not match:
+        return []
+    rows = db.session.execute(
+        text(f"SELECT rowid FROM video_fts WHERE video_fts MATCH :q ORDER BY {_RANK} LIMIT :limit OFFSET :offset"),
+        {"q": match, "limit": limit, "offset": offset},
+    )
+    return [r[0] for r in rows]
@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from flask import Flask, Response, abort, redirect, send_from_directory
+
+from .streaming import send_file_range
+
+COPY_BUFSIZE = 1024 * 1024
+CONTENT_KEY = re.compile(r"^([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.\w+$")
+
+
+def content_key(digest: str, ext: str) -> str:
+    """"3fa2...e1", "mp4" -> "3f/a2/3fa2...e1.mp4"
+
+    Two levels of 256 directories keep any one directory small, and the same
+    bytes always land on the same key, which is what lets re-uploads be
+    recognised without another transcode.
+    """
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(COPY_BUFSIZE)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+
+def save_stream(stream: BinaryIO, path: Path) -> str:
+    """Copy an upload to `path`, hashing it on the way; returns the sha256 hex."""
+    h = hashlib.sha256()
+    with open(path, "wb") as f:
+        while True:
+            buf = stream.read(COPY_BUFSIZE)
+            if not buf:
+                break
+            h.update(buf)
+            f.write(buf)
+    return h.hexdigest()
+
+
+class LocalStorage:
+    """Files under `root`, addressed by relative keys ("3f/a2/<sha256>.mp4").
+
+    Keys of files stored before content addressing (flat names) keep working:
+    a key is just a path below the root.
+    """
+
+    kind = "local"
+
+    def __init__(self, root: Path, streaming: bool = False):
+        self.root = Path(root)
+        # videos go through send_file_range (byte ranges, sendfile); thumbnails don't
+        self.streaming = streaming
+
+    def path(self, key: str) -> Path:
+        path = self.root / key
+        try:
+            path.resolve().relative_to(self.root.resolve())
+        except ValueError:
+            abort(404)
+        return path
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).is_file()
+
+    def put(self, src: Path, key: str) -> bool:
+        """Move `src` into the store. Returns False (and drops `src`) when the
+        key already holds these bytes."""
+        dest = self.path(key)
+        if src.resolve() == dest.resolve():
+            return True
+        if dest.is_file():
+            src.unlink(missing_ok=True)
+            return False
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(src, dest)
+        except OSError:
+            # staging on another filesystem
+            shutil.move(str(src), dest)
+        return True
+
+    def delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+    @contextmanager
+    def fetch(self, key: str) -> Iterator[Path]:
+        yield self.path(key)
+
+    def prune(self, prefix: str, keep: set[str]) -> int:
+        """Delete the files under `prefix` whose keys aren't in `keep`."""
+        base = self.path(prefix)
+        n = 0
+        if base.is_dir():
+            for p in base.iterdir():
+                if p.is_file() and f"{prefix}{p.name}" not in keep:
+                    p.unlink(missing_ok=True)
+                    n += 1
+        return n
+
+    def serve(self, key: str) -> Response:
+        if self.streaming:
+            return send_file_range(self.root, key)
+        return send_from_directory(self.root, key, conditional=True)
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket (AWS, MinIO, Ceph, moto server...).
+
+    Large files are never proxied: `serve` answers with a redirect to a
+    presigned (or public) URL and the client talks to the bucket directly,
+    Range requests included. Small objects can be proxied instead, so their
+    URLs stay stable and browser-cacheable without a public bucket.
+    """
+
+    kind = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, public_url: str = "", presign_seconds: int = 3600,
+                 redirect: bool = True, client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError as e:
+                raise RuntimeError("OLDTUBE_STORAGE=s3 needs boto3 (pip install boto3)") from e
+            client = boto3.client("s3", endpoint_url=endpoint_url or None, region_name=region or None)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_url = public_url.rstrip("/")
+        self.presign_seconds = presign_seconds
+        self.redirect = redirect
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _missing(self, e: Exception) -> bool:
+        code = str(getattr(e, "response", {}).get("Error", {}).get("Code", ""))
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            if self._missing(e):
+                return False
+            raise
+        return True
+
+    def put(self, src: Path, key: str) -> bool:
+        if self.exists(key):
+            src.unlink(missing_ok=True)
+            return False
+        mime, _ = mimetypes.guess_type(key)
+        self.client.upload_file(str(src), self.bucket, self._key(key),
+                                ExtraArgs={"ContentType": mime or "application/octet-stream"})
+        src.unlink(missing_ok=True)
+        return True
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    @contextmanager
+    def fetch(self, key: str) -> Iterator[Path]:
+        """Download to a temporary file for tools that need a local path (ffmpeg)."""
+        with tempfile.TemporaryDirectory(prefix="oldtube-s3-") as tmp:
+            path = Path(tmp) / Path(key).name
+            self.client.download_file(self.bucket, self._key(key), str(path))
+            yield path
+
+    def prune(self, prefix: str, keep: set[str]) -> int:
+        stale = []
+        pages = self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self._key(prefix))
+        for page in pages:
+            for obj in page.get("Contents", []):
+                if obj["Key"][len(self.prefix):] not in keep:
+                    stale.append({"Key": obj["Key"]})
+        for i in range(0, len(stale), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": stale[i:i + 1000]})
+        return len(stale)
+
+    def url(self, key: str) -> str:
+        if self.public_url:
+            return f"{self.public_url}/{self._key(key)}"
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._key(key)}, ExpiresIn=self.presign_seconds,
+        )
+
+    def serve(self, key: str) -> Response:
+        if self.redirect:
+            rv = redirect(self.url(key), 302)
+            # a cached redirect must not outlive the signature it points at
+            rv.headers["Cache-Control"] = f"private, max-age={self.presign_seconds // 2}"
+            return rv
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            if self._missing(e):
+                abort(404)
+            raise
+        rv = Response(obj["Body"].iter_chunks(COPY_BUFSIZE), mimetype=obj.get("ContentType"), direct_passthrough=True)
+        rv.headers["Content-Length"] = str(obj["ContentLength"])
+        if obj.get("ETag"):
+            rv.headers["ETag"] = obj["ETag"]
+        return rv
+
+
+class MediaStorage:
+    """The configured backends for video files and thumbnails (OLDTUBE_STORAGE)."""
+
+    def __init__(self) -> None:
+        self.videos = None
+        self.thumbs = None
+
+    def init_app(self, app: Flask) -> None:
+        cfg = app.config
+        backend = cfg.get("OLDTUBE_STORAGE", "local")
+        if backend == "local":
+            self.videos = LocalStorage(cfg["VIDEOS_DIR"], streaming=True)
+            self.thumbs = LocalStorage(cfg["THUMBS_DIR"])
+        elif backend == "s3":
+            opts = dict(
+                bucket=cfg["OLDTUBE_S3_BUCKET"],
+                endpoint_url=cfg.get("OLDTUBE_S3_ENDPOINT"),
+                region=cfg.get("OLDTUBE_S3_REGION"),
+                public_url=cfg.get("OLDTUBE_S3_PUBLIC_URL", ""),
+                presign_seconds=int(cfg.get("OLDTUBE_S3_PRESIGN_SECONDS", 3600)),
+            )
+            prefix = cfg.get("OLDTUBE_S3_PREFIX", "")
+            self.videos = S3Storage(prefix=prefix + "videos/", redirect=True, **opts)
+            # thumbnails are small: proxy them unless the bucket has a stable public URL
+            self.thumbs = S3Storage(prefix=prefix + "thumbs/", redirect=bool(opts["public_url"]),
+                                    client=self.videos.client, **opts)
+        else:
+            raise ValueError(f"unknown OLDTUBE_STORAGE backend: {backend!r}")
+        app.extensions["oldtube_storage"] = self
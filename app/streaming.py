@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import mimetypes
+import mmap
+import os
+import re
+import secrets
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Iterator, Optional
+
+from flask import Response, abort, request, send_from_directory
+
+from .instrumentation import record_stream
+
+# 256 KB slices stay cache-resident; bigger ones measured slower (bench/bench_streaming.py)
+MMAP_CHUNK = 256 * 1024
+WRAPPER_BLOCK = 1024 * 1024
+MAX_RANGES = 16
+
+_RANGE_SPEC = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+def parse_ranges(header: str, size: int) -> Optional[list[tuple[int, int]]]:
+    """Parse a `Range: bytes=...` header into inclusive (start, end) pairs.
+
+    Returns None when the header is malformed (it must then be ignored), and an
+    empty list when it is well-formed but no range overlaps the file (416).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    out = []
+    for part in spec.split(","):
+        m = _RANGE_SPEC.match(part)
+        if not m or (not m.group(1) and not m.group(2)):
+            return None
+        if not m.group(1):
+            # suffix range: the last N bytes
+            n = int(m.group(2))
+            if n == 0 or size == 0:
+                continue
+            out.append((max(0, size - n), size - 1))
+            continue
+        start = int(m.group(1))
+        if m.group(2) and int(m.group(2)) < start:
+            return None
+        if start >= size:
+            continue
+        end = int(m.group(2)) if m.group(2) else size - 1
+        out.append((start, min(end, size - 1)))
+    if len(out) > MAX_RANGES:
+        return None
+    return _coalesce(out)
+
+
+def _coalesce(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    # merge overlapping/adjacent ranges so clients can't make us send a byte twice
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def make_etag(st: os.stat_result) -> str:
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def if_range_ok(value: Optional[str], etag: str, mtime: float) -> bool:
+    """Whether a Range request may be honoured given its If-Range header."""
+    if not value:
+        return True
+    value = value.strip()
+    if value.startswith('"') or value.startswith("W/"):
+        # weak validators never match for If-Range
+        return value == f'"{etag}"'
+    try:
+        return int(parsedate_to_datetime(value).timestamp()) >= int(mtime)
+    except (TypeError, ValueError):
+        return False
+
+
+def multipart_layout(ranges: list[tuple[int, int]], size: int, mime: str):
+    """Part headers for a multipart/byteranges body.
+
+    Returns (boundary, [(part header, start, end)], trailer, Content-Length).
+    """
+    boundary = secrets.token_hex(16)
+    parts = []
+    total = 0
+    for start, end in ranges:
+        head = (f"\r\n--{boundary}\r\nContent-Type: {mime}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode("latin-1")
+        parts.append((head, start, end))
+        total += len(head) + end - start + 1
+    trailer = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    return boundary, parts, trailer, total + len(trailer)
+
+
+class MmapRange:
+    """Iterate over byte ranges of a file through a memory map.
+
+    Used when the WSGI server provides no `wsgi.file_wrapper`: pages come
+    straight from the page cache instead of being read() into fresh buffers.
+    """
+
+    def __init__(self, path: Path, parts: list[tuple[bytes, int, int]], trailer: bytes = b""):
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self._mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            self._mm.madvise(mmap.MADV_SEQUENTIAL)
+        self.parts = parts
+        self.trailer = trailer
+        self.bytes_sent = 0
+        self.on_close = None
+
+    def __iter__(self) -> Iterator[bytes]:
+        for head, start, end in self.parts:
+            if head:
+                yield head
+            pos = start
+            while pos <= end:
+                stop = min(pos + MMAP_CHUNK, end + 1)
+                yield self._mm[pos:stop]
+                self.bytes_sent += stop - pos
+                pos = stop
+        if self.trailer:
+            yield self.trailer
+
+    def close(self) -> None:
+        self._mm.close()
+        self._f.close()
+        if self.on_close is not None:
+            self.on_close(self.bytes_sent)
+
+
+def _single_body(path: Path, start: int, length: int):
+    wrapper = request.environ.get("wsgi.file_wrapper")
+    if wrapper is not None:
+        # gunicorn/uWSGI/mod_wsgi turn this into os.sendfile() from the current
+        # offset, bounded by Content-Length
+        f = open(path, "rb")
+        f.seek(start)
+        return wrapper(f, WRAPPER_BLOCK)
+    return MmapRange(path, [(b"", start, start + length - 1)])
+
+
+def _track(rv: Response, started: float, kind: str) -> Response:
+    # direct_passthrough bodies skip Response.call_on_close, so mmap bodies
+    # report what they actually sent when the server closes them; file-wrapper
+    # bodies are handed to sendfile() whole and are counted up front
+    if isinstance(rv.response, MmapRange):
+        rv.response.on_close = lambda sent: record_stream(sent, started, kind)
+    elif rv.status_code in (200, 206):
+        record_stream(rv.content_length or 0, started, kind)
+    return rv
+
+
+def send_file_range(directory: Path, filename: str) -> Response:
+    started = time.perf_counter()
+    path = directory / filename
+    try:
+        path.resolve().relative_to(directory.resolve())
+        st = path.stat()
+    except (ValueError, OSError):
+        abort(404)
+    if not path.is_file():
+        abort(404)
+
+    size = st.st_size
+    etag = make_etag(st)
+    mime, _ = mimetypes.guess_type(str(path))
+    mime = mime or "application/octet-stream"
+
+    range_header = request.headers.get("Range")
+    ranges = parse_ranges(range_header, size) if range_header else None
+    if ranges is None or not if_range_ok(request.headers.get("If-Range"), etag, st.st_mtime):
+        rv = send_from_directory(directory, filename, conditional=True, mimetype=mime, etag=etag)
+        return _track(rv, started, "full")
+
+    if etag in request.if_none_match:
+        rv = Response(status=304)
+        rv.set_etag(etag)
+        return rv
+
+    if not ranges:
+        rv = Response(status=416)
+        rv.headers["Content-Range"] = f"bytes */{size}"
+        rv.headers["Accept-Ranges"] = "bytes"
+        return rv
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        length = end - start + 1
+        rv = Response(_single_body(path, start, length), 206, mimetype=mime, direct_passthrough=True)
+        rv.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        rv.headers["Content-Length"] = str(length)
+    else:
+        boundary, parts, trailer, total = multipart_layout(ranges, size, mime)
+        rv = Response(MmapRange(path, parts, trailer), 206, direct_passthrough=True,
+                      content_type=f"multipart/byteranges; boundary={boundary}")
+        rv.headers["Content-Length"] = str(total)
+
+    rv.headers["Accept-Ranges"] = "bytes"
+    rv.headers["Last-Modified"] = formatdate(st.st_mtime, usegmt=True)
+    rv.set_etag(etag)
+    return _track(rv, started, "range" if len(ranges) == 1 else "multirange")
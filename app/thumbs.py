@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Tuple
+
+from flask import current_app
+
+from .extensions import db, storage
+from .utils import ffmpeg_available, run_ffmpeg
+
+DERIVED_SUBDIR = "d"
+_CODECS = {
+    "jpg": ["-q:v", "4"],
+    "webp": ["-c:v", "libwebp", "-quality", "75"],
+}
+
+
+def parse_sizes(spec: str) -> list[tuple[int, int]]:
+    out = []
+    for item in spec.split(","):
+        if "x" in item:
+            w, h = item.strip().lower().split("x", 1)
+            out.append((int(w), int(h)))
+    return sorted(out)
+
+
+def _box(w: int, h: int) -> str:
+    # same letterboxing as the classic 120x90 thumbnail
+    return f"scale={w}:{h}:force_original_aspect_ratio=decrease,pad={w}:{h}:(ow-iw)/2:(oh-ih)/2"
+
+
+def _hashed(path: Path) -> Path:
+    digest = hashlib.sha1(path.read_bytes()).hexdigest()[:12]
+    return path.with_name(f"{digest}-{path.name}")
+
+
+def _shared_keys(prefix: str, video_id: int) -> set[str]:
+    # duplicate uploads point their manifest at the original's files
+    from .models import Video
+
+    rows = db.session.query(Video.thumb_derivatives).filter(
+        Video.id != video_id, Video.thumb_derivatives.contains(f'"{prefix}'))
+    return {key for (raw,) in rows for key in json.loads(raw).values() if key.startswith(prefix)}
+
+
+def generate_derivatives(video_path: Path, video_id: int,
+                         source_image: Optional[Path] = None) -> Tuple[Optional[dict], Optional[str]]:
+    """Render every configured size/format (plus an optional animated preview).
+
+    Files are stored under d/<video_id>/ in thumbnail storage with
+    content-hashed names, so their URLs change whenever the bytes do and can
+    be cached forever. Returns a manifest such as
+    {"240x180.webp": "d/7/3f2a...-240x180.webp", ...}. Old files are pruned
+    unless another video's manifest still references them.
+    """
+    if not ffmpeg_available():
+        return None, "ffmpeg not found (thumbnails skipped)"
+    cfg = current_app.config
+    sizes = parse_sizes(cfg.get("OLDTUBE_THUMB_SIZES", "120x90"))
+    formats = [f.strip() for f in cfg.get("OLDTUBE_THUMB_FORMATS", "jpg").split(",") if f.strip() in _CODECS]
+    prefix = f"{DERIVED_SUBDIR}/{video_id}/"
+
+    # rendered next to the local store, so publishing there is a rename
+    with tempfile.TemporaryDirectory(dir=cfg["THUMBS_DIR"]) as tmp:
+        tmp_dir = Path(tmp)
+        if source_image is None or not source_image.exists():
+            # one decode of the video for the largest size; the rest scale from it
+            w, h = sizes[-1]
+            source_image = tmp_dir / "source.png"
+            ok, msg = run_ffmpeg(["-y", "-ss", "00:00:01.000", "-i", str(video_path), "-vframes", "1",
+                                  "-vf", _box(w, h), str(source_image)])
+            if not ok or not source_image.exists():
+                return None, f"Thumbnail failed: {msg}"
+
+        # a single ffmpeg run writes every size/format as separate outputs
+        args = ["-y", "-i", str(source_image)]
+        names = []
+        for w, h in sizes:
+            for fmt in formats:
+                name = f"{w}x{h}.{fmt}"
+                args += ["-vf", _box(w, h), "-frames:v", "1", *_CODECS[fmt], str(tmp_dir / name)]
+                names.append(name)
+        ok, msg = run_ffmpeg(args)
+        if not ok:
+            return None, f"Thumbnail failed: {msg}"
+
+        if cfg.get("OLDTUBE_THUMB_PREVIEW"):
+            w, h = sizes[0]
+            ok, msg = run_ffmpeg(["-y", "-i", str(video_path), "-t", "10",
+                                  "-vf", f"fps=1,{_box(w, h)}", "-c:v", "libwebp_anim", "-loop", "0",
+                                  "-quality", "60", str(tmp_dir / "preview.webp")])
+            if ok:
+                names.append("preview.webp")
+
+        manifest = {}
+        for name in names:
+            src = tmp_dir / name
+            if not src.exists():
+                continue
+            key = prefix + _hashed(src).name
+            storage.thumbs.put(src, key)
+            manifest[name] = key
+
+    storage.thumbs.prune(prefix, set(manifest.values()) | _shared_keys(prefix, video_id))
+    return manifest, None
+
+
+def render_for_video(video_id: int) -> Tuple[int, Optional[str], Optional[str]]:
+    """Generate derivatives for one video; returns (id, manifest json, error)."""
+    from .models import Video
+
+    v = db.session.get(Video, video_id)
+    if v is None:
+        return video_id, None, "missing"
+    with ExitStack() as stack:
+        video_path = stack.enter_context(storage.videos.fetch(v.filename))
+        custom = None
+        if v.thumb_is_custom and v.thumb_filename:
+            custom = stack.enter_context(storage.thumbs.fetch(v.thumb_filename))
+        manifest, err = generate_derivatives(video_path, v.id, custom)
+    return video_id, (json.dumps(manifest, sort_keys=True) if manifest else None), err
+
+
+_pool_app = None
+
+
+def _pool_init() -> None:
+    global _pool_app
+    from . import create_app
+
+    _pool_app = create_app()
+
+
+def _pool_render(video_id: int):
+    with _pool_app.app_context():
+        try:
+            return render_for_video(video_id)
+        finally:
+            db.session.remove()
+
+
+def regenerate_all(video_ids: Iterable[int], processes: int,
+                   on_result: Callable[[int, Optional[str], Optional[str]], None]) -> None:
+    """Fan `video_ids` out over a process pool (each worker builds its own app)."""
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=ctx, initializer=_pool_init) as pool:
+        futures = [pool.submit(_pool_render, vid) for vid in video_ids]
+        for fut in as_completed(futures):
+            on_result(*fut.result())
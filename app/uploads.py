@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from flask import current_app
+from sqlalchemy import update
+
+from .counters import bump
+from .extensions import db, page_cache, storage
+from .jobs import enqueue
+from .models import UploadSession, User, Video
+from .rankings import activity
+from .storage import COPY_BUFSIZE, content_key, file_sha256
+from .utils import MEDIA_FIELDS
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def create_video(user_id: int, title: str, original: str, filename: str, thumb_name: Optional[str] = None,
+                 content_hash: Optional[str] = None) -> Video:
+    """Record an upload staged in VIDEOS_DIR and queue its processing.
+
+    When a ready video already has the same `content_hash`, its stored (and
+    already converted) file is shared and the staged copy is dropped.
+    """
+    in_ext = original.rsplit(".", 1)[1].lower()
+    base = original.rsplit(".", 1)[0]
+
+    same = None
+    if content_hash:
+        same = (Video.query.filter_by(content_hash=content_hash, status="ready")
+                .order_by(Video.id).first())
+    if same is not None:
+        return _create_duplicate(same, user_id, title, original, filename, thumb_name)
+
+    # conversion + thumbnailing run out of band (app/jobs.py)
+    needs_convert = in_ext != "mp4" and bool(current_app.config.get("OLDTUBE_CONVERT", True))
+    needs_thumb = thumb_name is None and bool(current_app.config.get("OLDTUBE_THUMBNAIL", True))
+
+    v = Video(
+        title=title,
+        filename=filename,
+        content_hash=content_hash,
+        ext=in_ext,
+        original_name=original,
+        thumb_filename=thumb_name,
+        thumb_is_custom=thumb_name is not None,
+        uploader_id=user_id,
+        status="processing" if (needs_convert or needs_thumb) else "ready",
+    )
+    if v.status == "ready":
+        # nothing to transcode; the job publishes converted files itself
+        publish_video(v, current_app.config["VIDEOS_DIR"] / filename)
+    db.session.add(v)
+    bump(User, user_id, video_count=1)
+    db.session.commit()
+    page_cache.invalidate("videos")
+    # a head start so new uploads can show up in trending
+    activity.record(v.id, "upload")
+
+    processing = v.status == "processing"
+    if processing or current_app.config.get("OLDTUBE_HLS"):
+        enqueue("process_video", video_id=v.id, convert=needs_convert, thumbnail=needs_thumb, base=base,
+                publish=processing)
+        db.session.refresh(v)
+    if not processing:
+        # processing probes the file itself; this one went straight to storage
+        enqueue("probe_media", video_id=v.id)
+        # ...and queues the derivatives, which a custom thumbnail needs too
+        if not current_app.config.get("OLDTUBE_HLS") and _render_thumbs():
+            enqueue("thumbnails", video_id=v.id)
+    return v
+
+
+def _render_thumbs() -> bool:
+    return bool(current_app.config.get("OLDTUBE_THUMBNAIL", True))
+
+
+def publish_video(v: Video, path: Path) -> None:
+    """Move a finished file from the VIDEOS_DIR staging area into storage,
+    under a key derived from the uploaded bytes when we know their hash."""
+    key = content_key(v.content_hash, path.suffix.lstrip(".").lower()) if v.content_hash else path.name
+    storage.videos.put(path, key)
+    v.filename = key
+
+
+def _create_duplicate(same: Video, user_id: int, title: str, original: str, filename: str,
+                      thumb_name: Optional[str]) -> Video:
+    (current_app.config["VIDEOS_DIR"] / filename).unlink(missing_ok=True)
+    # someone else's custom thumbnail isn't theirs to reuse
+    share_thumbs = thumb_name is None and not same.thumb_is_custom
+    v = Video(
+        title=title,
+        filename=same.filename,
+        content_hash=same.content_hash,
+        ext=same.ext,
+        original_name=original,
+        thumb_filename=thumb_name if thumb_name is not None else (same.thumb_filename if share_thumbs else None),
+        thumb_is_custom=thumb_name is not None,
+        thumb_derivatives=same.thumb_derivatives if share_thumbs else None,
+        hls_dir=same.hls_dir,
+        uploader_id=user_id,
+        status="ready",
+        **{name: getattr(same, name) for name in MEDIA_FIELDS},
+    )
+    db.session.add(v)
+    bump(User, user_id, video_count=1)
+    db.session.commit()
+    page_cache.invalidate("videos")
+    activity.record(v.id, "upload")
+
+    if (not share_thumbs or not v.thumb_derivatives) and _render_thumbs():
+        enqueue("thumbnails", video_id=v.id)
+    if current_app.config.get("OLDTUBE_HLS") and not v.hls_dir:
+        enqueue("package_hls", video_id=v.id)
+    return v
+
+
+def _part_path(s: UploadSession) -> Path:
+    return current_app.config["VIDEOS_DIR"] / (s.temp_name + ".part")
+
+
+def append_chunk(s: UploadSession, offset: int, stream: BinaryIO, length: Optional[int]) -> int:
+    """Write a chunk at `offset` straight into the session's destination file.
+
+    The offset must equal what the server already holds, so a client that lost
+    a response simply asks for the current offset and resends from there. Two
+    PUTs racing for the same session are serialized by an exclusive lock on
+    the part file, and `received` only advances if it still equals `offset`,
+    so the loser gets a 409 rather than overwriting the winner's bytes.
+    """
+    if offset != s.received:
+        raise UploadError(f"offset mismatch: server has {s.received} bytes", 409)
+    if length is not None and length > s.size - offset:
+        raise UploadError("chunk runs past the declared file size", 413)
+
+    path = _part_path(s)
+    written = 0
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, "r+b") as f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError("another chunk for this upload is in flight", 409) from None
+        # whoever held the lock before us may have moved the offset already
+        db.session.refresh(s)
+        if offset != s.received:
+            raise UploadError(f"offset mismatch: server has {s.received} bytes", 409)
+        limit = s.size - offset
+        f.seek(offset)
+        while True:
+            buf = stream.read(min(COPY_BUFSIZE, limit - written + 1))
+            if not buf:
+                break
+            written += len(buf)
+            if written > limit:
+                f.truncate(offset)
+                raise UploadError("chunk runs past the declared file size", 413)
+            f.write(buf)
+        f.truncate(offset + written)
+        advanced = db.session.execute(
+            update(UploadSession)
+            .where(UploadSession.id == s.id, UploadSession.received == offset)
+            .values(received=offset + written, updated_at=time.time())
+        ).rowcount
+        db.session.commit()
+        if not advanced:
+            db.session.refresh(s)
+            raise UploadError(f"offset mismatch: server has {s.received} bytes", 409)
+    db.session.refresh(s)
+    return s.received
+
+
+def finalize(s: UploadSession) -> Video:
+    if s.received != s.size:
+        raise UploadError(f"incomplete upload: {s.received} of {s.size} bytes", 409)
+    path = _part_path(s)
+    digest = file_sha256(path)
+    if s.checksum and digest != s.checksum:
+        # keep nothing: the client has to start over with the right bytes
+        discard(s)
+        raise UploadError("checksum mismatch", 422)
+    os.replace(path, current_app.config["VIDEOS_DIR"] / s.temp_name)
+    v = create_video(s.user_id, s.title, s.original_name, s.temp_name, content_hash=digest)
+    db.session.delete(s)
+    db.session.commit()
+    return v
+
+
+def discard(s: UploadSession) -> None:
+    _part_path(s).unlink(missing_ok=True)
+    db.session.delete(s)
+    db.session.commit()
+
+
+def gc_upload_sessions(max_age: Optional[float] = None) -> int:
+    """Delete sessions (and their partial files) idle for longer than `max_age` seconds."""
+    if max_age is None:
+        max_age = float(current_app.config.get("OLDTUBE_UPLOAD_SESSION_TTL", 86400))
+    cutoff = time.time() - max_age
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for s in stale:
+        _part_path(s).unlink(missing_ok=True)
+        db.session.delete(s)
+    if stale:
+        db.session.commit()
+    return len(stale)
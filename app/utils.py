@@ -1,14 +1,17 @@
 from __future__ import annotations
 
-import mimetypes
+import json
 import re
 import shutil
 import subprocess
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional, Tuple
 
-from flask import Response, abort, request, send_from_directory, current_app
+from flask import current_app
+
+from .instrumentation import record_ffmpeg
 
 ALLOWED_VIDEO_EXTS = {"mp4", "webm", "ogg", "mov", "mkv"}
 ALLOWED_IMAGE_EXTS = {"png", "jpg", "jpeg", "webp"}
@@ -28,6 +31,12 @@ def slug_safe(s: str) -> str:
     s = re.sub(r"\s+", "-", s).strip("-")
     return s[:60] or "video"
 
+def format_ts(ts: Optional[int], fmt: str = "%Y-%m-%d %H:%M") -> str:
+    """Jinja `ts` filter: epoch seconds (see app/models.py) as UTC text."""
+    if ts is None:
+        return ""
+    return datetime.fromtimestamp(ts, timezone.utc).strftime(fmt)
+
 def unique_name(base: str, suffix_ext: str) -> str:
     stamp = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
     return f"{slug_safe(base)}-{stamp}.{suffix_ext}"
@@ -44,12 +53,98 @@ def run_ffmpeg(args: list[str]) -> Tuple[bool, str]:
     b = ffmpeg_bin()
     if not ffmpeg_available():
         return False, "ffmpeg not found"
+    started = time.perf_counter()
     p = subprocess.run([b, *args], capture_output=True, text=True, check=False)
     ok = p.returncode == 0
+    record_ffmpeg(time.perf_counter() - started, ok)
     msg = (p.stderr or p.stdout or "").strip()[:2000]
     return ok, msg
 
-def convert_to_mp4_if_needed(in_path: Path) -> Tuple[Path, str, Optional[str]]:
+# columns filled from probe_media() (see Video in app/models.py)
+MEDIA_FIELDS = ("duration", "width", "height", "video_codec", "audio_codec", "bitrate")
+# what every browser plays inside an mp4 without re-encoding
+_COPYABLE_VIDEO = {"h264"}
+_COPYABLE_AUDIO = {None, "aac"}
+_COPYABLE_PIX_FMT = {None, "yuv420p", "yuvj420p"}
+
+def ffprobe_bin() -> str:
+    cfg = current_app.config.get("FFPROBE_BIN") or ""
+    if cfg:
+        return cfg
+    # usually installed next to ffmpeg
+    sibling = Path(ffmpeg_bin()).with_name("ffprobe") if ffmpeg_bin() else None
+    if sibling is not None and sibling.exists():
+        return str(sibling)
+    return shutil.which("ffprobe") or ""
+
+def probe_media(path: Path) -> Optional[dict]:
+    """Duration, dimensions, codecs and bitrate of a media file (None when it
+    can't be inspected). Uses ffprobe, or ffmpeg's stream banner without it."""
+    probe = ffprobe_bin()
+    if probe:
+        p = subprocess.run([probe, "-v", "error", "-show_format", "-show_streams", "-of", "json", str(path)],
+                           capture_output=True, text=True, check=False)
+        if p.returncode != 0:
+            return None
+        return _from_ffprobe(json.loads(p.stdout or "{}"))
+    if not ffmpeg_available():
+        return None
+    # no output file, so ffmpeg exits 1 after printing the input's streams
+    p = subprocess.run([ffmpeg_bin(), "-hide_banner", "-i", str(path)], capture_output=True, text=True, check=False)
+    return _from_ffmpeg_banner(p.stderr)
+
+def _from_ffprobe(data: dict) -> Optional[dict]:
+    fmt = data.get("format") or {}
+    streams = data.get("streams") or []
+    video = next((st for st in streams if st.get("codec_type") == "video"
+                  and not (st.get("disposition") or {}).get("attached_pic")), None)
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), None)
+    if video is None and audio is None:
+        return None
+    return {
+        "duration": float(fmt["duration"]) if fmt.get("duration") else None,
+        "width": video.get("width") if video else None,
+        "height": video.get("height") if video else None,
+        "video_codec": video.get("codec_name") if video else None,
+        "audio_codec": audio.get("codec_name") if audio else None,
+        "bitrate": int(fmt["bit_rate"]) if str(fmt.get("bit_rate", "")).isdigit() else None,
+        "pix_fmt": video.get("pix_fmt") if video else None,
+    }
+
+_BANNER_DURATION = re.compile(r"Duration: (\d+):(\d\d):(\d\d(?:\.\d+)?)")
+_BANNER_BITRATE = re.compile(r"bitrate: (\d+) kb/s")
+_BANNER_STREAM = re.compile(r"Stream #0:\d+.*?: (Video|Audio): (\w+)([^\n]*)")
+
+def _from_ffmpeg_banner(text: str) -> Optional[dict]:
+    out = dict.fromkeys((*MEDIA_FIELDS, "pix_fmt"))
+    for kind, codec, rest in _BANNER_STREAM.findall(text):
+        if kind == "Video" and out["video_codec"] is None and "attached pic" not in rest:
+            out["video_codec"] = codec
+            m = re.search(r", (\d{2,5})x(\d{2,5})", rest)
+            if m:
+                out["width"], out["height"] = int(m.group(1)), int(m.group(2))
+            m = re.match(r"[^,]*, (\w+)", rest)
+            out["pix_fmt"] = m.group(1) if m else None
+        elif kind == "Audio" and out["audio_codec"] is None:
+            out["audio_codec"] = codec
+    if out["video_codec"] is None and out["audio_codec"] is None:
+        return None
+    m = _BANNER_DURATION.search(text)
+    if m:
+        out["duration"] = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3))
+    m = _BANNER_BITRATE.search(text)
+    if m:
+        out["bitrate"] = int(m.group(1)) * 1000
+    return out
+
+def can_remux(meta: Optional[dict]) -> bool:
+    return bool(meta) and meta["video_codec"] in _COPYABLE_VIDEO \
+        and meta["audio_codec"] in _COPYABLE_AUDIO and meta.get("pix_fmt") in _COPYABLE_PIX_FMT
+
+def convert_to_mp4_if_needed(in_path: Path, meta: Optional[dict] = None) -> Tuple[Path, str, Optional[str]]:
+    """Make a browser-playable .mp4. With `meta` from probe_media() showing
+    H.264/AAC already, the streams are copied into the new container instead
+    of re-encoded, which takes about as long as reading the file."""
     auto = bool(current_app.config.get("OLDTUBE_CONVERT", True))
     in_ext = in_path.suffix.lower().lstrip(".")
     if in_ext == "mp4" or not auto:
@@ -58,13 +153,23 @@ def convert_to_mp4_if_needed(in_path: Path) -> Tuple[Path, str, Optional[str]]:
         return in_path, in_ext, "ffmpeg not found (convert skipped)"
 
     out_path = in_path.with_suffix(".mp4")
-    ok, msg = run_ffmpeg([
-        "-y", "-i", str(in_path),
-        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
-        "-c:a", "aac", "-b:a", "128k",
-        "-movflags", "+faststart",
-        str(out_path),
-    ])
+    ok = False
+    if can_remux(meta):
+        ok, msg = run_ffmpeg([
+            "-y", "-i", str(in_path),
+            # first video and audio stream only: mp4 can't carry e.g. mkv subtitles
+            "-map", "0:v:0", "-map", "0:a:0?", "-c", "copy",
+            "-movflags", "+faststart",
+            str(out_path),
+        ])
+    if not ok:
+        ok, msg = run_ffmpeg([
+            "-y", "-i", str(in_path),
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+            "-c:a", "aac", "-b:a", "128k",
+            "-movflags", "+faststart",
+            str(out_path),
+        ])
     if not ok:
         return in_path, in_ext, f"Convert failed: {msg}"
     try:
@@ -80,9 +185,11 @@ def generate_thumbnail(video_path: Path, base_name: str) -> Tuple[Optional[str],
     if not ffmpeg_available():
         return None, "ffmpeg not found (thumbnail skipped)"
 
+    from .extensions import storage
+    from .storage import content_key, file_sha256
+
     thumbs_dir: Path = current_app.config["THUMBS_DIR"]
-    thumb_name = unique_name(f"{base_name}-thumb", "jpg")
-    out_path = thumbs_dir / thumb_name
+    out_path = thumbs_dir / unique_name(f"{base_name}-thumb", "jpg")
     ok, msg = run_ffmpeg([
         "-y", "-ss", "00:00:01.000", "-i", str(video_path),
         "-vframes", "1",
@@ -92,46 +199,6 @@ def generate_thumbnail(video_path: Path, base_name: str) -> Tuple[Optional[str],
     ])
     if not ok or not out_path.exists():
         return None, f"Thumbnail failed: {msg}"
+    thumb_name = content_key(file_sha256(out_path), "jpg")
+    storage.thumbs.put(out_path, thumb_name)
     return thumb_name, None
-
-def send_file_range(directory: Path, filename: str) -> Response:
-    path = directory / filename
-    if not path.exists() or not path.is_file():
-        abort(404)
-
-    file_size = path.stat().st_size
-    range_header = request.headers.get("Range", None)
-    mime, _ = mimetypes.guess_type(str(path))
-    mime = mime or "application/octet-stream"
-
-    if not range_header:
-        return send_from_directory(directory, filename, conditional=True, mimetype=mime)
-
-    m = re.match(r"bytes=(\d+)-(\d*)", range_header)
-    if not m:
-        return send_from_directory(directory, filename, conditional=True, mimetype=mime)
-
-    start = int(m.group(1))
-    end = int(m.group(2)) if m.group(2) else file_size - 1
-    start = max(0, min(start, file_size - 1))
-    end = max(start, min(end, file_size - 1))
-    length = end - start + 1
-
-    def gen():
-        with open(path, "rb") as f:
-            f.seek(start)
-            remaining = length
-            chunk = 1024 * 256
-            while remaining > 0:
-                read_size = min(chunk, remaining)
-                data = f.read(read_size)
-                if not data:
-                    break
-                remaining -= len(data)
-                yield data
-
-    rv = Response(gen(), 206, mimetype=mime, direct_passthrough=True)
-    rv.headers.add("Content-Range", f"bytes {start}-{end}/{file_size}")
-    rv.headers.add("Accept-Ranges", "bytes")
-    rv.headers.add("Content-Length", str(length))
-    return rv
@@ -0,0 +1,15 @@
+"""ASGI entry points, e.g. with uvicorn (pip install uvicorn):
+
+    uvicorn asgi:media --port 8001          # /media/* and /events only; route them here from the proxy
+    uvicorn asgi:application --port 8000    # media async, pages through Flask (pip install a2wsgi)
+"""
+from app import create_app
+from app import login  # noqa
+from app.media_asgi import MediaApp, WsgiFallback
+
+flask_app = create_app()
+
+media = MediaApp(flask_app)
+# /events streams are served by MediaApp itself and never hold one of these
+wsgi = WsgiFallback(flask_app, workers=flask_app.config["OLDTUBE_ASGI_WSGI_THREADS"])
+application = MediaApp(flask_app, fallback=wsgi)
@@ -0,0 +1,84 @@
+"""Watch-page latency while a login flood is running.
+
+Attackers post wrong passwords from many addresses (so the per-IP bucket
+doesn't stop them) while one client keeps loading a page. Compares a bounded
+hashing pool with one as wide as the flood, i.e. hashing on every request
+thread as before:
+
+    python bench/bench_auth.py --attackers 16 --seconds 5
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import create_app  # noqa: E402
+
+
+def run(workers: int, attackers: int, seconds: float) -> dict:
+    tmp = Path(tempfile.mkdtemp())
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + str(tmp / "bench.db"),
+        "UPLOADS_DIR": tmp, "VIDEOS_DIR": tmp / "videos", "THUMBS_DIR": tmp / "thumbs",
+        "OLDTUBE_CACHE": "none",
+        "OLDTUBE_JOB_WORKERS": 0,
+        "OLDTUBE_AUTH_WORKERS": workers,
+        "OLDTUBE_AUTH_QUEUE": attackers,
+        "OLDTUBE_AUTH_USER_BURST": 1_000_000,
+        "OLDTUBE_AUTH_ACCOUNT_BURST": 1_000_000,
+    })
+    stop = time.perf_counter() + seconds
+    logins = [0]
+    lock = threading.Lock()
+
+    def attacker(n: int) -> None:
+        client = app.test_client()
+        i = 0
+        while time.perf_counter() < stop:
+            client.post("/auth/login", data={"username": "admin", "password": "wrong"},
+                        environ_base={"REMOTE_ADDR": f"10.{n}.{i // 250 % 250}.{i % 250}"})
+            i += 1
+        with lock:
+            logins[0] += i
+
+    threads = [threading.Thread(target=attacker, args=(n,)) for n in range(attackers)]
+    for t in threads:
+        t.start()
+    client = app.test_client()
+    latencies = []
+    while time.perf_counter() < stop:
+        t0 = time.perf_counter()
+        client.get("/videos").close()
+        latencies.append(time.perf_counter() - t0)
+    for t in threads:
+        t.join()
+    latencies.sort()
+    return {
+        "logins/s": logins[0] / seconds,
+        "page p50 ms": 1000 * statistics.median(latencies),
+        "page p99 ms": 1000 * latencies[int(0.99 * (len(latencies) - 1))],
+        "pages/s": len(latencies) / seconds,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--attackers", type=int, default=16)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--workers", type=int, default=2, help="bounded pool size")
+    args = ap.parse_args()
+
+    for label, workers in (("unbounded", args.attackers), (f"pool={args.workers}", args.workers)):
+        r = run(workers, args.attackers, args.seconds)
+        print(f"{label:10s} " + "  ".join(f"{k} {v:8.1f}" for k, v in r.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Upload conversion time: full re-encode vs. remux of an H.264/AAC source.
+
+Generates a test clip in an .mkv or .mov container (already H.264/AAC, the
+common case for phone and camera footage), then times
+`convert_to_mp4_if_needed` with and without the probe result that allows a
+stream copy.
+
+    python bench/bench_convert.py --seconds 30 --size 1280x720
+"""
+from __future__ import annotations
+
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import create_app  # noqa: E402
+from app.utils import can_remux, convert_to_mp4_if_needed, ffmpeg_bin, probe_media  # noqa: E402
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=int, default=20)
+    ap.add_argument("--size", default="1280x720")
+    ap.add_argument("--container", choices=("mkv", "mov"), default="mkv")
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp())
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + str(tmp / "bench.db"),
+        "UPLOADS_DIR": tmp, "VIDEOS_DIR": tmp / "videos", "THUMBS_DIR": tmp / "thumbs",
+        "OLDTUBE_JOB_WORKERS": 0,
+    })
+    with app.app_context():
+        src = tmp / f"source.{args.container}"
+        subprocess.run([
+            ffmpeg_bin(), "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={args.size}:rate=30",
+            "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000",
+            "-t", str(args.seconds), "-pix_fmt", "yuv420p",
+            "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac", str(src),
+        ], check=True)
+        meta = probe_media(src)
+        print(f"source: {src.stat().st_size / 1e6:.1f} MB, {meta}")
+        print(f"remux eligible: {can_remux(meta)}")
+
+        results = {}
+        for label, m in (("re-encode", None), ("remux", meta)):
+            times = []
+            for _ in range(args.runs):
+                work = tmp / f"work.{args.container}"
+                shutil.copyfile(src, work)
+                started = time.perf_counter()
+                out, _ext, err = convert_to_mp4_if_needed(work, m)
+                times.append(time.perf_counter() - started)
+                if err:
+                    sys.exit(err)
+                out.unlink()
+            results[label] = min(times)
+            print(f"{label:10s} best of {args.runs}: {results[label] * 1000:9.1f} ms")
+        print(f"speed-up: {results['re-encode'] / results['remux']:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
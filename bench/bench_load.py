@@ -0,0 +1,389 @@
+"""Load test for the core routes against a seeded synthetic database.
+
+Seeds users, videos, comments and ratings at a given scale, then drives
+`home`, `list_videos`, `watch`, ranged `media_video` reads and `upload_post`
+with concurrent clients, first through the Flask test client and then over
+HTTP against a threaded WSGI server. Per-route p50/p99 latency and throughput
+go to a JSON report that can be diffed against an earlier run:
+
+    python bench/bench_load.py --rows 100000 --concurrency 8 --out before.json
+    python bench/bench_load.py --rows 100000 --concurrency 8 --out after.json --compare before.json
+
+`--rows` is the comment count; videos, users and ratings scale from it. Seeding
+1M rows takes a while, so pass `--db` to keep the database between runs. To
+load an external server (gunicorn etc.), seed with `--seed-only --db X`, start
+the server with OLDTUBE_DB=X and pass `--url http://host:port`.
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app import login  # noqa: E402,F401  (registers the user loader)
+from app.counters import reconcile_counters  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.models import Comment, Rating, User, Video  # noqa: E402
+
+BATCH = 10_000
+MEDIA_NAME = "bench-media.mp4"
+RANGE_BYTES = 256 * 1024
+BENCH_USER, BENCH_PASS = "bench0", "bench"
+
+
+def scale(rows: int) -> dict:
+    return {
+        "comments": rows,
+        "videos": max(10, rows // 10),
+        "users": max(10, rows // 100),
+        "ratings": rows // 2,
+    }
+
+
+def _insert(model, rows) -> None:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH:
+            db.session.execute(db.insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(model), batch)
+    db.session.commit()
+
+
+def seed(app, counts: dict) -> None:
+    """Bulk-insert synthetic rows (skipped when the database already has videos)."""
+    with app.app_context():
+        if db.session.query(Video.id).first() is not None:
+            return
+        rnd = random.Random(42)
+        n_users, n_videos = counts["users"], counts["videos"]
+        _insert(User, ({"username": f"bench{i}",
+                        "password_hash": generate_password_hash(BENCH_PASS) if i == 0 else "x"}
+                       for i in range(n_users)))
+        first_user = db.session.query(User.id).filter_by(username="bench0").scalar()
+        _insert(Video, ({"title": f"synthetic video {i}", "filename": f"bench-{i}.mp4", "ext": "mp4",
+                         "original_name": "bench.mp4", "uploader_id": first_user + i % n_users,
+                         "uploaded_at": 1704067200 + i % 60}
+                        for i in range(n_videos)))
+        first_video = db.session.query(db.func.min(Video.id)).scalar()
+        _insert(Comment, ({"video_id": first_video + rnd.randrange(n_videos), "user_id": first_user + i % n_users,
+                           "body": f"synthetic comment {i}"}
+                          for i in range(counts["comments"])))
+        # (video, user) pairs must be unique for ratings
+        n_ratings = min(counts["ratings"], n_videos * n_users)
+        _insert(Rating, ({"video_id": first_video + i % n_videos, "user_id": first_user + (i // n_videos) % n_users,
+                          "stars": 1 + rnd.randrange(5)}
+                         for i in range(n_ratings)))
+        reconcile_counters()
+
+
+def build_app(db_path: Path, media_dir: Path, cache: str):
+    return create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + str(db_path),
+        "UPLOADS_DIR": media_dir,
+        "VIDEOS_DIR": media_dir / "videos",
+        "THUMBS_DIR": media_dir / "thumbs",
+        "OLDTUBE_CACHE": cache,
+        "OLDTUBE_JOB_WORKERS": 0,
+        "OLDTUBE_THUMBNAIL": False,
+        "OLDTUBE_CONVERT": False,
+        "OLDTUBE_HLS": False,
+        # every upload worker logs in as the same user
+        "OLDTUBE_AUTH_IP_BURST": 1_000_000,
+        "OLDTUBE_AUTH_USER_BURST": 1_000_000,
+        "OLDTUBE_AUTH_ACCOUNT_BURST": 1_000_000,
+    })
+
+
+def write_media(videos_dir: Path, size_mb: int) -> int:
+    path = videos_dir / MEDIA_NAME
+    size = size_mb * 1024 * 1024
+    if not path.exists() or path.stat().st_size != size:
+        with open(path, "wb") as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+    return size
+
+
+def routes(n_videos: int, media_size: int) -> list[tuple]:
+    """(name, method, path factory, extra-headers factory, needs login)."""
+    def watch(rnd):
+        return f"/watch/{rnd.randint(1, n_videos)}"
+
+    def media_range(rnd):
+        start = rnd.randrange(0, max(1, media_size - RANGE_BYTES))
+        return {"Range": f"bytes={start}-{start + RANGE_BYTES - 1}"}
+
+    def none(rnd):
+        return {}
+
+    return [
+        ("home", "GET", lambda rnd: "/", none, False),
+        ("list_videos", "GET", lambda rnd: "/videos", none, False),
+        ("list_videos_deep", "GET", lambda rnd: f"/videos?before={rnd.randint(2, n_videos)}", none, False),
+        ("watch", "GET", watch, none, False),
+        ("media_video_range", "GET", lambda rnd: f"/media/video/{MEDIA_NAME}", media_range, False),
+        ("upload_post", "POST", lambda rnd: "/upload", none, True),
+    ]
+
+
+UPLOAD_BYTES = b"\x00\x00\x00\x18ftypmp42" + os.urandom(64 * 1024)
+
+
+class TestClientDriver:
+    name = "test_client"
+
+    def __init__(self, app):
+        self.app = app
+
+    def session(self, logged_in: bool):
+        client = self.app.test_client()
+        if logged_in:
+            client.post("/auth/login", data={"username": BENCH_USER, "password": BENCH_PASS})
+        return client
+
+    def request(self, client, method: str, path: str, headers: dict) -> int:
+        if method == "POST":
+            rv = client.post(path, data={"title": "bench upload", "file": (io.BytesIO(UPLOAD_BYTES), "bench.mp4")})
+        else:
+            rv = client.get(path, headers=headers)
+        rv.get_data()
+        rv.close()
+        return rv.status_code
+
+
+class HttpDriver:
+    name = "wsgi"
+
+    def __init__(self, base_url: str):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+
+    def session(self, logged_in: bool):
+        s = {"conn": http.client.HTTPConnection(self.host, self.port, timeout=60), "cookie": ""}
+        if logged_in:
+            body = f"username={BENCH_USER}&password={BENCH_PASS}".encode()
+            resp = self._send(s, "POST", "/auth/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+            cookie = resp.getheader("Set-Cookie") or ""
+            s["cookie"] = cookie.split(";", 1)[0]
+        return s
+
+    def _send(self, s: dict, method: str, path: str, body, headers: dict):
+        if s["cookie"]:
+            headers = {**headers, "Cookie": s["cookie"]}
+        for attempt in (1, 2):
+            try:
+                s["conn"].request(method, path, body=body, headers=headers)
+                resp = s["conn"].getresponse()
+                resp.read()
+                if resp.getheader("Connection", "").lower() == "close":
+                    s["conn"].close()
+                return resp
+            except (http.client.HTTPException, ConnectionError):
+                s["conn"].close()
+                if attempt == 2:
+                    raise
+
+    def request(self, s: dict, method: str, path: str, headers: dict) -> int:
+        body = None
+        if method == "POST":
+            boundary = "benchboundary7d3f"
+            body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"title\"\r\n\r\nbench upload\r\n"
+                    f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"bench.mp4\"\r\n"
+                    f"Content-Type: video/mp4\r\n\r\n").encode() + UPLOAD_BYTES + f"\r\n--{boundary}--\r\n".encode()
+            headers = {**headers, "Content-Type": f"multipart/form-data; boundary={boundary}"}
+        return self._send(s, method, path, body, headers).status
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run_route(driver, route: tuple, concurrency: int, requests: int, seed_value: int, warmup: int = 0) -> dict:
+    name, method, path_of, headers_of, needs_login = route
+    if warmup:
+        # untimed: fills the page cache, SQLite page cache and connection pool
+        rnd = random.Random(seed_value)
+        sess = driver.session(needs_login)
+        for _ in range(warmup):
+            driver.request(sess, method, path_of(rnd), headers_of(rnd))
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker(n: int) -> None:
+        nonlocal errors
+        rnd = random.Random(seed_value * 1000 + n)
+        sess = driver.session(needs_login)
+        local, bad = [], 0
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            path, headers = path_of(rnd), headers_of(rnd)
+            t0 = time.perf_counter()
+            try:
+                status = driver.request(sess, method, path, headers)
+            except Exception:
+                status = 599
+            local.append(time.perf_counter() - t0)
+            bad += status >= 400
+        with lock:
+            latencies.extend(local)
+            errors += bad
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "driver": driver.name,
+        "route": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "p50_ms": round(1000 * percentile(latencies, 0.50), 3),
+        "p99_ms": round(1000 * percentile(latencies, 0.99), 3),
+        "mean_ms": round(1000 * sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "rps": round(len(latencies) / wall, 1) if wall else 0.0,
+    }
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=False).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(report: dict, baseline_path: Path) -> None:
+    base = {(r["driver"], r["route"]): r for r in json.loads(baseline_path.read_text())["results"]}
+    print(f"\n{'vs ' + str(baseline_path):44s} {'p50':>9s} {'p99':>9s} {'rps':>9s}")
+    for r in report["results"]:
+        b = base.get((r["driver"], r["route"]))
+        if b is None:
+            continue
+
+        def pct(new, old):
+            return f"{100 * (new - old) / old:+8.1f}%" if old else "      n/a"
+        print(f"{r['driver'] + ' ' + r['route']:44s} {pct(r['p50_ms'], b['p50_ms'])} "
+              f"{pct(r['p99_ms'], b['p99_ms'])} {pct(r['rps'], b['rps'])}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10_000, help="comment rows (10000, 100000, 1000000...)")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=400, help="requests per route and driver")
+    ap.add_argument("--warmup", type=int, default=20, help="untimed requests before each route")
+    ap.add_argument("--drivers", default="test_client,wsgi")
+    ap.add_argument("--routes", default="", help="comma-separated subset of route names")
+    ap.add_argument("--cache", default="memory", choices=["memory", "file", "none"])
+    ap.add_argument("--media-mb", type=int, default=64)
+    ap.add_argument("--db", type=Path, help="keep/reuse the seeded database at this path")
+    ap.add_argument("--url", help="load an already running server instead of starting one")
+    ap.add_argument("--seed-only", action="store_true")
+    ap.add_argument("--out", type=Path, default=Path("bench-report.json"))
+    ap.add_argument("--compare", type=Path, help="earlier report to diff against")
+    args = ap.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    db_path = args.db or Path(tmp.name) / "bench.db"
+    media_dir = (db_path.parent if args.db else Path(tmp.name)) / "bench-media"
+    counts = scale(args.rows)
+    app = build_app(db_path, media_dir, args.cache)
+
+    t0 = time.perf_counter()
+    seed(app, counts)
+    seed_seconds = time.perf_counter() - t0
+    media_size = write_media(app.config["VIDEOS_DIR"], args.media_mb)
+    print(f"seeded {counts} in {seed_seconds:.1f}s ({db_path})")
+    if args.seed_only:
+        return
+
+    with app.app_context():
+        n_videos = db.session.query(db.func.max(Video.id)).scalar()
+    wanted = {r for r in args.routes.split(",") if r}
+    route_list = [r for r in routes(n_videos, media_size) if not wanted or r[0] in wanted]
+
+    server = None
+    drivers = []
+    for name in args.drivers.split(","):
+        if name == "test_client":
+            drivers.append(TestClientDriver(app))
+        elif name == "wsgi":
+            url = args.url
+            if url is None:
+                logging.getLogger("werkzeug").setLevel(logging.WARNING)
+                server = make_server("127.0.0.1", 0, app, threaded=True)
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                url = f"http://127.0.0.1:{server.server_port}"
+            drivers.append(HttpDriver(url))
+
+    results = []
+    for driver in drivers:
+        for i, route in enumerate(route_list):
+            r = run_route(driver, route, args.concurrency, args.requests, i, args.warmup)
+            results.append(r)
+            print(f"{r['driver']:12s} {r['route']:18s} p50 {r['p50_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms"
+                  f"  {r['rps']:8.1f} req/s  errors {r['errors']}")
+    if server is not None:
+        server.shutdown()
+
+    report = {
+        "meta": {
+            "rows": counts,
+            "seed_seconds": round(seed_seconds, 1),
+            "concurrency": args.concurrency,
+            "requests_per_route": args.requests,
+            "warmup": args.warmup,
+            "cache": args.cache,
+            "media_bytes": media_size,
+            "range_bytes": RANGE_BYTES,
+            "git": git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    args.out.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"report written to {args.out}")
+    if args.compare:
+        compare(report, args.compare)
+    with app.app_context():
+        db.engine.dispose()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
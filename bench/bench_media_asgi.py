@@ -0,0 +1,149 @@
+"""Thousands of concurrent slow range streams against the async media server.
+
+Starts `MediaApp` (app/media_asgi.py) under uvicorn in a child process, then
+opens `--clients` connections at once, each fetching a random `--range-kb`
+slice of one video and reading it at `--client-kbps` (a viewer on a slow
+link). While they run, a probe requests a small range every 100 ms to show
+the server still answers new requests promptly. Needs `pip install uvicorn`.
+
+    python bench/bench_media_asgi.py --clients 2000 --range-kb 512 --client-kbps 256
+    python bench/bench_media_asgi.py --clients 500 --rate-kbps 128   # server-side cap
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+MEDIA_NAME = "bench-media.mp4"
+
+
+def serve(tmp: str, port: int, rate_kbps: int, ready) -> None:
+    import uvicorn
+
+    from app import create_app
+    from app.media_asgi import MediaApp
+
+    tmp = Path(tmp)
+    flask_app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + str(tmp / "bench.db"),
+        "UPLOADS_DIR": tmp, "VIDEOS_DIR": tmp / "videos", "THUMBS_DIR": tmp / "thumbs",
+        "OLDTUBE_JOB_WORKERS": 0,
+        "OLDTUBE_MEDIA_RATE_KBPS": rate_kbps,
+        "OLDTUBE_MEDIA_BURST_KB": 64,
+    })
+    server = uvicorn.Server(uvicorn.Config(MediaApp(flask_app), host="127.0.0.1", port=port,
+                                           backlog=8192, log_level="warning", lifespan="on"))
+    ready.set()
+    server.run()
+
+
+async def fetch(port: int, start: int, length: int, client_bps: int) -> tuple[float, float, int]:
+    """One range request; returns (time to first byte, total time, bytes read)."""
+    began = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write((f"GET /media/video/{MEDIA_NAME} HTTP/1.1\r\nHost: bench\r\nReferer: http://bench/watch/1\r\n"
+                  f"Range: bytes={start}-{start + length - 1}\r\nConnection: close\r\n\r\n").encode())
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    ttfb = time.perf_counter() - began
+    if not head.startswith(b"HTTP/1.1 206"):
+        raise RuntimeError(head.split(b"\r\n", 1)[0].decode())
+    got = 0
+    while got < length:
+        buf = await reader.read(64 * 1024)
+        if not buf:
+            break
+        got += len(buf)
+        if client_bps:
+            # read no faster than the client's link
+            ahead = began + got / client_bps - time.perf_counter()
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+    writer.close()
+    return ttfb, time.perf_counter() - began, got
+
+
+async def probe(port: int, stop: asyncio.Event, latencies: list[float]) -> None:
+    while not stop.is_set():
+        try:
+            _ttfb, total, _ = await fetch(port, 0, 4096, 0)
+            latencies.append(total)
+        except (OSError, RuntimeError, asyncio.IncompleteReadError):
+            pass
+        await asyncio.sleep(0.1)
+
+
+async def run(args, size: int) -> None:
+    rnd = random.Random(1)
+    length = args.range_kb * 1024
+    stop = asyncio.Event()
+    probe_latencies: list[float] = []
+    prober = asyncio.ensure_future(probe(args.port, stop, probe_latencies))
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        fetch(args.port, rnd.randrange(0, size - length), length, args.client_kbps * 1024)
+        for _ in range(args.clients)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+
+    ok = [r for r in results if not isinstance(r, BaseException) and r[2] == length]
+    errors = len(results) - len(ok)
+    ttfb = sorted(r[0] for r in ok) or [0.0]
+    rates = sorted(r[2] / max(r[1] - r[0], 1e-6) / 1024 for r in ok) or [0.0]
+    total = sum(r[2] for r in ok)
+    print(f"{len(ok)}/{args.clients} streams complete, {errors} errors, in {elapsed:.1f}s")
+    print(f"aggregate {total / elapsed / 1e6:.1f} MB/s, per stream median {statistics.median(rates):.0f} KB/s")
+    print(f"time to first byte p50 {1000 * ttfb[len(ttfb) // 2]:.0f} ms, p99 {1000 * ttfb[int(len(ttfb) * 0.99)]:.0f} ms")
+    if probe_latencies:
+        pl = sorted(probe_latencies)
+        print(f"probe during load: {len(pl)} requests, p50 {1000 * pl[len(pl) // 2]:.0f} ms, "
+              f"max {1000 * pl[-1]:.0f} ms")
+    for r in results:
+        if isinstance(r, BaseException):
+            print(f"first error: {r!r}")
+            break
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clients", type=int, default=2000)
+    ap.add_argument("--range-kb", type=int, default=512)
+    ap.add_argument("--client-kbps", type=int, default=256, help="Client read rate (0 = as fast as possible).")
+    ap.add_argument("--rate-kbps", type=int, default=0, help="Server-side OLDTUBE_MEDIA_RATE_KBPS.")
+    ap.add_argument("--size-mb", type=int, default=64)
+    ap.add_argument("--port", type=int, default=8741)
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp())
+    (tmp / "videos").mkdir()
+    size = args.size_mb * 1024 * 1024
+    with open(tmp / "videos" / MEDIA_NAME, "wb") as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(1024 * 1024))
+
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Event()
+    server = ctx.Process(target=serve, args=(str(tmp), args.port, args.rate_kbps, ready), daemon=True)
+    server.start()
+    ready.wait(60)
+    time.sleep(1.0)
+    try:
+        asyncio.run(run(args, size))
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == "__main__":
+    main()
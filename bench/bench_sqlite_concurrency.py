@@ -0,0 +1,114 @@
+"""Concurrent read/write throughput against SQLite, with and without tuning.
+
+Readers run the watch page's queries, writers post comments (insert + counter
+bump), all on a thread pool sharing one app, for a fixed duration:
+
+    python bench/bench_sqlite_concurrency.py --readers 8 --writers 4 --seconds 5
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import joinedload  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.counters import bump  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.models import Comment, User, Video  # noqa: E402
+
+
+def seed(app, videos: int) -> None:
+    with app.app_context():
+        u = User(username="bench", password_hash="x")
+        db.session.add(u)
+        db.session.flush()
+        db.session.add_all(
+            Video(title=f"video {i}", filename=f"bench-{i}.mp4", ext="mp4", original_name="b.mp4", uploader_id=u.id)
+            for i in range(videos)
+        )
+        db.session.commit()
+
+
+def run_mode(tuned: bool, readers: int, writers: int, seconds: float, videos: int) -> dict:
+    tmp = tempfile.TemporaryDirectory()
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + str(Path(tmp.name) / "bench.db"),
+        "OLDTUBE_SQLITE_TUNING": tuned,
+        "OLDTUBE_JOB_WORKERS": 0,
+    })
+    seed(app, videos)
+    stats = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def reader(n: int):
+        with app.app_context():
+            i = n
+            while time.perf_counter() < stop:
+                try:
+                    vid = i % videos + 1
+                    db.session.get(Video, vid)
+                    (Comment.query.options(joinedload(Comment.user))
+                     .filter_by(video_id=vid).order_by(Comment.id.desc()).limit(200).all())
+                    key = "reads"
+                except OperationalError:
+                    key = "errors"
+                db.session.rollback()
+                with lock:
+                    stats[key] += 1
+                i += 1
+
+    def writer(n: int):
+        with app.app_context():
+            i = n
+            while time.perf_counter() < stop:
+                vid = i % videos + 1
+                try:
+                    db.session.add(Comment(video_id=vid, user_id=1, body="bench"))
+                    bump(Video, vid, comment_count=1)
+                    db.session.commit()
+                    key = "writes"
+                except OperationalError:
+                    db.session.rollback()
+                    key = "errors"
+                with lock:
+                    stats[key] += 1
+                i += 1
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    with app.app_context():
+        db.engine.dispose()
+    tmp.cleanup()
+    return stats
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--writers", type=int, default=4)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--videos", type=int, default=200)
+    args = ap.parse_args()
+
+    for tuned in (False, True):
+        s = run_mode(tuned, args.readers, args.writers, args.seconds, args.videos)
+        label = "tuned (WAL)" if tuned else "defaults"
+        print(f"{label:12s} reads/s {s['reads'] / args.seconds:9.1f}   writes/s {s['writes'] / args.seconds:8.1f}"
+              f"   locked errors {s['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Process start-up cost: interpreter + `import app` + `create_app()`.
+
+Each sample is a fresh interpreter, like a pre-forked worker coming up during
+a rolling restart. "migrating" resets the stored schema version before every
+start, which is what every boot used to do (create_all, column checks, FTS
+DDL); "current" is the normal path once `flask init-db` has run. "first page"
+is the first request a worker serves, which compiles the templates it uses;
+"no bytecode cache" turns off OLDTUBE_JINJA_CACHE_DIR to show that cost.
+
+    python bench/bench_startup.py --runs 20
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = """
+import time, json
+t0 = time.perf_counter()
+from app import create_app
+t1 = time.perf_counter()
+app = create_app()
+t2 = time.perf_counter()
+app.test_client().get("/")
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1, "first page": t3 - t2}))
+"""
+
+
+def sample(env: dict) -> dict:
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD], env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+    r = json.loads(out.stdout.strip().splitlines()[-1])
+    r["process"] = time.perf_counter() - started
+    return r
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=10)
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp())
+    db_path = tmp / "startup.db"
+    env = {**os.environ, "OLDTUBE_DB": str(db_path), "PYTHONPATH": str(ROOT), "OLDTUBE_CACHE": "none",
+           "OLDTUBE_JINJA_CACHE_DIR": str(tmp / "jinja-cache")}
+    sample(env)  # create + seed once, fill the bytecode cache
+
+    for label, reset, extra in (("migrating", True, {}), ("current", False, {}),
+                                ("no bytecode cache", False, {"OLDTUBE_JINJA_CACHE_DIR": ""})):
+        runs = []
+        for _ in range(args.runs):
+            if reset:
+                with sqlite3.connect(db_path) as conn:
+                    conn.execute("PRAGMA user_version = 0")
+            runs.append(sample({**env, **extra}))
+        print(f"{label:18s} " + "  ".join(f"{k} {1000 * statistics.median(r[k] for r in runs):7.1f} ms"
+                                          for k in ("import", "create_app", "first page", "process")))
+
+
+if __name__ == "__main__":
+    main()
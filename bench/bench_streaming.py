@@ -0,0 +1,110 @@
+"""Throughput of the /media/video range paths over a real socket.
+
+Compares the old 256 KB read() generator with the mmap fallback and with
+os.sendfile (what `wsgi.file_wrapper` becomes under gunicorn/uWSGI).
+
+    python bench/bench_streaming.py --size-mb 256 --repeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.streaming import MmapRange  # noqa: E402
+
+
+def legacy_gen(path: Path, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        chunk = 1024 * 256
+        while remaining > 0:
+            data = f.read(min(chunk, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def send_iter(sock: socket.socket, it) -> None:
+    try:
+        for data in it:
+            sock.sendall(data)
+    finally:
+        if hasattr(it, "close"):
+            it.close()
+
+
+def send_sendfile(sock: socket.socket, path: Path, start: int, length: int) -> None:
+    with open(path, "rb") as f:
+        offset, remaining = start, length
+        while remaining > 0:
+            n = os.sendfile(sock.fileno(), f.fileno(), offset, remaining)
+            if n == 0:
+                break
+            offset += n
+            remaining -= n
+
+
+def drain(sock: socket.socket, total: int) -> None:
+    got = 0
+    buf = bytearray(1024 * 1024)
+    while got < total:
+        n = sock.recv_into(buf)
+        if not n:
+            break
+        got += n
+
+
+def run_one(name: str, fn, total: int) -> float:
+    a, b = socket.socketpair()
+    t = threading.Thread(target=drain, args=(b, total))
+    t.start()
+    t0 = time.perf_counter()
+    fn(a)
+    t.join()
+    dt = time.perf_counter() - t0
+    a.close()
+    b.close()
+    return dt
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size-mb", type=int, default=256)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(args.size_mb):
+            f.write(block)
+        path = Path(f.name)
+
+    start, length = 0, size
+    cases = {
+        "legacy read() generator": lambda s: send_iter(s, legacy_gen(path, start, length)),
+        "mmap fallback": lambda s: send_iter(s, MmapRange(path, [(b"", start, start + length - 1)])),
+    }
+    if hasattr(os, "sendfile"):
+        cases["os.sendfile"] = lambda s: send_sendfile(s, path, start, length)
+
+    try:
+        for name, fn in cases.items():
+            best = min(run_one(name, fn, length) for _ in range(args.repeat))
+            print(f"{name:26s} {length / best / 1e6:9.1f} MB/s  (best of {args.repeat}, {best * 1000:.0f} ms)")
+    finally:
+        path.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
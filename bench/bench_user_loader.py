@@ -0,0 +1,84 @@
+"""SQL round-trips and latency per request with and without the user cache.
+
+A logged-in client requests a mix of pages and media; the page cache is off so
+every page is rendered. Media views are marked `skip_user_load` either way.
+
+    python bench/bench_user_loader.py --requests 500
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app import login  # noqa: E402,F401  (registers the user loader)
+from app.extensions import db, user_cache  # noqa: E402
+from app.instrumentation import count_queries  # noqa: E402
+from app.models import User, Video  # noqa: E402
+
+PATHS = ["/videos", "/watch/1", "/media/video/bench.mp4", "/media/thumb/bench.jpg", "/u/bench"]
+
+
+def run(cache_size: int, requests: int) -> dict:
+    tmp = Path(tempfile.mkdtemp())
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + str(tmp / "bench.db"),
+        "UPLOADS_DIR": tmp, "VIDEOS_DIR": tmp / "videos", "THUMBS_DIR": tmp / "thumbs",
+        "OLDTUBE_CACHE": "none",
+        "OLDTUBE_JOB_WORKERS": 0,
+        "OLDTUBE_USER_CACHE_SIZE": cache_size,
+    })
+    with app.app_context():
+        u = User(username="bench", password_hash=generate_password_hash("bench"))
+        db.session.add(u)
+        db.session.flush()
+        db.session.add(Video(title="bench", filename="bench.mp4", ext="mp4", original_name="bench.mp4",
+                             uploader_id=u.id))
+        db.session.commit()
+    (tmp / "videos" / "bench.mp4").write_bytes(os.urandom(512 * 1024))
+    (tmp / "thumbs" / "bench.jpg").write_bytes(os.urandom(4096))
+
+    client = app.test_client()
+    client.post("/auth/login", data={"username": "bench", "password": "bench"})
+    out = {}
+    for path in PATHS:
+        headers = {"Range": "bytes=0-65535"} if path.startswith("/media/video") else {}
+        total_q = 0
+        started = time.perf_counter()
+        for _ in range(requests):
+            with count_queries() as qc:
+                rv = client.get(path, headers=headers)
+                rv.get_data()
+                rv.close()
+            total_q += qc.count
+        elapsed = time.perf_counter() - started
+        out[path] = (total_q / requests, 1000 * elapsed / requests, rv.status_code)
+    out["_stats"] = user_cache.stats()
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=300)
+    args = ap.parse_args()
+
+    off = run(0, args.requests)
+    on = run(1024, args.requests)
+    print(f"{'path':28s} {'queries/req':>22s} {'ms/req':>18s}")
+    print(f"{'':28s} {'no cache':>10s} {'cache':>11s} {'no cache':>8s} {'cache':>9s}")
+    for path in PATHS:
+        (q0, ms0, _), (q1, ms1, status) = off[path], on[path]
+        print(f"{path:28s} {q0:10.2f} {q1:11.2f} {ms0:8.2f} {ms1:9.2f}   ({status})")
+    print("user cache:", on["_stats"])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,16 @@
+import os
+import threading
+
 from app import create_app
 from app import login  # noqa
 
 app = create_app()
 
 if __name__ == '__main__':
+    # with the debug reloader, only the serving child process owns the job workers
+    if app.config["OLDTUBE_JOB_WORKERS"] > 0 and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        from app.jobs import WorkerPool
+        pool = WorkerPool(app).start()
+        # restarts crashed workers and reclaims their jobs while the dev server runs
+        threading.Thread(target=pool.supervise, name="oldtube-supervisor", daemon=True).start()
     app.run(debug=True)
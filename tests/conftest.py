@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from app import login  # noqa: F401  (registers the user loader)
+from app.extensions import db
+
+# a cheap hash for the seeded accounts; the real method is for real passwords
+TEST_PASSWORD_METHOD = "pbkdf2:sha256:1000"
+
+
+def app_config(tmp: Path, **overrides) -> dict:
+    config = {
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + str(tmp / "test.db"),
+        "UPLOADS_DIR": tmp / "uploads",
+        "VIDEOS_DIR": tmp / "uploads" / "videos",
+        "THUMBS_DIR": tmp / "uploads" / "thumbs",
+        "OLDTUBE_STATIC_BUILD_DIR": tmp / "static",
+        "OLDTUBE_JINJA_CACHE_DIR": "",
+        "OLDTUBE_EVENTS_DIR": tmp / "events",
+        "OLDTUBE_CACHE": "none",
+        "OLDTUBE_USER_CACHE_SIZE": 0,
+        "OLDTUBE_JOB_WORKERS": 0,
+        "OLDTUBE_CONVERT": False,
+        "OLDTUBE_THUMBNAIL": False,
+        "OLDTUBE_PASSWORD_METHOD": TEST_PASSWORD_METHOD,
+        "OLDTUBE_AUTH_IP_PER_MINUTE": 6000,
+        "OLDTUBE_AUTH_IP_BURST": 1000,
+        "OLDTUBE_AUTH_USER_PER_MINUTE": 6000,
+        "OLDTUBE_AUTH_USER_BURST": 1000,
+        "OLDTUBE_AUTH_ACCOUNT_PER_MINUTE": 6000,
+        "OLDTUBE_AUTH_ACCOUNT_BURST": 1000,
+    }
+    config.update(overrides)
+    return config
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """create_app() on a throwaway database and upload tree under tmp_path."""
+    def make(**overrides):
+        return create_app(app_config(tmp_path, **overrides))
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+def login_as(client, username: str, password: str):
+    return client.post("/auth/login", data={"username": username, "password": password})
+
+
+# --- a small synthetic site, shared by the query-count and query-plan tests ---
+
+SEED_USER, SEED_PASS = "plans0", "plans"
+N_USERS, N_VIDEOS = 20, 400
+
+
+def seed_site() -> None:
+    from app.counters import reconcile_counters
+    from app.models import Comment, Favorite, Like, Message, Rating, User, Video
+
+    db.session.execute(db.insert(User), [
+        {"username": f"plans{i}",
+         "password_hash": generate_password_hash(SEED_PASS, TEST_PASSWORD_METHOD) if i == 0 else "x"}
+        for i in range(N_USERS)])
+    # ids start after the seeded admin account
+    u0 = db.session.query(User.id).filter_by(username=SEED_USER).scalar()
+    db.session.execute(db.insert(Video), [
+        {"title": f"synthetic video {i}", "filename": f"plans-{i}.mp4", "ext": "mp4",
+         "original_name": "plans.mp4", "uploader_id": u0 + i % N_USERS}
+        for i in range(N_VIDEOS)])
+    db.session.execute(db.insert(Comment), [
+        {"video_id": 1 + i % N_VIDEOS, "user_id": u0 + i % N_USERS, "body": f"synthetic comment {i}"}
+        for i in range(N_VIDEOS * 5)])
+    pairs = [{"video_id": 1 + v, "user_id": u0 + u} for v in range(N_VIDEOS) for u in range(0, N_USERS, 4)]
+    db.session.execute(db.insert(Favorite), pairs)
+    db.session.execute(db.insert(Like), pairs)
+    db.session.execute(db.insert(Rating), [dict(p, stars=1 + p["video_id"] % 5) for p in pairs])
+    db.session.execute(db.insert(Message), [
+        {"sender_id": u0 + (i * 7) % N_USERS, "recipient_id": u0 + i % N_USERS,
+         "subject": f"hello {i}", "body": "synthetic message"}
+        for i in range(N_VIDEOS * 2)])
+    db.session.commit()
+    reconcile_counters()
+    db.session.execute(db.text("ANALYZE"))
+    db.session.commit()
+
+
+@pytest.fixture(scope="module")
+def seeded_app(tmp_path_factory):
+    """An app over the synthetic site, with rankings built and one media file."""
+    from app.rankings import refresh_rankings
+
+    tmp = tmp_path_factory.mktemp("site")
+    app = create_app(app_config(tmp))
+    with app.app_context():
+        seed_site()
+        refresh_rankings()
+    (Path(app.config["VIDEOS_DIR"]) / "plans-0.mp4").write_bytes(b"\0" * 64 * 1024)
+    return app
+
+
+@pytest.fixture
+def seeded_client(seeded_app):
+    client = seeded_app.test_client()
+    login_as(client, SEED_USER, SEED_PASS)
+    return client
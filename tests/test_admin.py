@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+import pytest
+
+
+@pytest.mark.parametrize("supplied, status", [
+    ("s3cret", 200),
+    ("wrong", 403),
+    ("s3crét", 403),  # non-ASCII used to blow up compare_digest with a 500
+])
+def test_metrics_token(make_app, supplied, status):
+    app = make_app(OLDTUBE_METRICS_TOKEN="s3cret")
+    resp = app.test_client().get("/admin/metrics", headers={"Authorization": f"Bearer {supplied}"})
+    assert resp.status_code == status
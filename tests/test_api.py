@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+import pytest
+
+
+@pytest.mark.parametrize("method, url", [
+    ("put", "/api/videos/1/rating"),
+    ("post", "/api/videos/1/comments"),
+    ("post", "/api/interactions"),
+])
+@pytest.mark.parametrize("body", [[1, 2], "like", 7])
+def test_non_object_bodies_are_rejected(seeded_client, method, url, body):
+    resp = getattr(seeded_client, method)(url, json=body)
+    assert resp.status_code == 400
+    assert resp.get_json() == {"error": "request body must be a JSON object"}
+
+
+def test_batch_points_at_the_bad_action(seeded_client):
+    resp = seeded_client.post("/api/interactions", json={"actions": [{"action": "like", "video_id": 1}, "like"]})
+    assert resp.status_code == 400
+    assert resp.get_json() == {"error": "each action must be an object", "index": 1}
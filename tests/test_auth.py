@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from werkzeug.security import generate_password_hash
+
+from app.extensions import db
+from app.models import User
+
+from .conftest import TEST_PASSWORD_METHOD
+
+VICTIM, PASSWORD = "victim", "correct horse"
+
+
+def _app(make_app, **overrides):
+    app = make_app(OLDTUBE_AUTH_USER_PER_MINUTE=1, OLDTUBE_AUTH_USER_BURST=3, **overrides)
+    with app.app_context():
+        if User.query.filter_by(username=VICTIM).first() is None:
+            db.session.add(User(username=VICTIM,
+                                password_hash=generate_password_hash(PASSWORD, TEST_PASSWORD_METHOD)))
+        db.session.commit()
+    return app
+
+
+def _login(client, password, **kwargs):
+    return client.post("/auth/login", data={"username": VICTIM, "password": password}, **kwargs)
+
+
+def test_guessing_from_one_ip_does_not_lock_out_another(make_app):
+    app = _app(make_app)
+    attacker = app.test_client()
+    codes = [_login(attacker, "guess", environ_base={"REMOTE_ADDR": "198.51.100.7"}).status_code
+             for _ in range(5)]
+    assert codes[-1] == 429
+
+    owner = app.test_client()
+    r = _login(owner, PASSWORD, environ_base={"REMOTE_ADDR": "203.0.113.9"})
+    assert r.status_code == 302
+    with owner.session_transaction() as s:
+        assert s.get("_user_id")
+
+
+def test_forwarded_for_is_only_trusted_with_proxy_fix(make_app):
+    proxy = {"REMOTE_ADDR": "10.0.0.1"}
+
+    def last_code(app):
+        client = app.test_client()
+        for i in range(5):
+            r = _login(client, "guess", environ_base=proxy, headers={"X-Forwarded-For": f"192.0.2.{i}"})
+        return r.status_code
+
+    # without it every client behind the proxy shares the proxy's bucket...
+    assert last_code(_app(make_app)) == 429
+    # ...with it each forwarded client gets its own
+    assert last_code(_app(make_app, OLDTUBE_PROXY_FIX=1)) == 302
+
+
+def test_guesses_spread_over_many_ips_hit_the_account_bucket(make_app):
+    app = _app(make_app, OLDTUBE_AUTH_ACCOUNT_PER_MINUTE=1, OLDTUBE_AUTH_ACCOUNT_BURST=6)
+    client = app.test_client()
+    codes = [_login(client, "guess", environ_base={"REMOTE_ADDR": f"198.51.100.{i}"}).status_code
+             for i in range(8)]
+    assert codes[:6] == [302] * 6
+    assert codes[6:] == [429, 429]
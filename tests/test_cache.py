@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from app import cache
+from app.cache import MemoryBackend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def test_memory_generations_are_forgotten_after_the_longest_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    backend = MemoryBackend(1024 * 1024)
+    backend.set("page|video:1=0", b"old", ttl=30)
+
+    for i in range(1000):
+        backend.set_gen(f"video:{i}", "7")
+    assert backend.get_gen("video:1") == "7"
+
+    clock.now += 31
+    backend.set_gen("video:new", "8")
+    # only what was invalidated within the last TTL is remembered...
+    assert len(backend._gens) == 1
+    assert backend.get_gen("video:1") == "0"
+    # ...and nothing stored under the original generation outlived it
+    assert backend.get("page|video:1=0") is None
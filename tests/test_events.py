@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+from werkzeug.security import generate_password_hash
+
+from app.extensions import db, events
+from app.media_asgi import MediaApp
+from app.models import User
+
+from .conftest import TEST_PASSWORD_METHOD, login_as
+
+
+def _add_user(app, username="viewer", password="pw"):
+    with app.app_context():
+        db.session.add(User(username=username, password_hash=generate_password_hash(password, TEST_PASSWORD_METHOD)))
+        db.session.commit()
+
+
+def test_anonymous_viewers_get_no_stream_by_default(make_app):
+    client = make_app().test_client()
+    assert client.get("/events?video=1").status_code == 204
+
+    client = make_app(OLDTUBE_EVENTS_ANONYMOUS=True).test_client()
+    r = client.get("/events?video=1")
+    assert r.status_code == 200 and r.mimetype == "text/event-stream"
+    r.close()
+
+
+def test_wsgi_streams_are_capped_below_the_thread_count(make_app):
+    app = make_app(OLDTUBE_EVENTS_WSGI_CLIENTS=1)
+    _add_user(app)
+    client = app.test_client()
+    login_as(client, "viewer", "pw")
+
+    first = client.get("/events")
+    assert first.status_code == 200
+    assert next(first.response).startswith(b"retry: 5000\n\nevent: unread\n")
+    assert client.get("/events").status_code == 503
+    first.close()
+    assert events.clients == 0
+    second = client.get("/events")
+    assert second.status_code == 200
+    second.close()
+
+
+def test_asgi_serves_events_on_the_event_loop(make_app):
+    # no WSGI streams allowed at all: the ASGI path must not count as one
+    app = make_app(OLDTUBE_EVENTS_ANONYMOUS=True, OLDTUBE_EVENTS_WSGI_CLIENTS=0)
+    media = MediaApp(app)
+    scope = {"type": "http", "method": "GET", "path": "/events", "query_string": b"video=7", "headers": []}
+
+    async def run():
+        sent, disconnect = [], asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if len(sent) == 2:
+                # from another thread, like a request handler would
+                threading.Thread(target=events.publish, args=("video:7", "comment", {"id": 1})).start()
+            elif len(sent) == 3:
+                disconnect.set()
+
+        await asyncio.wait_for(media(scope, receive, send), timeout=10)
+        return sent
+
+    sent = asyncio.run(run())
+    assert sent[0]["status"] == 200
+    assert (b"content-type", b"text/event-stream; charset=utf-8") in sent[0]["headers"]
+    assert sent[1]["body"] == b"retry: 5000\n\n"
+    assert sent[2]["body"] == b'event: comment\ndata: {"id":1}\n\n'
+    assert events.clients == 0
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from app import hls
+from app.extensions import db
+from app.jobs import enqueue
+from app.models import Job, User, Video
+
+LADDER = "240:400k,360:800k,480:1200k,720:2500k"
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """Renditions are empty files; returns the heights ffmpeg was asked for."""
+    heights = []
+
+    def run_ffmpeg(args):
+        heights.append(int(args[args.index("-vf") + 1].split("min(")[1].split(",")[0]))
+        out = Path(args[-1])
+        out.write_text("#EXTM3U\n")
+        (out.parent / "seg_0000.ts").write_bytes(b"")
+        return True, ""
+
+    monkeypatch.setattr(hls, "ffmpeg_available", lambda: True)
+    monkeypatch.setattr(hls, "run_ffmpeg", run_ffmpeg)
+    monkeypatch.setattr(hls, "probe_media", lambda path: None)
+    return heights
+
+
+def _variants(out_dir):
+    lines = (out_dir / "master.m3u8").read_text().splitlines()
+    return [line.split("RESOLUTION=")[1].split(",")[0] for line in lines if "RESOLUTION=" in line]
+
+
+@pytest.mark.parametrize("size, rungs, resolutions", [
+    # 4:3 480p: the 720p rung is dropped, widths follow the source's shape
+    ((640, 480), [240, 360, 480], ["320x240", "480x360", "640x480"]),
+    # below the lowest rung: one rendition at the source's own size
+    ((426, 200), [200], ["426x200"]),
+])
+def test_ladder_follows_the_source(app, tmp_path, fake_ffmpeg, size, rungs, resolutions):
+    app.config["OLDTUBE_HLS_LADDER"] = LADDER
+    with app.app_context():
+        ok, err = hls.package_hls(tmp_path / "in.mp4", tmp_path / "out", size)
+    assert ok, err
+    assert fake_ffmpeg == rungs
+    assert _variants(tmp_path / "out") == resolutions
+
+
+def test_package_hls_without_ffmpeg_is_not_retried(app):
+    with app.app_context():
+        user = User(username="hls", password_hash="x")
+        db.session.add(user)
+        db.session.commit()
+        v = Video(title="t", filename="t.mp4", ext="mp4", original_name="t.mp4", uploader_id=user.id)
+        db.session.add(v)
+        db.session.commit()
+        job = enqueue("package_hls", video_id=v.id)
+        job = db.session.get(Job, job.id)
+        assert (job.status, job.attempts) == ("done", 1)
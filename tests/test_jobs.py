@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import time
+
+from app.extensions import db
+from app.jobs import JobError, WorkerPool, enqueue, job_handler
+from app.models import Job
+
+attempts = []
+
+
+@job_handler("test_flaky")
+def _flaky(job: Job, payload: dict) -> None:
+    attempts.append(job.id)
+    raise JobError("not yet")
+
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def test_inline_failure_waits_for_its_backoff(app):
+    attempts.clear()
+    with app.app_context():
+        job = enqueue("test_flaky")
+        db.session.refresh(job)
+        assert attempts == [job.id]
+        assert (job.status, job.attempts) == ("queued", 1)
+        assert job.run_after > time.time()
+
+        # once due, the next inline enqueue gives it its second attempt
+        job.run_after = time.time()
+        db.session.commit()
+        enqueue("test_flaky")
+        assert attempts.count(job.id) == 2
+
+
+def test_starting_a_pool_leaves_live_workers_jobs_alone(app):
+    with app.app_context():
+        now = time.time()
+        live = Job(kind="test_flaky", status="running", locked_by=os.getpid(), locked_at=now, run_after=now)
+        dead = Job(kind="test_flaky", status="running", locked_by=_dead_pid(), locked_at=now, run_after=now)
+        db.session.add_all([live, dead])
+        db.session.commit()
+        live_id, dead_id = live.id, dead.id
+
+    pool = WorkerPool(app, concurrency=1)
+    pool._spawn = lambda: None  # no worker processes, just the startup recovery
+    pool.start()
+    with app.app_context():
+        assert db.session.get(Job, live_id).status == "running"
+        assert db.session.get(Job, dead_id).status == "queued"
@@ -0,0 +1,26 @@
+"""Upper bounds on the SQL statements behind the busiest pages.
+
+The synthetic site has full pages of videos, comments and messages, so a
+relationship loaded per row (an N+1) blows well past these budgets.
+"""
+from __future__ import annotations
+
+import pytest
+
+from app.instrumentation import count_queries
+
+BUDGETS = {
+    "/": 4,
+    "/videos": 2,
+    "/videos?before=200": 2,
+    "/watch/1": 6,
+    "/messages": 2,
+}
+
+
+@pytest.mark.parametrize("route,budget", BUDGETS.items())
+def test_query_budget(seeded_client, route, budget):
+    with count_queries() as qc:
+        rv = seeded_client.get(route)
+    assert rv.status_code == 200
+    assert qc.count <= budget, "\n".join(qc.statements)
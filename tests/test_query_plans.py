@@ -0,0 +1,91 @@
+"""EXPLAIN QUERY PLAN checks for the SQL behind the hot routes.
+
+Each route is requested as a logged-in user on the synthetic site (page
+cache off), and SQLite's plan for every SELECT it ran must neither scan a
+whole table nor sort through a temporary b-tree, i.e. no listing may lose
+the index it pages over.
+
+A bare `SCAN <table>` is accepted only for keyset pages over the primary key
+itself (`ORDER BY <table>.id ... LIMIT`, no other filter on that table),
+which stop after one page of rowids.
+"""
+from __future__ import annotations
+
+import re
+
+import pytest
+
+from app.extensions import db
+from app.instrumentation import count_queries
+
+from .conftest import SEED_USER
+
+ROUTES = [
+    "/",
+    "/videos",
+    "/videos?before=200",
+    "/watch/1",
+    f"/u/{SEED_USER}",
+    f"/u/{SEED_USER}?before=300",
+    "/favorites",
+    "/messages",
+    "/messages/sent",
+    "/messages/read/1",
+    "/search?q=synthetic",
+    "/trending",
+    "/trending?by=most_viewed",
+    "/media/video/plans-0.mp4",
+]
+
+# (route, SQL fragment) pairs whose temp b-tree is by design: FTS results are
+# ranked by bm25(), which no index can provide
+ALLOW_TEMP_BTREE = {("/search?q=synthetic", "bm25")}
+
+SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def problems(route: str, statement: str, plan: list[str]) -> list[str]:
+    found = []
+    flat = " ".join(statement.split())
+    for detail in plan:
+        m = SCAN.match(detail)
+        if m and m.group(1) in db.metadata.tables and not _pages_by_id(flat, m.group(1)):
+            found.append(detail)
+        if "USE TEMP B-TREE" in detail and not any(r == route and word in flat for r, word in ALLOW_TEMP_BTREE):
+            found.append(detail)
+    return found
+
+
+def _pages_by_id(sql: str, table: str) -> bool:
+    order = re.search(r"\bORDER BY (\S+)", sql)
+    if order is None or order.group(1) != f"{table}.id" or " LIMIT " not in sql:
+        return False
+    where = re.search(r"\bWHERE (.*?)(?: ORDER BY | GROUP BY |$)", sql)
+    filtered = re.findall(rf"\b{table}\.(\w+)", where.group(1)) if where else []
+    return all(col == "id" for col in filtered)
+
+
+@pytest.mark.parametrize("route", ROUTES)
+def test_route_uses_indexes(seeded_app, seeded_client, route):
+    with count_queries() as qc:
+        rv = seeded_client.get(route)
+        rv.get_data()
+        rv.close()
+    assert rv.status_code == 200
+    selects = [s for s in dict.fromkeys(qc.statements) if s.lstrip().upper().startswith("SELECT")]
+    assert selects
+
+    bad = []
+    with seeded_app.app_context():
+        raw = db.engine.raw_connection()
+        try:
+            for statement in selects:
+                # plans don't depend on the bound values; NULLs stand in for them
+                cur = raw.cursor()
+                cur.execute("EXPLAIN QUERY PLAN " + statement, [None] * statement.count("?"))
+                plan = [row[3] for row in cur.fetchall()]
+                bad += [f"{detail}  <-  {' '.join(statement.split())[:200]}"
+                        for detail in problems(route, statement, plan)]
+        finally:
+            raw.close()
+    assert not bad, "\n".join(bad)
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import sqlite3
+
+from app.extensions import db
+from app.models import Comment, User, Video
+from app.schema import schema_is_current
+
+# the tables as the first release created them: text timestamps, single-column
+# indexes and none of the denormalized counter columns
+BASELINE_SCHEMA = """
+CREATE TABLE user (
+    id INTEGER NOT NULL, username VARCHAR(32) NOT NULL, password_hash VARCHAR(255) NOT NULL,
+    is_admin BOOLEAN NOT NULL, created_at VARCHAR(25), PRIMARY KEY (id));
+CREATE UNIQUE INDEX ix_user_username ON user (username);
+CREATE TABLE video (
+    id INTEGER NOT NULL, title VARCHAR(120) NOT NULL, filename VARCHAR(200) NOT NULL,
+    ext VARCHAR(10) NOT NULL, original_name VARCHAR(200) NOT NULL, thumb_filename VARCHAR(200),
+    uploaded_at VARCHAR(25), uploader_id INTEGER NOT NULL,
+    PRIMARY KEY (id), UNIQUE (filename), FOREIGN KEY(uploader_id) REFERENCES user (id));
+CREATE TABLE message (
+    id INTEGER NOT NULL, sender_id INTEGER NOT NULL, recipient_id INTEGER NOT NULL,
+    subject VARCHAR(120) NOT NULL, body VARCHAR(1200) NOT NULL, created_at VARCHAR(25),
+    is_read BOOLEAN NOT NULL, PRIMARY KEY (id),
+    FOREIGN KEY(sender_id) REFERENCES user (id), FOREIGN KEY(recipient_id) REFERENCES user (id));
+CREATE INDEX ix_message_sender_id ON message (sender_id);
+CREATE INDEX ix_message_recipient_id ON message (recipient_id);
+CREATE TABLE comment (
+    id INTEGER NOT NULL, video_id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+    body VARCHAR(500) NOT NULL, created_at VARCHAR(25), PRIMARY KEY (id),
+    FOREIGN KEY(video_id) REFERENCES video (id), FOREIGN KEY(user_id) REFERENCES user (id));
+CREATE INDEX ix_comment_video_id ON comment (video_id);
+CREATE INDEX ix_comment_user_id ON comment (user_id);
+CREATE TABLE "like" (
+    id INTEGER NOT NULL, video_id INTEGER NOT NULL, user_id INTEGER NOT NULL, created_at VARCHAR(25),
+    PRIMARY KEY (id), CONSTRAINT uq_like_video_user UNIQUE (video_id, user_id),
+    FOREIGN KEY(video_id) REFERENCES video (id), FOREIGN KEY(user_id) REFERENCES user (id));
+CREATE INDEX ix_like_video_id ON "like" (video_id);
+CREATE INDEX ix_like_user_id ON "like" (user_id);
+CREATE TABLE favorite (
+    id INTEGER NOT NULL, video_id INTEGER NOT NULL, user_id INTEGER NOT NULL, created_at VARCHAR(25),
+    PRIMARY KEY (id), CONSTRAINT uq_fav_video_user UNIQUE (video_id, user_id),
+    FOREIGN KEY(video_id) REFERENCES video (id), FOREIGN KEY(user_id) REFERENCES user (id));
+CREATE INDEX ix_favorite_user_id ON favorite (user_id);
+CREATE INDEX ix_favorite_video_id ON favorite (video_id);
+CREATE TABLE rating (
+    id INTEGER NOT NULL, video_id INTEGER NOT NULL, user_id INTEGER NOT NULL, stars INTEGER NOT NULL,
+    created_at VARCHAR(25), PRIMARY KEY (id), CONSTRAINT uq_rating_video_user UNIQUE (video_id, user_id),
+    FOREIGN KEY(video_id) REFERENCES video (id), FOREIGN KEY(user_id) REFERENCES user (id));
+CREATE INDEX ix_rating_video_id ON rating (video_id);
+CREATE INDEX ix_rating_user_id ON rating (user_id);
+"""
+
+TS = "2024-01-02 03:04:05"
+
+
+def _baseline_db(path) -> None:
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany("INSERT INTO user (id, username, password_hash, is_admin, created_at) VALUES (?, ?, 'x', ?, ?)",
+                     [(1, "admin", 1, TS), (2, "alice", 0, TS), (3, "bob", 0, TS)])
+    conn.executemany("INSERT INTO video (id, title, filename, ext, original_name, uploaded_at, uploader_id) "
+                     "VALUES (?, ?, ?, 'mp4', 'a.mp4', ?, 2)",
+                     [(1, "first", "a.mp4", TS), (2, "second", "b.mp4", TS)])
+    conn.execute(f"INSERT INTO \"like\" (video_id, user_id, created_at) VALUES (1, 3, '{TS}')")
+    conn.executemany("INSERT INTO comment (video_id, user_id, body, created_at) VALUES (?, ?, ?, ?)",
+                     [(1, 3, "nice", TS), (1, 2, "thanks", TS), (2, 3, "ok", TS)])
+    conn.executemany("INSERT INTO rating (video_id, user_id, stars, created_at) VALUES (?, ?, ?, ?)",
+                     [(1, 3, 4, TS), (1, 1, 2, TS)])
+    conn.execute(f"INSERT INTO favorite (video_id, user_id, created_at) VALUES (2, 3, '{TS}')")
+    conn.commit()
+    conn.close()
+
+
+def test_baseline_database_upgrade_reconciles_counters(make_app, tmp_path):
+    _baseline_db(tmp_path / "test.db")
+    app = make_app()
+
+    with app.app_context():
+        assert schema_is_current()
+        first, second = db.session.get(Video, 1), db.session.get(Video, 2)
+        assert (first.like_count, first.comment_count, first.rating_count, first.rating_sum,
+                first.favorite_count) == (1, 2, 2, 6, 0)
+        assert (second.like_count, second.comment_count, second.rating_count, second.rating_sum,
+                second.favorite_count) == (0, 1, 0, 0, 1)
+        alice, bob = db.session.get(User, 2), db.session.get(User, 3)
+        assert (alice.video_count, alice.comment_count, alice.like_count) == (2, 1, 0)
+        assert (bob.video_count, bob.comment_count, bob.like_count) == (0, 2, 1)
+        # text timestamps became epoch seconds on the way
+        assert isinstance(first.uploaded_at, int) and first.uploaded_at > 0
+        assert all(isinstance(c.created_at, int) for c in Comment.query.all())
+
+
+def test_current_database_is_left_alone(make_app):
+    make_app()
+    app = make_app()
+    with app.app_context():
+        assert schema_is_current()
+        assert db.session.get(User, 1).username == "admin"
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import io
+from pathlib import Path
+
+import pytest
+from werkzeug.exceptions import NotFound
+
+from app.storage import LocalStorage, S3Storage
+
+
+class ClientError(Exception):
+    """What botocore raises, as far as S3Storage looks at it."""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class StubBody:
+    def __init__(self, data: bytes):
+        self._f = io.BytesIO(data)
+
+    def iter_chunks(self, size: int):
+        return iter(lambda: self._f.read(size), b"")
+
+
+class StubS3:
+    """An in-memory bucket with the slice of the boto3 client S3Storage uses."""
+
+    def __init__(self):
+        self.objects: dict[str, tuple[bytes, str]] = {}
+        self.uploads = 0
+
+    def _get(self, Bucket, Key):
+        assert Bucket == "media"
+        if Key not in self.objects:
+            raise ClientError("NoSuchKey")
+        return self.objects[Key]
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError("404")
+        return {"ContentLength": len(self.objects[Key][0])}
+
+    def upload_file(self, filename, bucket, key, ExtraArgs=None):
+        self.uploads += 1
+        self.objects[key] = (Path(filename).read_bytes(), (ExtraArgs or {}).get("ContentType", ""))
+
+    def download_file(self, bucket, key, filename):
+        Path(filename).write_bytes(self._get(bucket, key)[0])
+
+    def get_object(self, Bucket, Key):
+        data, mime = self._get(Bucket, Key)
+        return {"Body": StubBody(data), "ContentType": mime, "ContentLength": len(data), "ETag": '"e1"'}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.objects.pop(obj["Key"], None)
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        stub = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                keys = sorted(k for k in stub.objects if k.startswith(Prefix))
+                # two pages, like a real listing past 1000 keys
+                yield {"Contents": [{"Key": k} for k in keys[:1]]}
+                yield {"Contents": [{"Key": k} for k in keys[1:]]}
+        return Paginator()
+
+    def generate_presigned_url(self, op, Params, ExpiresIn):
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+def _staged(tmp_path: Path, name: str, data: bytes) -> Path:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+
+@pytest.fixture
+def s3():
+    return StubS3()
+
+
+def test_s3_put_dedupes_and_fetches(tmp_path, s3):
+    store = S3Storage("media", prefix="videos/", client=s3)
+    assert store.put(_staged(tmp_path, "a.mp4", b"video"), "ab/cd/abcd.mp4")
+    assert s3.objects["videos/ab/cd/abcd.mp4"] == (b"video", "video/mp4")
+
+    # the same key again: nothing uploaded, the staged copy is dropped
+    again = _staged(tmp_path, "b.mp4", b"video")
+    assert not store.put(again, "ab/cd/abcd.mp4")
+    assert s3.uploads == 1 and not again.exists()
+
+    assert store.exists("ab/cd/abcd.mp4") and not store.exists("ab/cd/nope.mp4")
+    with store.fetch("ab/cd/abcd.mp4") as path:
+        assert path.read_bytes() == b"video"
+    assert not path.exists()
+
+
+def test_s3_prune_keeps_listed_keys_only(tmp_path, s3):
+    store = S3Storage("media", prefix="thumbs/", client=s3)
+    for name in ("a.jpg", "b.jpg", "c.jpg"):
+        store.put(_staged(tmp_path, name, name.encode()), f"d/7/{name}")
+    store.put(_staged(tmp_path, "other.jpg", b"x"), "d/8/other.jpg")
+
+    assert store.prune("d/7/", {"d/7/b.jpg"}) == 2
+    assert sorted(s3.objects) == ["thumbs/d/7/b.jpg", "thumbs/d/8/other.jpg"]
+
+
+def test_s3_serve_redirects_to_presigned_url(s3):
+    store = S3Storage("media", prefix="videos/", presign_seconds=600, client=s3)
+    rv = store.serve("ab/cd/abcd.mp4")
+    assert rv.status_code == 302
+    assert rv.headers["Location"] == "https://s3.test/media/videos/ab/cd/abcd.mp4?expires=600"
+    assert rv.headers["Cache-Control"] == "private, max-age=300"
+
+    public = S3Storage("media", prefix="videos/", public_url="https://cdn.test/", client=s3)
+    assert public.serve("x.mp4").headers["Location"] == "https://cdn.test/videos/x.mp4"
+
+
+def test_s3_proxied_serve_and_missing_key(tmp_path, s3):
+    store = S3Storage("media", prefix="thumbs/", redirect=False, client=s3)
+    store.put(_staged(tmp_path, "t.jpg", b"jpeg bytes"), "t.jpg")
+
+    rv = store.serve("t.jpg")
+    assert rv.status_code == 200 and rv.mimetype == "image/jpeg"
+    assert rv.headers["Content-Length"] == "10" and rv.headers["ETag"] == '"e1"'
+    assert b"".join(rv.response) == b"jpeg bytes"
+
+    with pytest.raises(NotFound):
+        store.serve("gone.jpg")
+
+
+@pytest.mark.parametrize("key", ["../secret.txt", "a/../../secret.txt", "/etc/passwd"])
+def test_local_path_rejects_keys_outside_the_root(tmp_path, key):
+    root = tmp_path / "videos"
+    root.mkdir()
+    (tmp_path / "secret.txt").write_text("no")
+    store = LocalStorage(root)
+    with pytest.raises(NotFound):
+        store.path(key)
+    assert store.path("ab/cd/x.mp4") == root / "ab/cd/x.mp4"
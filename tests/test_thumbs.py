@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import itertools
+import json
+from pathlib import Path
+
+import pytest
+
+from app import thumbs
+from app.extensions import db, storage
+from app.models import User, Video
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """Every image ffmpeg is asked for gets fresh bytes, so each render hashes anew."""
+    counter = itertools.count()
+
+    def run_ffmpeg(args):
+        for arg in args[1:]:
+            if arg.endswith((".png", ".jpg", ".webp")) and args[args.index(arg) - 1] != "-i":
+                Path(arg).write_bytes(b"img%d" % next(counter))
+        return True, ""
+
+    monkeypatch.setattr(thumbs, "ffmpeg_available", lambda: True)
+    monkeypatch.setattr(thumbs, "run_ffmpeg", run_ffmpeg)
+
+
+def test_regenerating_keeps_files_a_duplicate_still_uses(app, tmp_path, fake_ffmpeg):
+    app.config["OLDTUBE_THUMB_SIZES"] = "120x90"
+    app.config["OLDTUBE_THUMB_FORMATS"] = "jpg"
+    with app.app_context():
+        user = User(username="thumbs", password_hash="x")
+        db.session.add(user)
+        db.session.commit()
+        original, dupe = (Video(title="t", filename="t.mp4", ext="mp4", original_name="t.mp4",
+                                uploader_id=user.id) for _ in range(2))
+        db.session.add_all([original, dupe])
+        db.session.commit()
+
+        first, err = thumbs.generate_derivatives(tmp_path / "t.mp4", original.id)
+        assert err is None
+        original.thumb_derivatives = dupe.thumb_derivatives = json.dumps(first)
+        db.session.commit()
+        second, _ = thumbs.generate_derivatives(tmp_path / "t.mp4", original.id)
+        original.thumb_derivatives = json.dumps(second)
+        db.session.commit()
+        third, _ = thumbs.generate_derivatives(tmp_path / "t.mp4", original.id)
+
+        def exists(manifest):
+            return all(storage.thumbs.path(key).is_file() for key in manifest.values())
+
+        assert exists(first) and exists(third)
+        # nothing references the second render any more
+        assert not any(storage.thumbs.path(key).exists() for key in second.values())
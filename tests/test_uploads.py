@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app.extensions import db
+from app.models import Job, UploadSession, User
+from app.uploads import create_video
+
+from .conftest import TEST_PASSWORD_METHOD, login_as
+
+
+def _upload(app, filename: str, thumb_name=None):
+    with app.app_context():
+        user = User(username="uploader", password_hash="x")
+        db.session.add(user)
+        db.session.commit()
+        (app.config["VIDEOS_DIR"] / filename).write_bytes(b"\0" * 1024)
+        v = create_video(user.id, "a video", filename, filename, thumb_name=thumb_name)
+        kinds = [j.kind for j in Job.query.filter_by(video_id=v.id).order_by(Job.id)]
+        return v.status, kinds
+
+
+@pytest.mark.parametrize("thumbnail, expected", [
+    (True, ["probe_media", "thumbnails"]),
+    (False, ["probe_media"]),
+])
+def test_ready_upload_with_custom_thumb_queues_derivatives(make_app, thumbnail, expected):
+    # an .mp4 with its own thumbnail skips process_video altogether
+    app = make_app(OLDTUBE_THUMBNAIL=thumbnail)
+    status, kinds = _upload(app, "clip.mp4", thumb_name="clip.png")
+    assert status == "ready"
+    assert kinds == expected
+
+
+def test_processed_upload_queues_derivatives_once(make_app):
+    app = make_app(OLDTUBE_THUMBNAIL=True)
+    status, kinds = _upload(app, "clip.mp4")
+    assert status == "ready"
+    assert kinds == ["process_video", "thumbnails"]
+
+
+def _uploader_client(app):
+    with app.app_context():
+        db.session.add(User(username="uploader", password_hash=generate_password_hash("pw", TEST_PASSWORD_METHOD)))
+        db.session.commit()
+    client = app.test_client()
+    login_as(client, "uploader", "pw")
+    return client
+
+
+@pytest.mark.parametrize("body", [[1, 2], "clip", 7])
+def test_init_rejects_non_object_json(make_app, body):
+    client = _uploader_client(make_app())
+    resp = client.post("/upload/sessions", json=body)
+    assert resp.status_code == 400
+    assert "JSON object" in resp.get_json()["error"]
+
+
+def test_concurrent_chunk_at_same_offset_conflicts(make_app):
+    fcntl = pytest.importorskip("fcntl")
+    app = make_app()
+    client = _uploader_client(app)
+    s = client.post("/upload/sessions", json={"title": "t", "filename": "a.mp4", "size": 8}).get_json()
+    with app.app_context():
+        part = app.config["VIDEOS_DIR"] / (db.session.get(UploadSession, s["id"]).temp_name + ".part")
+    # another request is still writing this session's chunk
+    with open(part, "wb") as held:
+        fcntl.flock(held, fcntl.LOCK_EX)
+        resp = client.put(f"{s['url']}?offset=0", data=b"abcd")
+        assert resp.status_code == 409
+    resp = client.put(f"{s['url']}?offset=0", data=b"abcd")
+    assert resp.get_json()["offset"] == 4
+    assert client.put(f"{s['url']}?offset=0", data=b"abcd").status_code == 409